@@ -0,0 +1,29 @@
+"""document storage key
+
+Revision ID: 0b5d7e3a9c62
+Revises: 7c4e1a9f3d26
+Create Date: 2026-10-18 20:47:09.518330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b5d7e3a9c62'
+down_revision = '7c4e1a9f3d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('storage_key', sa.String(), nullable=True))
+    op.create_index(op.f('ix_documents_storage_key'), 'documents', ['storage_key'], unique=False)
+    # Файлы хранятся по содержимому - одинаковые имена больше не конфликтуют
+    op.drop_constraint('documents_filename_key', 'documents', type_='unique')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint('documents_filename_key', 'documents', ['filename'])
+    op.drop_index(op.f('ix_documents_storage_key'), table_name='documents')
+    op.drop_column('documents', 'storage_key')
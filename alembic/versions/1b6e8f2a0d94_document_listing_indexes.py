@@ -0,0 +1,29 @@
+"""document listing indexes
+
+Revision ID: 1b6e8f2a0d94
+Revises: e7a3c5d19b02
+Create Date: 2026-10-18 15:10:26.381045
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '1b6e8f2a0d94'
+down_revision = 'e7a3c5d19b02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в большие таблицы, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_document_texts_doc_id'), 'document_texts', ['doc_id'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_documents_filename_pattern', 'documents', ['filename'], unique=False,
+                        postgresql_ops={'filename': 'varchar_pattern_ops'}, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_filename_pattern', table_name='documents')
+    op.drop_index(op.f('ix_document_texts_doc_id'), table_name='document_texts')
@@ -0,0 +1,28 @@
+"""document texts storage mode from settings
+
+Revision ID: 2c7f4b1e9a83
+Revises: 0b5d7e3a9c62
+Create Date: 2026-10-18 21:12:05.418337
+
+"""
+from alembic import op
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7f4b1e9a83'
+down_revision = '0b5d7e3a9c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # EXTERNAL (без сжатия, быстрый substr()) - только по text_storage_external,
+    # по умолчанию обычный EXTENDED со сжатием. Действует на новые строки.
+    mode = "EXTERNAL" if settings.text_storage_external else "EXTENDED"
+    op.execute(f"ALTER TABLE document_texts ALTER COLUMN text SET STORAGE {mode}")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE document_texts ALTER COLUMN text SET STORAGE EXTERNAL")
@@ -0,0 +1,43 @@
+"""ocr cache
+
+Revision ID: 3f1c2a9d7e41
+Revises: b648e61afc8b
+Create Date: 2026-10-18 10:12:31.402215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7e41'
+down_revision = 'b648e61afc8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('file_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_documents_file_hash'), 'documents', ['file_hash'], unique=False)
+    op.create_table('ocr_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('file_hash', sa.String(length=64), nullable=False),
+    sa.Column('lang', sa.String(), nullable=False),
+    sa.Column('config', sa.String(), nullable=False),
+    sa.Column('text', sa.String(), nullable=True),
+    sa.Column('hits', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_hash', 'lang', 'config', name='uq_ocr_cache_key')
+    )
+    op.create_index(op.f('ix_ocr_cache_id'), 'ocr_cache', ['id'], unique=False)
+    op.create_index(op.f('ix_ocr_cache_last_used_at'), 'ocr_cache', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ocr_cache_last_used_at'), table_name='ocr_cache')
+    op.drop_index(op.f('ix_ocr_cache_id'), table_name='ocr_cache')
+    op.drop_table('ocr_cache')
+    op.drop_index(op.f('ix_documents_file_hash'), table_name='documents')
+    op.drop_column('documents', 'file_hash')
@@ -0,0 +1,26 @@
+"""document texts storage external
+
+Revision ID: 4e2b9d61c7a5
+Revises: 9c0d4a7e5f38
+Create Date: 2026-10-18 16:38:49.150672
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4e2b9d61c7a5'
+down_revision = '9c0d4a7e5f38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Без сжатия TOAST substr() читает только нужные чанки - /get_text отдаёт большие тексты потоком,
+    # но тексты перестают сжиматься pglz и занимают в 2-3 раза больше места. Действует на новые строки.
+    # Режим дальше задаётся настройкой text_storage_external (ревизия 2c7f4b1e9a83).
+    op.execute("ALTER TABLE document_texts ALTER COLUMN text SET STORAGE EXTERNAL")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE document_texts ALTER COLUMN text SET STORAGE EXTENDED")
@@ -0,0 +1,38 @@
+"""analysis batches
+
+Revision ID: 5d9f0e3b8c21
+Revises: c41e7b9a2f63
+Create Date: 2026-10-18 13:02:44.917336
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9f0e3b8c21'
+down_revision = 'c41e7b9a2f63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('analysis_batches',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('analysis_batch_items',
+    sa.Column('batch_id', sa.String(length=32), nullable=False),
+    sa.Column('doc_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+    sa.ForeignKeyConstraint(['batch_id'], ['analysis_batches.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['doc_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('batch_id', 'doc_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('analysis_batch_items')
+    op.drop_table('analysis_batches')
@@ -0,0 +1,38 @@
+"""document words
+
+Revision ID: 6a1f3c8e2d57
+Revises: 4e2b9d61c7a5
+Create Date: 2026-10-18 17:12:05.402316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1f3c8e2d57'
+down_revision = '4e2b9d61c7a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('document_words',
+    sa.Column('doc_id', sa.Integer(), nullable=False),
+    sa.Column('page_no', sa.Integer(), nullable=False),
+    sa.Column('config', sa.String(), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('word_count', sa.Integer(), nullable=False),
+    sa.Column('words', sa.String(), nullable=False),
+    sa.Column('boxes', sa.LargeBinary(), nullable=False),
+    sa.Column('conf', sa.LargeBinary(), nullable=False),
+    sa.Column('lines', sa.LargeBinary(), nullable=False),
+    sa.Column('blocks', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['doc_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('doc_id', 'page_no')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('document_words')
@@ -0,0 +1,28 @@
+"""document cost
+
+Revision ID: 6f0a3d8b2c19
+Revises: 2c7f4b1e9a83
+Create Date: 2026-10-18 21:34:51.207164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f0a3d8b2c19'
+down_revision = '2c7f4b1e9a83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Заполняются при загрузке; старые документы - при переносе файлов (python -m app.storage migrate)
+    # или при первом одиночном анализе
+    op.add_column('documents', sa.Column('file_size', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('pixels', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('documents', 'pixels')
+    op.drop_column('documents', 'file_size')
@@ -0,0 +1,26 @@
+"""document task progress
+
+Revision ID: 7c4e1a9f3d26
+Revises: f3b7d9c2e815
+Create Date: 2026-10-18 20:12:44.301958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e1a9f3d26'
+down_revision = 'f3b7d9c2e815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('document_tasks', sa.Column('pages_total', sa.Integer(), nullable=True))
+    op.add_column('document_tasks', sa.Column('pages_done', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('document_tasks', 'pages_done')
+    op.drop_column('document_tasks', 'pages_total')
@@ -0,0 +1,36 @@
+"""document pages
+
+Revision ID: 8a2d5e0c4b17
+Revises: 3f1c2a9d7e41
+Create Date: 2026-10-18 11:04:52.118903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a2d5e0c4b17'
+down_revision = '3f1c2a9d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('page_count', sa.Integer(), nullable=True))
+    op.create_table('document_pages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doc_id', sa.Integer(), nullable=False),
+    sa.Column('page_no', sa.Integer(), nullable=False),
+    sa.Column('text', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['doc_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('doc_id', 'page_no', name='uq_document_pages_doc_page')
+    )
+    op.create_index(op.f('ix_document_pages_id'), 'document_pages', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_document_pages_id'), table_name='document_pages')
+    op.drop_table('document_pages')
+    op.drop_column('documents', 'page_count')
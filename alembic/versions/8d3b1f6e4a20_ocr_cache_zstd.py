@@ -0,0 +1,31 @@
+"""ocr cache zstd
+
+Revision ID: 8d3b1f6e4a20
+Revises: 6f0a3d8b2c19
+Create Date: 2026-10-18 22:05:13.604281
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3b1f6e4a20'
+down_revision = '6f0a3d8b2c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ocr_cache', sa.Column('text_zstd', sa.LargeBinary(), nullable=True))
+    op.add_column('ocr_cache', sa.Column('text_dict_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('ocr_cache_text_dict_id_fkey', 'ocr_cache', 'text_dictionaries', ['text_dict_id'], ['id'])
+    # Уже сжато: TOAST не пытается сжать ещё раз
+    op.execute("ALTER TABLE ocr_cache ALTER COLUMN text_zstd SET STORAGE EXTERNAL")
+    # Старые записи остаются несжатыми и постепенно вытесняются LRU
+
+
+def downgrade() -> None:
+    op.drop_constraint('ocr_cache_text_dict_id_fkey', 'ocr_cache', type_='foreignkey')
+    op.drop_column('ocr_cache', 'text_dict_id')
+    op.drop_column('ocr_cache', 'text_zstd')
@@ -0,0 +1,45 @@
+"""document texts search vector
+
+Revision ID: 9c0d4a7e5f38
+Revises: 1b6e8f2a0d94
+Create Date: 2026-10-18 15:52:03.774120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '9c0d4a7e5f38'
+down_revision = '1b6e8f2a0d94'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    op.add_column('document_texts', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Заполняем существующие строки пачками, чтобы не держать одну огромную транзакцию
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        max_id = connection.execute(sa.text("SELECT coalesce(max(id), 0) FROM document_texts")).scalar()
+        for start in range(0, max_id + 1, BATCH_SIZE):
+            connection.execute(sa.text(
+                "UPDATE document_texts "
+                "SET search_vector = to_tsvector('russian', left(coalesce(text, ''), :max_chars)) "
+                "|| to_tsvector('english', left(coalesce(text, ''), :max_chars)) "
+                "WHERE id >= :start AND id < :end"
+            ), {"start": start, "end": start + BATCH_SIZE, "max_chars": settings.search_max_chars})
+
+        op.create_index('ix_document_texts_search_vector', 'document_texts', ['search_vector'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_document_texts_search_vector', table_name='document_texts')
+    op.drop_column('document_texts', 'search_vector')
@@ -0,0 +1,39 @@
+"""document texts zstd
+
+Revision ID: a58c2e7f9b14
+Revises: 6a1f3c8e2d57
+Create Date: 2026-10-18 18:02:41.733519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a58c2e7f9b14'
+down_revision = '6a1f3c8e2d57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('text_dictionaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column('document_texts', sa.Column('text_zstd', sa.LargeBinary(), nullable=True))
+    op.add_column('document_texts', sa.Column('text_dict_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('document_texts_text_dict_id_fkey', 'document_texts', 'text_dictionaries', ['text_dict_id'], ['id'])
+    # Уже сжато: TOAST не пытается сжать ещё раз, substr() читает только нужные чанки
+    op.execute("ALTER TABLE document_texts ALTER COLUMN text_zstd SET STORAGE EXTERNAL")
+    # Существующие тексты сжимаются отдельно и пакетами: python -m app.text_codec migrate
+
+
+def downgrade() -> None:
+    op.drop_constraint('document_texts_text_dict_id_fkey', 'document_texts', type_='foreignkey')
+    op.drop_column('document_texts', 'text_dict_id')
+    op.drop_column('document_texts', 'text_zstd')
+    op.drop_table('text_dictionaries')
@@ -0,0 +1,27 @@
+"""ocr stats
+
+Revision ID: c41e7b9a2f63
+Revises: 8a2d5e0c4b17
+Create Date: 2026-10-18 12:21:07.554310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7b9a2f63'
+down_revision = '8a2d5e0c4b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('document_texts', sa.Column('ocr_stats', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('document_pages', sa.Column('ocr_stats', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('document_pages', 'ocr_stats')
+    op.drop_column('document_texts', 'ocr_stats')
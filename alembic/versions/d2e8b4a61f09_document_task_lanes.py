@@ -0,0 +1,30 @@
+"""document task lanes
+
+Revision ID: d2e8b4a61f09
+Revises: a58c2e7f9b14
+Create Date: 2026-10-18 18:47:13.590224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2e8b4a61f09'
+down_revision = 'a58c2e7f9b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('document_tasks', sa.Column('lane', sa.String(length=16), nullable=True))
+    op.add_column('document_tasks', sa.Column('owner', sa.String(length=150), nullable=True))
+    op.add_column('document_tasks', sa.Column('priority', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_document_tasks_owner'), 'document_tasks', ['owner'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_document_tasks_owner'), table_name='document_tasks')
+    op.drop_column('document_tasks', 'priority')
+    op.drop_column('document_tasks', 'owner')
+    op.drop_column('document_tasks', 'lane')
@@ -0,0 +1,33 @@
+"""document tasks
+
+Revision ID: e7a3c5d19b02
+Revises: 5d9f0e3b8c21
+Create Date: 2026-10-18 13:47:15.206781
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c5d19b02'
+down_revision = '5d9f0e3b8c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('document_tasks',
+    sa.Column('doc_id', sa.Integer(), nullable=False),
+    sa.Column('state', sa.String(length=16), nullable=False),
+    sa.Column('queued_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['doc_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('doc_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('document_tasks')
@@ -0,0 +1,39 @@
+"""coalesce analysis
+
+Revision ID: f3b7d9c2e815
+Revises: d2e8b4a61f09
+Create Date: 2026-10-18 19:30:27.846117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b7d9c2e815'
+down_revision = 'd2e8b4a61f09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('document_tasks', sa.Column('config', sa.String(), nullable=True))
+    op.add_column('document_tasks', sa.Column('task_id', sa.String(length=32), nullable=True))
+
+    # Дубликаты от гонок прежних задач: оставляем последнюю запись документа
+    op.execute("""
+        DELETE FROM document_texts t
+        USING document_texts newer
+        WHERE newer.doc_id = t.doc_id AND newer.id > t.id
+    """)
+    op.add_column('document_texts', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.create_unique_constraint('document_texts_doc_id_key', 'document_texts', ['doc_id'])
+    op.drop_index(op.f('ix_document_texts_doc_id'), table_name='document_texts')
+
+
+def downgrade() -> None:
+    op.create_index(op.f('ix_document_texts_doc_id'), 'document_texts', ['doc_id'], unique=False)
+    op.drop_constraint('document_texts_doc_id_key', 'document_texts', type_='unique')
+    op.drop_column('document_texts', 'version')
+    op.drop_column('document_tasks', 'task_id')
+    op.drop_column('document_tasks', 'config')
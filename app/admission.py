@@ -0,0 +1,294 @@
+"""Допуск страниц к распознаванию по бюджету памяти воркера.
+
+Размер страницы читается из заголовка (PIL открывает файл лениво, для PDF -
+pdfinfo), по нему оценивается пиковая память декодирования, предобработки и
+tesseract. Бюджет общий для всех процессов одного воркера Celery: резервы
+лежат в разделяемой памяти, созданной до fork. Страница, которая не помещается
+в свободный остаток, ждёт и затем откладывается (повтор задачи); страница,
+которая не помещается в бюджет вообще, загружается с уменьшением. Уменьшение
+при декодировании умеют только JPEG (draft) и PDF, остальные форматы
+декодируются целиком - для них резервируется полный размер, а слишком
+большая страница отклоняется.
+
+Решения считаются в разделяемых счётчиках и сбрасываются снимком в
+worker_metrics_dir, откуда их читает API (GET /worker_admission).
+"""
+import json
+import math
+import multiprocessing
+import os
+import socket
+import time
+from typing import Iterable, Optional
+
+from PIL import Image
+from pdf2image import pdfinfo_from_path
+
+from app.config import settings
+
+MB = 1024 * 1024
+
+# Байт на пиксель (после downscale) у шагов предобработки: binarize держит
+# несколько массивов int64 размером с изображение, остальные - копии в L/RGB
+BINARIZE_BYTES_PER_PIXEL = 41
+DESKEW_BYTES_PER_PIXEL = 10
+# Процесс с загруженными моделями без изображения
+BASE_MB = 150
+
+COUNTERS = ("admitted", "waited", "deferred", "downscaled", "rejected")
+
+# Слоты резервов (pid, МБ) и счётчики - в разделяемой памяти: модуль импортируется
+# в главном процессе воркера до fork, дочерние процессы видят один и тот же бюджет
+SLOTS = 256
+_lock = multiprocessing.Lock()
+_slots = multiprocessing.Array("d", SLOTS * 2, lock=False)
+_counters = multiprocessing.Array("q", len(COUNTERS), lock=False)
+
+
+class Deferred(Exception):
+    """Страница сейчас не помещается в свободную память воркера - задачу нужно повторить позже"""
+
+
+class Rejected(Exception):
+    """Страница не помещается в бюджет даже с минимальным масштабом"""
+
+
+class Plan:
+    def __init__(self, width: int, height: int, estimated_mb: float, scale: float):
+        self.width = width
+        self.height = height
+        self.estimated_mb = estimated_mb
+        self.scale = scale
+
+    def as_stats(self) -> dict:
+        return {"width": self.width, "height": self.height,
+                "estimated_mb": round(self.estimated_mb, 1), "scale": round(self.scale, 3)}
+
+
+def _cgroup_limit_mb() -> Optional[float]:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) / MB
+    return None
+
+
+def budget_mb() -> float:
+    """Бюджет воркера: из настроек или 75% лимита контейнера (памяти машины)"""
+    if settings.ocr_memory_budget_mb:
+        return float(settings.ocr_memory_budget_mb)
+    limit = _cgroup_limit_mb()
+    if limit is None:
+        limit = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / MB
+    return limit * 0.75
+
+
+def open_image(file_path: str) -> Image.Image:
+    """Image.open для распознавания в воркере: без проверки PIL на decompression bomb.
+
+    Размер страницы здесь ограничивает plan() (уменьшение или Rejected). Лимит
+    снимается только на время открытия: в API (превью, оценка приоритета)
+    проверка PIL остаётся.
+    """
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(file_path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def page_size(file_path: str, page_no: int, is_pdf: bool):
+    """(ширина, высота, каналов, dpi, формат) страницы без декодирования"""
+    if is_pdf:
+        # "612 x 792 pts (letter)" - размер первой страницы в пунктах (1/72 дюйма)
+        info = pdfinfo_from_path(file_path)
+        width_pt, _, height_pt = info["Page size"].split()[:3]
+        scale = settings.pdf_dpi / 72
+        return round(float(width_pt) * scale), round(float(height_pt) * scale), 3, settings.pdf_dpi, "PDF"
+    with open_image(file_path) as image:
+        if page_no:
+            image.seek(page_no)
+        return (image.width, image.height, len(image.getbands()), image.info.get("dpi", (0, 0))[0],
+                image.format)
+
+
+def decoded_pixels(width: int, height: int, scale: float, fmt: str) -> int:
+    """Сколько пикселей декодируется при загрузке с масштабом scale (см. ocr.load_page).
+
+    PDF рендерится сразу в нужном размере, JPEG - через draft с уменьшением в
+    1/2, 1/4 или 1/8 (не меньше запрошенного), остальные форматы декодируются
+    целиком и уменьшаются уже после.
+    """
+    if scale >= 1:
+        return width * height
+    target_width, target_height = max(1, round(width * scale)), max(1, round(height * scale))
+    if fmt == "PDF":
+        return target_width * target_height
+    if fmt == "JPEG":
+        reduce = 1
+        for factor in (2, 4, 8):
+            if math.ceil(width / factor) >= target_width and math.ceil(height / factor) >= target_height:
+                reduce = factor
+        return math.ceil(width / reduce) * math.ceil(height / reduce)
+    return width * height
+
+
+def estimate_mb(width: int, height: int, bands: int, dpi: float, steps: Iterable[str],
+                decoded: Optional[int] = None) -> float:
+    """Оценка пиковой памяти распознавания страницы в МБ.
+
+    decoded - пикселей при декодировании, если их больше, чем width x height
+    (уменьшение после полного декодирования).
+    """
+    steps = tuple(steps)
+    decoded = max(decoded or 0, width * height) * bands
+    scale = 1.0
+    if "downscale" in steps:
+        if dpi and dpi > settings.ocr_target_dpi:
+            scale = settings.ocr_target_dpi / dpi
+        else:
+            scale = min(1.0, settings.ocr_max_side / max(width, height, 1))
+    pixels = width * height * scale * scale
+
+    preprocess = pixels * bands
+    if "binarize" in steps:
+        preprocess = max(preprocess, pixels * BINARIZE_BYTES_PER_PIXEL)
+    if "deskew" in steps:
+        preprocess = max(preprocess, pixels * DESKEW_BYTES_PER_PIXEL)
+    tesseract = pixels * settings.ocr_mem_tesseract_bytes_per_pixel
+    return BASE_MB + (decoded + max(preprocess, tesseract)) / MB
+
+
+def plan(file_path: str, page_no: int, is_pdf: bool, steps: Iterable[str]) -> Plan:
+    """Оценка страницы и масштаб загрузки, при котором она помещается в бюджет"""
+    steps = tuple(steps)
+    width, height, bands, dpi, fmt = page_size(file_path, page_no, is_pdf)
+    estimated = estimate_mb(width, height, bands, dpi, steps)
+    budget = budget_mb()
+    if estimated <= budget:
+        return Plan(width, height, estimated, 1.0)
+
+    # Уменьшаем шагами, пока оценка не войдёт в бюджет
+    scale, scaled = 1.0, estimated
+    while scaled > budget:
+        scale *= 0.9
+        if scale < settings.ocr_admission_min_scale:
+            _count("rejected")
+            raise Rejected(f"Страница {width}x{height} требует ~{estimated:.0f} МБ при бюджете {budget:.0f} МБ")
+        scaled = estimate_mb(round(width * scale), round(height * scale), bands, dpi * scale, steps,
+                             decoded_pixels(width, height, scale, fmt))
+    _count("downscaled")
+    return Plan(width, height, scaled, scale)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reserved_mb() -> float:
+    """Сумма резервов; резервы завершившихся процессов (например, убитых OOM) освобождаются"""
+    total = 0.0
+    for i in range(SLOTS):
+        pid = int(_slots[2 * i])
+        if not pid:
+            continue
+        if not _pid_alive(pid):
+            _slots[2 * i] = _slots[2 * i + 1] = 0
+            continue
+        total += _slots[2 * i + 1]
+    return total
+
+
+def _try_reserve(mb: float) -> bool:
+    with _lock:
+        if _reserved_mb() + mb > budget_mb():
+            return False
+        for i in range(SLOTS):
+            if not _slots[2 * i]:
+                _slots[2 * i] = os.getpid()
+                _slots[2 * i + 1] = mb
+                return True
+        return False
+
+
+def release() -> None:
+    """Освобождает резерв текущего процесса"""
+    pid = os.getpid()
+    with _lock:
+        for i in range(SLOTS):
+            if int(_slots[2 * i]) == pid:
+                _slots[2 * i] = _slots[2 * i + 1] = 0
+
+
+def acquire(page_plan: Plan) -> None:
+    """Резервирует память под страницу: ждёт до ocr_admission_wait секунд, иначе Deferred"""
+    deadline = time.monotonic() + settings.ocr_admission_wait
+    waited = False
+    while not _try_reserve(page_plan.estimated_mb):
+        if time.monotonic() >= deadline:
+            _count("deferred")
+            raise Deferred(f"Нет свободной памяти для страницы (~{page_plan.estimated_mb:.0f} МБ)")
+        waited = True
+        time.sleep(0.2)
+    if waited:
+        _count("waited")
+    _count("admitted")
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[COUNTERS.index(name)] += 1
+    _write_snapshot()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "host": socket.gethostname(),
+            "budget_mb": round(budget_mb(), 1),
+            "reserved_mb": round(_reserved_mb(), 1),
+            "counters": dict(zip(COUNTERS, _counters[:])),
+            "updated_at": time.time(),
+        }
+
+
+def _write_snapshot() -> None:
+    directory = settings.worker_metrics_dir
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"admission-{socket.gethostname()}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Не удалось записать метрики допуска: {e}")
+
+
+def read_snapshots() -> list:
+    """Снимки всех воркеров из worker_metrics_dir"""
+    directory = settings.worker_metrics_dir
+    if not directory or not os.path.isdir(directory):
+        return []
+    result = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("admission-") and name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    result.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return result
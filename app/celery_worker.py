@@ -1,69 +1,429 @@
-from celery import Celery
+from celery import Celery, group
+from kombu import Queue
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_init, worker_process_shutdown
+from app.config import settings
 from app.database import SessionLocal
-from app.models import Document, DocumentText
-import pytesseract
-from PIL import Image
+from app.models import Document, DocumentText, DocumentPage, DocumentWords, AnalysisBatchItem
+from sqlalchemy.dialects.postgresql import insert
+from app import admission, metrics, ocr, ocr_cache, preprocessing, previews, scheduling, search, storage, task_state, tesseract_pool, text_codec, tracing, word_store
 import os
+import time
 
-celery = Celery("worker", broker="pyamqp://guest@rabbitmq//")
+celery = Celery("worker", broker=settings.celery_broker_url)
 
-DOCUMENTS_DIR = "/app/documents"
+# Маршрутизация: полоса -> очередь RabbitMQ. Воркер слушает обе очереди
+# (celery -A app.celery_worker worker -Q ocr.interactive,ocr.bulk), отдельный
+# воркер только с ocr.interactive гарантирует запас для запросов пользователей.
+LANE_QUEUES = {
+    scheduling.INTERACTIVE: "ocr.interactive",
+    scheduling.BULK: "ocr.bulk",
+}
+celery.conf.task_queues = [
+    Queue(queue, routing_key=queue, queue_arguments={"x-max-priority": scheduling.MAX_PRIORITY})
+    for queue in LANE_QUEUES.values()
+]
+celery.conf.task_default_queue = LANE_QUEUES[scheduling.INTERACTIVE]
+celery.conf.task_queue_max_priority = scheduling.MAX_PRIORITY
+celery.conf.task_default_priority = scheduling.LANE_PRIORITIES[scheduling.INTERACTIVE][0]
+# Без заранее забранных задач приоритет определяет, что процесс возьмёт следующим
+celery.conf.worker_prefetch_multiplier = settings.celery_prefetch_multiplier
+celery.conf.worker_concurrency = settings.celery_concurrency
+if settings.celery_max_memory_per_child_mb:
+    celery.conf.worker_max_memory_per_child = settings.celery_max_memory_per_child_mb * 1024
+celery.conf.task_acks_late = settings.celery_acks_late
+celery.conf.task_reject_on_worker_lost = settings.celery_acks_late
 
 
-@celery.task
-def analyze_document_task(doc_id: int):
-    """Задача для анализа документа через OCR"""
+@worker_process_init.connect
+def init_ocr_engines(**kwargs):
+    """Загружаем языковые модели в каждом процессе воркера до первой задачи"""
+    try:
+        tesseract_pool.warm_up()
+        print(f"Движки tesseract готовы (pid {os.getpid()})")
+    except Exception as e:
+        print(f"Не удалось прогреть движки tesseract: {e}")
+
+
+@worker_process_shutdown.connect
+def close_ocr_engines(**kwargs):
+    tesseract_pool.shutdown()
+    # Последние значения метрик процесса перед его заменой
+    metrics.flush(force=True)
+
+
+@before_task_publish.connect
+def inject_trace(headers=None, **kwargs):
+    """Контекст трассы маршрута или задачи-родителя - в заголовки сообщения"""
+    if headers is not None:
+        tracing.inject(headers)
+
+
+@task_prerun.connect
+def start_task_span(task=None, args=None, **kwargs):
+    """Спан ожидания в очереди (от отправки до начала) и спан выполнения задачи"""
+    request = task.request
+    # Заголовки сообщения доступны как атрибуты request; в eager-режиме их нет - родитель текущий спан
+    parent = getattr(request, "traceparent", None)
+    sent_at = getattr(request, "trace_sent_at", None)
+    if parent and sent_at:
+        queue = (request.delivery_info or {}).get("routing_key")
+        wait = tracing.start(f"queue {queue}", parent, service="rabbitmq", start_time=sent_at)
+        wait.end(time.time())
+        parent = wait
+    span = tracing.start(f"task {task.name.rsplit('.', 1)[-1]}", parent, service="worker",
+                         doc_id=args[0] if args else None, retries=request.retries)
+    request.trace_span = span
+    request.trace_token = tracing.activate(span)
+
+
+@task_postrun.connect
+def end_task_span(task=None, retval=None, state=None, **kwargs):
+    span = getattr(task.request, "trace_span", None)
+    if span is None:
+        return
+    tracing.deactivate(task.request.trace_token)
+    span.set(state=state)
+    if isinstance(retval, dict) and "status" in retval:
+        span.set(status=retval["status"])
+    span.end()
+
+
+def route(lane: str, priority: int) -> dict:
+    """Параметры apply_async для задачи полосы"""
+    return {"queue": LANE_QUEUES[lane], "priority": priority}
+
+
+@celery.task(bind=True)
+def analyze_document_task(self, doc_id: int, steps=None, batch_id=None, lane=scheduling.INTERACTIVE, priority=None,
+                          task_id=None):
+    """Задача для анализа документа через OCR
+
+    steps - шаги предобработки изображения (None - из настроек)
+    batch_id - пакет, в котором запущен документ (прогресс засчитывается всем пакетам, ждущим документ)
+    lane, priority - полоса и приоритет; с ними же отправляются задачи страниц
+    task_id - запуск из document_tasks; если его заменил новый запуск, задача ничего не пишет
+    """
     db = SessionLocal()
     try:
-        print(f"Начинаю анализ документа {doc_id}")
+        if not task_state.is_current(db, doc_id, task_id):
+            print(f"Запуск {task_id} документа {doc_id} заменён новым, пропускаем")
+            return {"status": "superseded"}
+        queue_wait = task_state.mark_running(
+            db, doc_id, settings.ocr_owner_max_running, settings.ocr_running_stale_after
+        )
+        if queue_wait is None:
+            # У владельца уже заняты все слоты - уступаем воркер другим пользователям
+            metrics.FAILURES["owner_limit"].inc()
+            raise self.retry(countdown=settings.ocr_owner_defer_seconds, max_retries=None)
+        metrics.QUEUE_WAIT[lane].observe(queue_wait)
+        try:
+            result = _analyze_document(db, doc_id, steps, lane, priority, task_id)
+        except admission.Deferred as e:
+            print(f"Документ {doc_id} отложен: {e}")
+            metrics.FAILURES["admission_deferred"].inc()
+            if not task_state.mark_deferred(db, doc_id, task_id):
+                print(f"Запуск {task_id} документа {doc_id} заменён новым, пропускаем")
+                return {"status": "superseded"}
+            raise self.retry(countdown=settings.ocr_admission_defer_seconds, max_retries=None)
+        except Exception as e:
+            print(f"Общая ошибка при анализе документа {doc_id}: {e}")
+            metrics.FAILURES[metrics.failure_cause(e)].inc()
+            db.rollback()
+            result = {"status": "error", "message": str(e)}
+
+        # Многостраничный документ завершится, когда будут готовы все страницы
+        if result["status"] not in ("queued", "superseded"):
+            _finish(db, doc_id, result["status"] == "success", result.get("message"), task_id)
+        return result
+
+    finally:
+        db.close()
+        metrics.flush()
+
+
+def _save_text(db, doc_id: int, text: str, ocr_stats=None) -> None:
+    """Атомарная запись текста: вставка или замена существующей строки с увеличением версии.
+
+    До фиксации транзакции читатели видят прошлый текст, а не его отсутствие.
+    """
+    values = {
+        "doc_id": doc_id, "ocr_stats": ocr_stats, "search_vector": search.to_vector(text),
+        **text_codec.encode(text),
+    }
+    stmt = insert(DocumentText).values(**values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DocumentText.doc_id],
+        set_={
+            **{column: stmt.excluded[column] for column in values if column != "doc_id"},
+            "version": DocumentText.version + 1,
+        },
+    ))
+
+
+def _analyze_document(db, doc_id: int, steps, lane, priority, task_id):
+    """Распознавание документа, возвращает результат задачи"""
+    print(f"Начинаю анализ документа {doc_id}")
+    steps = preprocessing.parse_steps(steps)
+    config_key = ocr.config_key(steps)
+
+    # Получаем документ из БД
+    doc = db.query(Document).filter(Document.id == doc_id).first()
+    if not doc:
+        print(f"Документ {doc_id} не найден")
+        metrics.FAILURES["not_found"].inc()
+        return {"status": "error", "message": "Document not found"}
+
+    # Путь к файлу
+    file_path = storage.path_of(doc)
+
+    if not os.path.exists(file_path):
+        print(f"Файл {file_path} не найден")
+        metrics.FAILURES["file_missing"].inc()
+        return {"status": "error", "message": "File not found"}
+
+    # Документы, загруженные до появления кэша, хэшируем здесь
+    if not doc.file_hash:
+        started = time.perf_counter()
+        doc.file_hash = ocr_cache.file_sha256(file_path)
+        metrics.STAGE_FILE_IO.observe(time.perf_counter() - started)
+
+    # Тот же файл с тем же конфигом уже распознавали - копируем текст
+    cached_text = ocr_cache.lookup(db, doc.file_hash, settings.ocr_lang, config_key)
+    if cached_text is not None:
+        if not task_state.is_current(db, doc_id, task_id, lock=True):
+            db.rollback()
+            return {"status": "superseded"}
+        started = time.perf_counter()
+        _save_text(db, doc.id, cached_text)
+        db.query(DocumentWords).filter(DocumentWords.doc_id == doc_id).delete(synchronize_session=False)
+        word_pages = word_store.copy_from_duplicate(db, doc.id, doc.file_hash, config_key)
+        db.commit()
+        metrics.STAGE_DB_COMMIT.observe(time.perf_counter() - started)
+        print(f"Текст для документа {doc_id} взят из кэша OCR (статистика: {ocr_cache.stats}, "
+              f"страниц со словами: {word_pages})")
+        return {"status": "success", "text_length": len(cached_text), "cached": True}
+
+    print(f"Анализирую файл: {file_path}")
+
+    # Распознавание текста
+    try:
+        started = time.perf_counter()
+        page_count = ocr.count_pages(file_path)
+        metrics.STAGE_FILE_IO.observe(time.perf_counter() - started)
+
+        # Многостраничный документ - каждая страница отдельной подзадачей
+        if page_count > 1:
+            db.query(DocumentPage).filter(DocumentPage.doc_id == doc_id).delete(synchronize_session=False)
+            doc.page_count = page_count
+            task_state.set_pages(db, doc_id, page_count)
+            db.commit()
+
+            if priority is None:
+                priority = scheduling.priority(lane, None)
+            group(
+                ocr_page_task.s(doc_id, page_no, steps, task_id).set(**route(lane, priority))
+                for page_no in range(page_count)
+            ).apply_async()
+            print(f"Документ {doc_id}: {page_count} страниц отправлено на распознавание")
+            return {"status": "queued", "pages": page_count}
+
+        text, stats, words = _recognize_page(file_path, 0, steps)
+
+        print(f"Распознано {len(text)} символов, время: {stats}")
+
+        # Сохраняем результат в БД и в кэш - одной транзакцией, если запуск ещё актуален
+        if not task_state.is_current(db, doc_id, task_id, lock=True):
+            db.rollback()
+            return {"status": "superseded"}
+        started = time.perf_counter()
+        doc.page_count = 1
+        task_state.set_pages(db, doc_id, 1, 1)
+        _save_text(db, doc.id, text, ocr.merge_stats([stats]))
+        word_store.save_page(db, doc.id, 0, config_key, words)
+        word_store.trim(db, doc.id, 1)
+        ocr_cache.store(db, doc.file_hash, settings.ocr_lang, config_key, text)
+        db.commit()
+        metrics.STAGE_DB_COMMIT.observe(time.perf_counter() - started)
+
+        print(f"Текст для документа {doc_id} успешно сохранен")
+        return {"status": "success", "text_length": len(text), "stats": stats}
+
+    except admission.Deferred:
+        db.rollback()
+        raise
+    except Exception as e:
+        print(f"Ошибка при распознавании текста: {e}")
+        metrics.FAILURES[metrics.failure_cause(e)].inc()
+        db.rollback()
+        return {"status": "error", "message": f"OCR error: {str(e)}"}
+
+
+def _recognize_page(file_path: str, page_no: int, steps):
+    """Распознавание страницы в пределах бюджета памяти воркера.
+
+    admission.Deferred - памяти сейчас не хватает, задачу нужно повторить позже.
+    """
+    started = time.perf_counter()
+    page_plan = admission.plan(file_path, page_no, ocr.is_pdf(file_path), steps)
+    metrics.STAGE_FILE_IO.observe(time.perf_counter() - started)
+    # Ожидание памяти под страницу видно в трассе отдельно от распознавания
+    with tracing.span("admission", page=page_no, scale=page_plan.scale):
+        admission.acquire(page_plan)
+    try:
+        with tracing.span("ocr page", page=page_no) as span:
+            started = time.perf_counter()
+            image = ocr.load_page(file_path, page_no, page_plan.scale)
+            metrics.STAGE_DECODE.observe(time.perf_counter() - started)
+            text, stats, words = ocr.recognize(image, steps)
+            span.set(chars=len(text), ocr_ms=stats["ocr_ms"])
+    finally:
+        admission.release()
+    stats["admission"] = page_plan.as_stats()
 
-        # Получаем документ из БД
+    ocr_seconds = stats["ocr_ms"] / 1000
+    metrics.STAGE_PREPROCESS.observe(sum(stats["preprocess_ms"].values()) / 1000)
+    metrics.STAGE_TESSERACT.observe(ocr_seconds)
+    if stats["pixels_out"]:
+        metrics.OCR_SECONDS_PER_MEGAPIXEL.observe(ocr_seconds / (stats["pixels_out"] / 1e6))
+    if ocr_seconds:
+        metrics.OCR_CHARS_PER_SECOND.observe(len(text) / ocr_seconds)
+    metrics.OCR_PAGES.inc()
+    return text, stats, words
+
+
+@celery.task(bind=True)
+def ocr_page_task(self, doc_id: int, page_no: int, steps=None, task_id=None):
+    """Распознавание одной страницы многостраничного документа"""
+    db = SessionLocal()
+    try:
+        steps = preprocessing.parse_steps(steps)
         doc = db.query(Document).filter(Document.id == doc_id).first()
         if not doc:
             print(f"Документ {doc_id} не найден")
+            metrics.FAILURES["not_found"].inc()
             return {"status": "error", "message": "Document not found"}
+        if not task_state.is_active(db, doc_id, task_id):
+            # Запуск заменён или уже завершён (например, ошибкой другой страницы) - не тратим воркер
+            return {"status": "superseded"}
 
-        # Проверяем, есть ли уже текст для этого документа
-        existing_text = db.query(DocumentText).filter(DocumentText.doc_id == doc_id).first()
-        if existing_text:
-            print(f"Текст для документа {doc_id} уже существует, перезаписываем")
-            db.delete(existing_text)
-            db.commit()
+        config_key = ocr.config_key(steps)
+        if _page_saved(db, doc_id, page_no):
+            # Повторная доставка (acks_late): воркер упал после записи страницы, но до
+            # подтверждения - не распознаём заново, только доводим склейку
+            print(f"Документ {doc_id}: страница {page_no + 1} уже распознана, повторная доставка")
+            if _merge_pages(db, doc_id, config_key, task_id):
+                _finish(db, doc_id, True, task_id=task_id)
+            return {"status": "duplicate", "page": page_no}
 
-        # Путь к файлу
-        file_path = os.path.join(DOCUMENTS_DIR, doc.filename)
+        file_path = storage.path_of(doc)
+        text, stats, words = _recognize_page(file_path, page_no, steps)
 
-        if not os.path.exists(file_path):
-            print(f"Файл {file_path} не найден")
-            return {"status": "error", "message": "File not found"}
+        # Страница заменённого или завершённого запуска не должна попасть в склейку
+        if not task_state.is_active(db, doc_id, task_id, lock=True):
+            db.rollback()
+            return {"status": "superseded"}
+        # Страница сразу видна в /get_text как часть текста, вместе с прогрессом.
+        # Прогресс растёт, только если страницу записал этот вызов
+        started = time.perf_counter()
+        if _save_page(db, doc_id, page_no, text, stats):
+            word_store.save_page(db, doc_id, page_no, config_key, words)
+            task_state.page_done(db, doc_id, task_id)
+        db.commit()
+        metrics.STAGE_DB_COMMIT.observe(time.perf_counter() - started)
+        print(f"Документ {doc_id}: страница {page_no + 1}/{doc.page_count} распознана ({len(text)} символов)")
 
-        print(f"Анализирую файл: {file_path}")
+        if _merge_pages(db, doc_id, config_key, task_id):
+            _finish(db, doc_id, True, task_id=task_id)
+        return {"status": "success", "page": page_no, "text_length": len(text)}
 
-        # Распознавание текста
-        try:
-            # Настройки для tesseract
-            config = '--psm 6 -l eng+rus'  # Автоматическое определение структуры + русский и английский
+    except admission.Deferred as e:
+        print(f"Страница {page_no} документа {doc_id} отложена: {e}")
+        metrics.FAILURES["admission_deferred"].inc()
+        db.rollback()
+        raise self.retry(countdown=settings.ocr_admission_defer_seconds, max_retries=None)
+    except Exception as e:
+        print(f"Ошибка при распознавании страницы {page_no} документа {doc_id}: {e}")
+        metrics.FAILURES[metrics.failure_cause(e)].inc()
+        db.rollback()
+        _finish(db, doc_id, False, f"OCR error on page {page_no}: {e}", task_id)
+        return {"status": "error", "message": f"OCR error: {str(e)}"}
 
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image, config=config)
+    finally:
+        db.close()
+        metrics.flush()
 
-            print(f"Распознано {len(text)} символов")
 
-            # Сохраняем результат в БД
-            doc_text = DocumentText(doc_id=doc.id, text=text)
-            db.add(doc_text)
-            db.commit()
+def _page_saved(db, doc_id: int, page_no: int) -> bool:
+    return db.query(DocumentPage.id).filter(
+        DocumentPage.doc_id == doc_id, DocumentPage.page_no == page_no
+    ).first() is not None
 
-            print(f"Текст для документа {doc_id} успешно сохранен")
-            return {"status": "success", "text_length": len(text)}
 
-        except Exception as e:
-            print(f"Ошибка при распознавании текста: {e}")
-            return {"status": "error", "message": f"OCR error: {str(e)}"}
+def _save_page(db, doc_id: int, page_no: int, text: str, stats) -> bool:
+    """Записывает страницу; False - её уже записала другая доставка той же задачи (не делает commit)"""
+    stmt = insert(DocumentPage).values(doc_id=doc_id, page_no=page_no, text=text, ocr_stats=stats)
+    return db.execute(
+        stmt.on_conflict_do_nothing(index_elements=[DocumentPage.doc_id, DocumentPage.page_no])
+        .returning(DocumentPage.id)
+    ).scalar() is not None
+
+
+def _merge_pages(db, doc_id: int, config_key: str, task_id) -> bool:
+    """Склеивает страницы в порядке номеров, когда распознана последняя из них.
 
+    Возвращает True, если склейку выполнил этот вызов.
+    """
+    # Блокировка строки документа: склейку выполняет ровно одна подзадача
+    # (после неё страницы удалены, и следующая подзадача их уже не найдёт)
+    doc = db.query(Document).filter(Document.id == doc_id).with_for_update().first()
+    pages = db.query(DocumentPage).filter(DocumentPage.doc_id == doc_id).order_by(DocumentPage.page_no).all()
+    if len(pages) < doc.page_count or not task_state.is_current(db, doc_id, task_id, lock=True):
+        db.rollback()
+        return False
+
+    text = "".join(page.text for page in pages)
+    stats = ocr.merge_stats(page.ocr_stats for page in pages)
+    _save_text(db, doc_id, text, stats)
+    word_store.trim(db, doc_id, doc.page_count)
+    ocr_cache.store(db, doc.file_hash, settings.ocr_lang, config_key, text)
+    db.query(DocumentPage).filter(DocumentPage.doc_id == doc_id).delete(synchronize_session=False)
+    db.commit()
+    print(f"Текст документа {doc_id} собран из {len(pages)} страниц и сохранен")
+    return True
+
+
+@celery.task
+def preview_task(doc_id: int, sizes=None):
+    """Превью документа в кэш (при загрузке, чтобы список документов не ждал рендеринга)"""
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if not doc or not doc.file_hash:
+            return {"status": "error", "message": "Document not found"}
+        file_path = storage.path_of(doc)
+        if not os.path.exists(file_path):
+            return {"status": "error", "message": "File not found"}
+        for size in sizes or previews.sizes():
+            previews.ensure(file_path, doc.file_hash, size, settings.preview_format)
+        return {"status": "success"}
     except Exception as e:
-        print(f"Общая ошибка при анализе документа {doc_id}: {e}")
+        print(f"Ошибка при создании превью документа {doc_id}: {e}")
         return {"status": "error", "message": str(e)}
-
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def _finish(db, doc_id: int, success: bool, error=None, task_id=None):
+    """Фиксирует итог анализа в состоянии задачи и (ровно один раз) в прогрессе пакетов.
+
+    Засчитывается всем пакетам, ждущим документ: пакеты, присоединившиеся к уже
+    идущему запуску, получают его итог. Итог заменённого запуска не записывается.
+    """
+    if not task_state.mark_finished(db, doc_id, success, error, task_id):
+        return
+    metrics.DOCUMENTS["success" if success else "failed"].inc()
+    db.query(AnalysisBatchItem).filter(
+        AnalysisBatchItem.doc_id == doc_id,
+        AnalysisBatchItem.status == "queued",
+    ).update({"status": "done" if success else "failed"}, synchronize_session=False)
+    db.commit()
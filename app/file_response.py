@@ -0,0 +1,152 @@
+"""Ответ /download_doc: ETag, 304, Range и отдача файла без буферов Python.
+
+С download_accel_prefix файл отдаёт nginx по X-Accel-Redirect (sendfile,
+Range и условные запросы - на его стороне), приложение только проверяет
+документ. Без него файл отдаётся по ASGI-расширению http.response.zerocopysend,
+если сервер его поддерживает, иначе кусками через os.pread.
+
+nginx для X-Accel-Redirect (documents_dir смонтирован в контейнер nginx):
+    location /_documents/ {
+        internal;
+        alias /app/documents/;
+    }
+"""
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Файл по ключу хранилища не меняется - кэшируется без перепроверки
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+def etag(doc, stat: os.stat_result) -> str:
+    # У файла в хранилище ETag - его sha256; у старых файлов - время изменения и размер
+    if doc.storage_key and doc.file_hash:
+        return f'"{doc.file_hash}"'
+    return f'W/"{int(stat.st_mtime)}-{stat.st_size}"'
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(начало, конец включительно) одного диапазона bytes=.
+
+    None - диапазона нет или он из нескольких частей (отдаётся весь файл),
+    ValueError - диапазон не пересекается с файлом (416).
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N - последние N байт
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """Часть файла [start, end] или весь файл"""
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            count = self.end - self.start + 1
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": fd,
+                            "offset": self.start, "count": count, "more_body": False})
+                return
+            offset = self.start
+            while count > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(self.chunk_size, count), offset)
+                if not chunk:
+                    # Файл укоротился во время отдачи
+                    break
+                offset += len(chunk)
+                count -= len(chunk)
+                if count > 0:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                else:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": False})
+                    return
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
+
+
+def build(request: Request, doc, path: str, key: str) -> Response:
+    """Ответ с файлом документа; key - путь файла относительно documents_dir"""
+    stat = os.stat(path)
+    current_etag = etag(doc, stat)
+    headers = {
+        "ETag": current_etag,
+        "Cache-Control": IMMUTABLE if doc.storage_key else "no-cache",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(doc.filename),
+    }
+    media_type = mimetypes.guess_type(doc.filename)[0] or "application/octet-stream"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*"
+                          or current_etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    if settings.download_accel_prefix:
+        headers["X-Accel-Redirect"] = settings.download_accel_prefix.rstrip("/") + "/" + quote(key)
+        return Response(headers=headers, media_type=media_type)
+
+    size = stat.st_size
+    byte_range = None
+    # If-Range с другим ETag - файл изменился, диапазон не применяется
+    if_range = request.headers.get("if-range")
+    if size and (not if_range or if_range.strip() == current_etag):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return FileRangeResponse(path, 0, size - 1, 200, headers, media_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(path, start, end, 206, headers, media_type)
@@ -1,8 +1,19 @@
+from brotli_asgi import BrotliMiddleware
 from fastapi import FastAPI
+from app.config import settings
 from app.database import Base, engine
-from app.routers import document_routes
+from app.routers import async_document_routes, document_routes
 
 
 
 app = FastAPI(title="Document API")
+# brotli для клиентов с Accept-Encoding: br, иначе gzip. Файлы и превью не сжимаются:
+# Content-Range 206 считается по байтам файла, отдача без копирования (zerocopysend)
+# идёт мимо обёртки, а WebP/JPEG уже сжаты. SSE тоже: gzip копит события в буфере
+# и отдаёт их клиенту только при заполнении или в конце потока
+COMPRESSION_EXCLUDED = ["^/download_doc", "^/preview", "^/task_events"]
+app.add_middleware(BrotliMiddleware, minimum_size=1024, gzip_fallback=True, excluded_handlers=COMPRESSION_EXCLUDED)
+# Маршруты сопоставляются по порядку: асинхронные версии перекрывают синхронные
+if settings.db_async:
+    app.include_router(async_document_routes.router, include_in_schema=False)
 app.include_router(document_routes.router)
@@ -0,0 +1,363 @@
+"""Метрики конвейера OCR и маршрутов API в текстовом формате Prometheus.
+
+Счётчики и гистограммы живут в памяти процесса. Серии (наборы меток) создаются
+заранее или при первом обращении, так что наблюдение - это поиск корзины
+bisect и два сложения под блокировкой серии, без словарей и строк на каждый
+вызов. Каждый процесс (API и процессы воркеров Celery) не чаще раза в
+metrics_flush_interval секунд сбрасывает снимок в worker_metrics_dir;
+GET /metrics складывает снимки всех процессов, заменяя снимок текущего
+процесса живыми значениями, и добавляет счётчики допуска (app/admission.py).
+"""
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from fastapi.exceptions import HTTPException
+from fastapi.routing import APIRoute
+
+from app import ocr_cache, scheduling, tracing
+from app.config import settings
+
+# charset добавляет Response
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Границы корзин в секундах: от миллисекунд (маршруты) до десятков минут (очередь)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RATE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+
+class _CounterSeries:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя корзина - +Inf; счётчики не накопительные, накопление - при выводе
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        """Серия с этими значениями меток; в горячем пути лучше получить её заранее"""
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = self._new_series()
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        return {"type": self.kind, "help": self.documentation, "labels": list(self.labelnames),
+                "series": [[list(values), self._dump(series)] for values, series in list(self._series.items())]}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    @staticmethod
+    def _dump(series: _CounterSeries):
+        return series.value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def snapshot(self) -> dict:
+        result = super().snapshot()
+        result["buckets"] = list(self.buckets)
+        return result
+
+    @staticmethod
+    def _dump(series: _HistogramSeries):
+        with series._lock:
+            return [list(series.counts), series.sum]
+
+
+REGISTRY: List[_Metric] = []
+
+# Конвейер OCR (app/celery_worker.py)
+OCR_QUEUE_WAIT = Histogram(
+    "ocr_queue_wait_seconds", "Ожидание задачи анализа в очереди до начала выполнения", ["lane"])
+OCR_STAGE = Histogram(
+    "ocr_stage_seconds", "Время этапов распознавания", ["stage"])
+OCR_SECONDS_PER_MEGAPIXEL = Histogram(
+    "ocr_seconds_per_megapixel", "Время tesseract на мегапиксель страницы после предобработки",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32))
+OCR_CHARS_PER_SECOND = Histogram(
+    "ocr_chars_per_second", "Распознанных символов в секунду работы tesseract", buckets=RATE_BUCKETS)
+OCR_PAGES = Counter("ocr_pages_total", "Распознанные страницы")
+OCR_DOCUMENTS = Counter("ocr_documents_total", "Завершённые анализы документов по итогу", ["result"])
+OCR_FAILURES = Counter("ocr_failures_total", "Сбои и отказы анализа по причине", ["cause"])
+
+# Этапы - серии заранее
+STAGE_FILE_IO = OCR_STAGE.labels("file_io")
+STAGE_DECODE = OCR_STAGE.labels("decode")
+STAGE_PREPROCESS = OCR_STAGE.labels("preprocess")
+STAGE_TESSERACT = OCR_STAGE.labels("tesseract")
+STAGE_DB_COMMIT = OCR_STAGE.labels("db_commit")
+
+FAILURES = {
+    cause: OCR_FAILURES.labels(cause)
+    for cause in ("file_missing", "not_found", "decode", "tesseract", "db", "admission_deferred",
+                  "admission_rejected", "owner_limit", "other")
+}
+DOCUMENTS = {result: OCR_DOCUMENTS.labels(result) for result in ("success", "failed")}
+QUEUE_WAIT = {lane: OCR_QUEUE_WAIT.labels(lane) for lane in scheduling.LANES}
+
+# Маршруты API (TimedRoute)
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Время обработки запроса маршрутом", ["route", "method"])
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Запросы по маршрутам и классам статуса", ["route", "method", "status"])
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def failure_cause(error: BaseException) -> str:
+    """Причина сбоя по типу исключения - ограниченный набор значений метки"""
+    from PIL import UnidentifiedImageError
+    from sqlalchemy.exc import SQLAlchemyError
+
+    from app import admission
+
+    if isinstance(error, admission.Rejected):
+        return "admission_rejected"
+    if isinstance(error, admission.Deferred):
+        return "admission_deferred"
+    if isinstance(error, SQLAlchemyError):
+        return "db"
+    if isinstance(error, FileNotFoundError):
+        return "file_missing"
+    if isinstance(error, (UnidentifiedImageError, OSError, ValueError)):
+        return "decode"
+    if isinstance(error, RuntimeError):
+        # tesserocr сообщает об ошибках распознавания RuntimeError
+        return "tesseract"
+    return "other"
+
+
+def _snapshot_path(pid: Optional[int] = None) -> str:
+    return os.path.join(settings.worker_metrics_dir, f"pipeline-{socket.gethostname()}-{pid or os.getpid()}.json")
+
+
+def snapshot() -> dict:
+    metrics = {metric.name: metric.snapshot() for metric in REGISTRY}
+    # Счётчики кэша OCR процесса (app/ocr_cache.py)
+    metrics["ocr_cache_events_total"] = {
+        "type": "counter", "help": "Попадания, промахи и вытеснения кэша OCR", "labels": ["event"],
+        "series": [[[event], value] for event, value in ocr_cache.stats.items()],
+    }
+    return {"pid": os.getpid(), "host": socket.gethostname(), "updated_at": time.time(), "metrics": metrics}
+
+
+def flush(force: bool = False) -> None:
+    """Снимок процесса в worker_metrics_dir (не чаще metrics_flush_interval)"""
+    global _last_flush
+    directory = settings.worker_metrics_dir
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < settings.metrics_flush_interval):
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        path = _snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Не удалось записать метрики: {e}")
+    finally:
+        _flush_lock.release()
+
+
+def _read_snapshots() -> Iterable[dict]:
+    directory = settings.worker_metrics_dir
+    if not directory or not os.path.isdir(directory):
+        return
+    own = os.path.basename(_snapshot_path())
+    oldest = time.time() - settings.metrics_snapshot_max_age
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("pipeline-") and name.endswith(".json")) or name == own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # Снимки давно завершившихся процессов не учитываются
+        if data.get("updated_at", 0) >= oldest:
+            yield data
+
+
+def _merge(snapshots: Iterable[dict]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    for data in snapshots:
+        for name, metric in data["metrics"].items():
+            target = merged.setdefault(name, {**metric, "series": {}})
+            for values, value in metric["series"]:
+                key = tuple(values)
+                if metric["type"] == "histogram":
+                    counts, total = target["series"].get(key, ([0] * len(value[0]), 0.0))
+                    target["series"][key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                else:
+                    target["series"][key] = target["series"].get(key, 0.0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+def _render_metric(lines: List[str], name: str, metric: dict) -> None:
+    lines.append(f"# HELP {name} {metric['help']}")
+    lines.append(f"# TYPE {name} {metric['type']}")
+    names = metric["labels"]
+    for values, value in sorted(metric["series"].items()):
+        # Заранее созданные, но ни разу не использованные серии не выводятся
+        if metric["type"] == "histogram":
+            counts, total = value
+            if not any(counts):
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [float("inf")], counts):
+                cumulative += count
+                le = 'le="' + _format_number(bound) + '"'
+                lines.append(f"{name}_bucket{_labels(names, values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, values)} {_format_number(total)}")
+            lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+        elif value or metric["type"] == "gauge":
+            lines.append(f"{name}{_labels(names, values)} {_format_number(value)}")
+
+
+def _admission_metrics() -> Dict[str, dict]:
+    """Счётчики допуска страниц по памяти из снимков app/admission.py"""
+    from app import admission
+
+    decisions = {"type": "counter", "help": "Решения допуска страниц по памяти", "labels": ["host", "decision"],
+                 "series": {}}
+    reserved = {"type": "gauge", "help": "Зарезервированная память воркера, МБ", "labels": ["host"], "series": {}}
+    budget = {"type": "gauge", "help": "Бюджет памяти воркера, МБ", "labels": ["host"], "series": {}}
+    for data in admission.read_snapshots():
+        for decision, value in data["counters"].items():
+            decisions["series"][(data["host"], decision)] = value
+        reserved["series"][(data["host"],)] = data["reserved_mb"]
+        budget["series"][(data["host"],)] = data["budget_mb"]
+    return {"ocr_admission_total": decisions, "ocr_admission_reserved_mb": reserved, "ocr_admission_budget_mb": budget}
+
+
+def render() -> str:
+    """Все процессы в текстовом формате Prometheus"""
+    merged = _merge([snapshot(), *_read_snapshots()])
+    merged.update(_admission_metrics())
+    lines: List[str] = []
+    for name, metric in merged.items():
+        _render_metric(lines, name, metric)
+    return "\n".join(lines) + "\n"
+
+
+class TimedRoute(APIRoute):
+    """Маршрут с замером времени, подсчётом запросов по классу статуса и спаном трассы.
+
+    Для потоковых ответов время - до начала отправки тела.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        # Серии маршрута - заранее: в обработчике только поиск по методу
+        durations = {method: HTTP_DURATION.labels(self.path, method) for method in self.methods}
+        requests = {
+            method: [HTTP_REQUESTS.labels(self.path, method, f"{status_class}xx") for status_class in range(1, 6)]
+            for method in self.methods
+        }
+
+        async def timed_handler(request: Request) -> Response:
+            started = time.perf_counter()
+            status = 500
+            # Продолжение трассы вызывающего (Django); задачи Celery маршрута - её потомки
+            span = tracing.start(f"{request.method} {self.path}", request.headers.get("traceparent"),
+                                 service="api", doc_id=request.query_params.get("doc_id"))
+            token = tracing.activate(span)
+            try:
+                response = await handler(request)
+                status = response.status_code
+                if span.sampled:
+                    response.headers["X-Trace-Id"] = span.trace_id
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                tracing.deactivate(token)
+                span.set(status=status)
+                span.end()
+                method = request.method
+                if method in durations:
+                    durations[method].observe(time.perf_counter() - started)
+                    requests[method][min(max(status // 100, 1), 5) - 1].inc()
+                flush()
+
+        return timed_handler
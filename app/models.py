@@ -1,16 +1,117 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, Index, UniqueConstraint, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from app.database import Base
 from sqlalchemy.orm import relationship
 
 class Document(Base):
     __tablename__ = 'documents'
+    __table_args__ = (
+        # Для фильтра по префиксу имени (LIKE 'abc%') независимо от collation
+        Index('ix_documents_filename_pattern', 'filename', postgresql_ops={'filename': 'varchar_pattern_ops'}),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    filename = Column(String, unique=True)
+    filename = Column(String)
+    file_hash = Column(String(64), index=True)
+    # Путь файла в хранилище (app/storage.py); NULL - старый файл в плоском каталоге
+    storage_key = Column(String, index=True)
+    page_count = Column(Integer)
+    # Оценка стоимости OCR при загрузке (scheduling.estimate_cost): размер файла и пиксели всех
+    # кадров; NULL - документ загружен раньше или формат не распознан (pixels)
+    file_size = Column(BigInteger)
+    pixels = Column(BigInteger)
     texts = relationship("DocumentText", backref="document", cascade="all, delete")
 
 class DocumentText(Base):
     __tablename__ = 'document_texts'
+    __table_args__ = (
+        Index('ix_document_texts_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    doc_id = Column(Integer, ForeignKey("documents.id"))
+    doc_id = Column(Integer, ForeignKey("documents.id"), unique=True)
+    # Растёт при каждой перезаписи текста (upsert) - версия для ETag
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     text = Column(String)
+    # Сжатый текст (app/text_codec.py): при сжатии text = NULL
+    text_zstd = Column(LargeBinary)
+    text_dict_id = Column(Integer, ForeignKey("text_dictionaries.id"))
+    ocr_stats = Column(JSONB)
+    search_vector = Column(TSVECTOR)
 
+class TextDictionary(Base):
+    """Обученный словарь zstd для сжатия текстов"""
+    __tablename__ = 'text_dictionaries'
+    id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    samples = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class DocumentPage(Base):
+    __tablename__ = 'document_pages'
+    __table_args__ = (UniqueConstraint('doc_id', 'page_no', name='uq_document_pages_doc_page'),)
+    id = Column(Integer, primary_key=True, index=True)
+    doc_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    page_no = Column(Integer, nullable=False)
+    text = Column(String)
+    ocr_stats = Column(JSONB)
+
+class DocumentWords(Base):
+    """Слова страницы упакованными массивами (см. app/word_store.py)"""
+    __tablename__ = 'document_words'
+    doc_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    page_no = Column(Integer, primary_key=True)
+    config = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    word_count = Column(Integer, nullable=False)
+    words = Column(String, nullable=False)
+    boxes = Column(LargeBinary, nullable=False)
+    conf = Column(LargeBinary, nullable=False)
+    lines = Column(LargeBinary, nullable=False)
+    blocks = Column(LargeBinary, nullable=False)
+
+class OcrCache(Base):
+    __tablename__ = 'ocr_cache'
+    __table_args__ = (UniqueConstraint('file_hash', 'lang', 'config', name='uq_ocr_cache_key'),)
+    id = Column(Integer, primary_key=True, index=True)
+    file_hash = Column(String(64), nullable=False)
+    lang = Column(String, nullable=False)
+    config = Column(String, nullable=False)
+    text = Column(String)
+    # Сжатый текст, как в document_texts (app/text_codec.py): при сжатии text = NULL
+    text_zstd = Column(LargeBinary)
+    text_dict_id = Column(Integer, ForeignKey("text_dictionaries.id"))
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class AnalysisBatch(Base):
+    __tablename__ = 'analysis_batches'
+    id = Column(String(32), primary_key=True)
+    total = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisBatchItem(Base):
+    __tablename__ = 'analysis_batch_items'
+    batch_id = Column(String(32), ForeignKey("analysis_batches.id", ondelete="CASCADE"), primary_key=True)
+    doc_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String(16), nullable=False, default="queued")
+
+class DocumentTask(Base):
+    __tablename__ = 'document_tasks'
+    doc_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    state = Column(String(16), nullable=False)
+    # Конфиг распознавания и id текущего запуска: повторные запросы с тем же конфигом
+    # присоединяются к нему, результаты заменённого запуска отбрасываются
+    config = Column(String)
+    task_id = Column(String(32))
+    # Прогресс многостраничного документа: распознано страниц из pages_total
+    pages_total = Column(Integer)
+    pages_done = Column(Integer, nullable=False, default=0, server_default="0")
+    lane = Column(String(16))
+    owner = Column(String(150), index=True)
+    priority = Column(Integer)
+    queued_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    error = Column(String)
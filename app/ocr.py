@@ -0,0 +1,124 @@
+"""Чтение страниц документа и распознавание текста"""
+import time
+from typing import Iterable, Tuple
+
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+from tesserocr import RIL, iterate_level
+
+from app import admission
+from app.config import settings
+from app.preprocessing import preprocess
+from app.tesseract_pool import get_pool
+from app.word_store import PageWords
+
+# Часть конфига tesseract, влияющая на результат (входит в ключ кэша)
+OCR_CONFIG = f"--psm {settings.ocr_psm}"
+
+
+def config_key(steps: Iterable[str]) -> str:
+    """Конфиг распознавания для ключа кэша: psm + шаги предобработки"""
+    return f"{OCR_CONFIG} pre={','.join(steps)}"
+
+
+def is_pdf(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def count_pages(file_path: str) -> int:
+    """Число страниц: кадры многостраничного TIFF или страницы PDF"""
+    if is_pdf(file_path):
+        return int(pdfinfo_from_path(file_path)["Pages"])
+    with admission.open_image(file_path) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def load_page(file_path: str, page_no: int, scale: float = 1.0) -> Image.Image:
+    """Загружает одну страницу (нумерация с нуля).
+
+    scale < 1 - уменьшение при загрузке (см. app/admission.py): PDF рендерится
+    с меньшим DPI, JPEG декодируется сразу в уменьшенном размере (draft),
+    остальные форматы - целиком и затем уменьшаются (это учитывает plan()).
+    """
+    if is_pdf(file_path):
+        return convert_from_path(
+            file_path, dpi=max(1, round(settings.pdf_dpi * scale)), first_page=page_no + 1, last_page=page_no + 1
+        )[0]
+
+    image = admission.open_image(file_path)
+    if page_no:
+        image.seek(page_no)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image.draft(image.mode, size)
+        image.load()
+        if image.width > size[0]:
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        return image
+    image.load()
+    return image
+
+
+def recognize(image: Image.Image, steps: Iterable[str]) -> Tuple[str, dict, PageWords]:
+    """Предобработка и распознавание одной страницы прогретым движком из пула процесса.
+
+    Возвращает текст, статистику (время шагов предобработки и OCR в мс)
+    и слова страницы с рамками и уверенностью из того же прохода.
+    """
+    pixels_in = image.width * image.height
+    image, timings = preprocess(image, steps)
+
+    started = time.perf_counter()
+    with get_pool().engine() as api:
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+        words = _page_words(api, image.width, image.height)
+
+    stats = {
+        "steps": list(steps),
+        "preprocess_ms": timings,
+        "ocr_ms": round((time.perf_counter() - started) * 1000, 2),
+        "pixels_in": pixels_in,
+        "pixels_out": image.width * image.height,
+        "words": len(words),
+    }
+    return text, stats, words
+
+
+def _page_words(api, width: int, height: int) -> PageWords:
+    """Обходит результат распознавания по словам (повторного OCR не требуется)"""
+    words, boxes, conf, lines, blocks = [], [], [], [], []
+    line_no = block_no = -1
+    for word_iter in iterate_level(api.GetIterator(), RIL.WORD):
+        if word_iter.IsAtBeginningOf(RIL.BLOCK):
+            block_no += 1
+        if word_iter.IsAtBeginningOf(RIL.TEXTLINE):
+            line_no += 1
+        word = (word_iter.GetUTF8Text(RIL.WORD) or "").strip()
+        box = word_iter.BoundingBox(RIL.WORD)
+        if not word or box is None:
+            continue
+        words.append(word)
+        boxes.append(box)
+        conf.append(word_iter.Confidence(RIL.WORD))
+        lines.append(max(line_no, 0))
+        blocks.append(max(block_no, 0))
+    return PageWords.from_lists(words, boxes, conf, lines, blocks, width, height)
+
+
+def merge_stats(page_stats: Iterable[dict]) -> dict:
+    """Суммарная статистика по страницам документа"""
+    merged = {"steps": [], "preprocess_ms": {}, "ocr_ms": 0.0, "pixels_in": 0, "pixels_out": 0, "words": 0, "pages": 0}
+    for stats in page_stats:
+        if not stats:
+            continue
+        merged["steps"] = stats["steps"]
+        for step, ms in stats["preprocess_ms"].items():
+            merged["preprocess_ms"][step] = round(merged["preprocess_ms"].get(step, 0.0) + ms, 2)
+        merged["ocr_ms"] = round(merged["ocr_ms"] + stats["ocr_ms"], 2)
+        merged["pixels_in"] += stats["pixels_in"]
+        merged["pixels_out"] += stats["pixels_out"]
+        merged["words"] += stats.get("words", 0)
+        merged["pages"] += 1
+    return merged
@@ -0,0 +1,90 @@
+"""Кэш результатов OCR, адресуемый по содержимому файла.
+
+Ключ кэша - (sha256 файла, язык, конфиг tesseract), поэтому один и тот же
+файл, загруженный под другим именем, не распознаётся повторно. Текст хранится
+так же, как в document_texts: при text_compression - в zstd (app/text_codec.py).
+"""
+import hashlib
+from datetime import datetime
+from typing import BinaryIO, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import text_codec
+from app.config import settings
+from app.models import OcrCache
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Счётчики процесса воркера
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def copy_and_hash(src: BinaryIO, dst: BinaryIO) -> str:
+    """Копирует поток в файл, попутно считая sha256"""
+    hasher = hashlib.sha256()
+    while True:
+        chunk = src.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        dst.write(chunk)
+    return hasher.hexdigest()
+
+
+def file_sha256(file_path: str) -> str:
+    """sha256 уже сохранённого файла (для документов, загруженных до появления кэша)"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def lookup(db: Session, file_hash: str, lang: str, config: str) -> Optional[str]:
+    """Возвращает закэшированный текст или None"""
+    entry = db.query(OcrCache).filter(
+        OcrCache.file_hash == file_hash,
+        OcrCache.lang == lang,
+        OcrCache.config == config,
+    ).first()
+    if entry is None:
+        stats["misses"] += 1
+        return None
+
+    stats["hits"] += 1
+    entry.hits = OcrCache.hits + 1
+    entry.last_used_at = datetime.utcnow()
+    return text_codec.text_of(entry)
+
+
+def store(db: Session, file_hash: str, lang: str, config: str, text: str) -> None:
+    """Сохраняет результат распознавания и вытесняет старые записи"""
+    now = datetime.utcnow()
+    encoded = text_codec.encode(text)
+    stmt = insert(OcrCache).values(
+        file_hash=file_hash, lang=lang, config=config, **encoded,
+        hits=0, created_at=now, last_used_at=now,
+    ).on_conflict_do_update(
+        constraint='uq_ocr_cache_key',
+        set_={**encoded, "last_used_at": now},
+    )
+    db.execute(stmt)
+    evict(db)
+
+
+def evict(db: Session, max_entries: Optional[int] = None) -> int:
+    """LRU-вытеснение: удаляет давно не использованные записи сверх лимита"""
+    if max_entries is None:
+        max_entries = settings.ocr_cache_max_entries
+
+    excess = db.query(func.count(OcrCache.id)).scalar() - max_entries
+    if excess <= 0:
+        return 0
+
+    stale_ids = select(OcrCache.id).order_by(OcrCache.last_used_at.asc()).limit(excess)
+    deleted = db.query(OcrCache).filter(OcrCache.id.in_(stale_ids)).delete(synchronize_session=False)
+    stats["evictions"] += deleted
+    return deleted
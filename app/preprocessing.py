@@ -0,0 +1,144 @@
+"""Предобработка изображения перед OCR.
+
+Шаги выполняются всегда в одном порядке, любой можно отключить:
+grayscale -> downscale -> binarize -> deskew -> crop.
+Время каждого шага возвращается вместе с результатом.
+"""
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+
+STEPS = ("grayscale", "downscale", "binarize", "deskew", "crop")
+
+
+def parse_steps(value: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Список шагов из строки "a,b,c" или списка; None - шаги по умолчанию"""
+    if value is None:
+        value = settings.ocr_preprocess_steps
+    if isinstance(value, str):
+        value = [step.strip() for step in value.split(",") if step.strip()]
+
+    unknown = set(value) - set(STEPS)
+    if unknown:
+        raise ValueError(f"Неизвестные шаги предобработки: {', '.join(sorted(unknown))}")
+    return tuple(step for step in STEPS if step in value)
+
+
+def _as_gray(image: Image.Image) -> Image.Image:
+    return image if image.mode == "L" else image.convert("L")
+
+
+def grayscale(image: Image.Image) -> Image.Image:
+    return _as_gray(image)
+
+
+def downscale(image: Image.Image) -> Image.Image:
+    """Уменьшает до целевого DPI, а без DPI в метаданных - до максимальной стороны"""
+    dpi = image.info.get("dpi", (0, 0))[0]
+    if dpi and dpi > settings.ocr_target_dpi:
+        scale = settings.ocr_target_dpi / dpi
+    else:
+        scale = settings.ocr_max_side / max(image.size)
+    if scale >= 1:
+        return image
+
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def binarize(image: Image.Image) -> Image.Image:
+    """Адаптивная бинаризация (Bradley-Roth) через интегральное изображение"""
+    pixels = np.asarray(_as_gray(image), dtype=np.int64)
+    height, width = pixels.shape
+    half = settings.ocr_binarize_window // 2
+
+    integral = np.zeros((height + 1, width + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(pixels, axis=0), axis=1, out=integral[1:, 1:])
+
+    y0 = np.clip(np.arange(height) - half, 0, height)
+    y1 = np.clip(np.arange(height) + half + 1, 0, height)
+    x0 = np.clip(np.arange(width) - half, 0, width)
+    x1 = np.clip(np.arange(width) + half + 1, 0, width)
+
+    window_sum = (integral[y1][:, x1] - integral[y0][:, x1]
+                  - integral[y1][:, x0] + integral[y0][:, x0])
+    window_area = np.outer(y1 - y0, x1 - x0)
+
+    # Пиксель тёмный, если он заметно темнее среднего по окну
+    threshold = 1.0 - settings.ocr_binarize_sensitivity
+    light = pixels * window_area > window_sum * threshold
+    return Image.fromarray(np.where(light, 255, 0).astype(np.uint8), mode="L")
+
+
+def _skew_angle(image: Image.Image) -> float:
+    """Угол наклона строк: максимум дисперсии горизонтальной проекции тёмных пикселей"""
+    gray = np.asarray(_as_gray(image))
+    ys, xs = np.nonzero(gray < 128)
+    if len(ys) < 100:
+        return 0.0
+
+    # Для оценки угла достаточно подвыборки точек
+    if len(ys) > 50000:
+        picked = np.random.default_rng(0).choice(len(ys), 50000, replace=False)
+        ys, xs = ys[picked], xs[picked]
+
+    max_angle = settings.ocr_deskew_max_angle
+    angles = np.deg2rad(np.arange(-max_angle, max_angle + 0.01, 0.25))
+    projected = (ys[None, :] * np.cos(angles)[:, None] - xs[None, :] * np.sin(angles)[:, None]).astype(np.int64)
+    projected -= projected.min(axis=1, keepdims=True)
+
+    scores = [np.var(np.bincount(row)) for row in projected]
+    return float(np.rad2deg(angles[int(np.argmax(scores))]))
+
+
+def deskew(image: Image.Image) -> Image.Image:
+    angle = _skew_angle(image)
+    if abs(angle) < 0.1:
+        return image
+    fill = 255 if image.mode == "L" else (255,) * len(image.getbands())
+    return image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=fill)
+
+
+def crop(image: Image.Image) -> Image.Image:
+    """Обрезает пустые и залитые тёмным (край скана) поля"""
+    dark = np.asarray(_as_gray(image)) < 128
+    row_fill = dark.mean(axis=1)
+    col_fill = dark.mean(axis=0)
+    rows = np.flatnonzero((row_fill > 0) & (row_fill < 0.9))
+    cols = np.flatnonzero((col_fill > 0) & (col_fill < 0.9))
+    if not len(rows) or not len(cols):
+        return image
+
+    margin = settings.ocr_crop_margin
+    box = (
+        max(int(cols[0]) - margin, 0),
+        max(int(rows[0]) - margin, 0),
+        min(int(cols[-1]) + margin + 1, image.width),
+        min(int(rows[-1]) + margin + 1, image.height),
+    )
+    return image.crop(box)
+
+
+STEP_FUNCTIONS = {
+    "grayscale": grayscale,
+    "downscale": downscale,
+    "binarize": binarize,
+    "deskew": deskew,
+    "crop": crop,
+}
+
+
+def preprocess(image: Image.Image, steps: Iterable[str]) -> Tuple[Image.Image, Dict[str, float]]:
+    """Применяет выбранные шаги, возвращает изображение и время шагов в мс"""
+    timings = {}
+    for step in STEPS:
+        if step not in steps:
+            continue
+        started = time.perf_counter()
+        image = STEP_FUNCTIONS[step](image)
+        timings[step] = round((time.perf_counter() - started) * 1000, 2)
+    return image, timings
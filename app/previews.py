@@ -0,0 +1,148 @@
+"""Превью документов: уменьшенная первая страница в WebP/JPEG и дисковый LRU-кэш.
+
+Изображение декодируется сразу в уменьшенном виде: JPEG - через draft (масштаб
+DCT 1/2..1/8), остальное - thumbnail с reduce; PDF рендерится poppler сразу
+в нужный размер. Превью создаются задачей Celery при загрузке и при промахе
+кэша в GET /preview.
+
+Кэш - каталог preview_cache_dir с файлами по ключу <sha256 файла>-<размер>.<формат>,
+так что одинаковые файлы делят превью, а удалённые документы вытесняются
+сами. Время использования - mtime (обновляется при чтении); когда объём
+превышает preview_cache_max_mb, удаляются самые давние файлы до 90% лимита.
+"""
+import io
+import os
+import tempfile
+from typing import List, Optional
+
+from pdf2image import convert_from_path
+from PIL import Image, ImageOps
+
+from app import ocr
+from app.config import settings
+
+MB = 1024 * 1024
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# Оценка объёма кэша в этом процессе; пересчитывается обходом каталога при вытеснении
+_cache_bytes: Optional[int] = None
+
+
+def sizes() -> List[int]:
+    """Допустимые размеры превью (длинная сторона, px) - число вариантов в кэше ограничено"""
+    return [int(size) for size in settings.preview_sizes.split(",") if size.strip()]
+
+
+def key(file_hash: str, size: int, fmt: str) -> str:
+    return f"{file_hash[:2]}/{file_hash}-{size}.{fmt}"
+
+
+def cache_path(cache_key: str) -> str:
+    return os.path.join(settings.preview_cache_dir, cache_key)
+
+
+def render(file_path: str, size: int, fmt: str) -> bytes:
+    """Превью первой страницы: длинная сторона не больше size"""
+    if ocr.is_pdf(file_path):
+        image = convert_from_path(file_path, first_page=1, last_page=1, size=size)[0]
+    else:
+        image = Image.open(file_path)
+        # JPEG декодируется сразу с уменьшением, остальные форматы игнорируют draft
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+    with image:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGBA" if "A" in image.getbands() and fmt == "webp" else "RGB")
+        # reducing_gap: сначала целочисленный reduce, затем точный ресэмплинг
+        image.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            image.save(buffer, "WEBP", quality=settings.preview_quality, method=4)
+        else:
+            image.save(buffer, "JPEG", quality=settings.preview_quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def get(cache_key: str) -> Optional[str]:
+    """Путь к превью в кэше или None; попадание обновляет время использования"""
+    path = cache_path(cache_key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def put(cache_key: str, data: bytes) -> str:
+    """Кладёт превью в кэш (атомарно) и при переполнении вытесняет давние"""
+    global _cache_bytes
+    path = cache_path(cache_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    if _cache_bytes is None:
+        _cache_bytes = sum(entry[2] for entry in _entries())
+    else:
+        _cache_bytes += len(data)
+    if _cache_bytes > settings.preview_cache_max_mb * MB:
+        evict()
+    return path
+
+
+def _entries():
+    """(mtime, путь, размер) всех файлов кэша"""
+    root = settings.preview_cache_dir
+    if not os.path.isdir(root):
+        return
+    with os.scandir(root) as shards:
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as files:
+                for entry in files:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+
+def evict() -> int:
+    """Удаляет самые давно использованные превью, пока кэш больше 90% лимита; возвращает число удалённых"""
+    global _cache_bytes
+    entries = sorted(_entries())
+    total = sum(size for _, _, size in entries)
+    target = settings.preview_cache_max_mb * MB * 0.9
+    removed = 0
+    for _, path, size in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    _cache_bytes = total
+    if removed:
+        print(f"Кэш превью: удалено {removed} файлов, осталось {total / MB:.1f} МБ")
+    return removed
+
+
+def ensure(file_path: str, file_hash: str, size: int, fmt: str) -> bytes:
+    """Превью из кэша или только что созданное (превью - килобайты, отдаются из памяти)"""
+    cache_key = key(file_hash, size, fmt)
+    path = get(cache_key)
+    if path is not None:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Вытеснено другим процессом между проверкой и чтением
+            pass
+    data = render(file_path, size, fmt)
+    put(cache_key, data)
+    return data
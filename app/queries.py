@@ -0,0 +1,103 @@
+"""Запросы, общие для синхронных и асинхронных маршрутов"""
+from typing import Optional, Sequence
+
+from sqlalchemy import case, exists, func, select
+
+from app.models import Document, DocumentPage, DocumentTask, DocumentText
+
+
+def document_text_meta(doc_id: int, inline_limit: int):
+    """Документ, id и размер его текста; сам текст - только если он не больше inline_limit байт.
+
+    octet_length берётся из заголовка TOAST без чтения значения, так что проверка
+    ETag не читает текст. Для сжатого текста (text_zstd) - то же по сжатым байтам.
+    Состояние и прогресс задачи - для частичного текста, пока документ распознаётся.
+    """
+    size = func.octet_length(DocumentText.text)
+    zstd_size = func.octet_length(DocumentText.text_zstd)
+    return (
+        select(
+            Document.id,
+            DocumentText.id.label("text_id"),
+            DocumentText.version,
+            size.label("size"),
+            case((size <= inline_limit, DocumentText.text), else_=None).label("text"),
+            zstd_size.label("zstd_size"),
+            case((zstd_size <= inline_limit, DocumentText.text_zstd), else_=None).label("text_zstd"),
+            DocumentText.text_dict_id,
+            DocumentTask.state,
+            DocumentTask.task_id,
+            DocumentTask.pages_done,
+            DocumentTask.pages_total,
+        )
+        .outerjoin(DocumentText, DocumentText.doc_id == Document.id)
+        .outerjoin(DocumentTask, DocumentTask.doc_id == Document.id)
+        .where(Document.id == doc_id)
+        .limit(1)
+    )
+
+
+def partial_pages(doc_id: int):
+    """Уже распознанные страницы документа, текст которого ещё не собран"""
+    return (
+        select(DocumentPage.page_no, DocumentPage.text)
+        .where(DocumentPage.doc_id == doc_id)
+        .order_by(DocumentPage.page_no)
+    )
+
+
+def text_storage(text_id: int):
+    """Сжат ли текст и каким словарём - в начале потоковой отдачи, в её снимке БД"""
+    return select(DocumentText.text_zstd.isnot(None).label("compressed"), DocumentText.text_dict_id).where(
+        DocumentText.id == text_id
+    )
+
+
+def text_chunk(text_id: int, start: int, length: int):
+    """Кусок текста по символам (start с 1), читает только нужные чанки TOAST"""
+    return select(func.substr(DocumentText.text, start, length)).where(DocumentText.id == text_id)
+
+
+def text_zstd_chunk(text_id: int, start: int, length: int):
+    """Кусок сжатого текста по байтам (start с 1)"""
+    return select(func.substr(DocumentText.text_zstd, start, length)).where(DocumentText.id == text_id)
+
+
+def documents_page(after_id: Optional[int], limit: int, has_text: Optional[bool], prefix: Optional[str]):
+    """Страница списка документов (keyset по id), has_text через EXISTS"""
+    text_exists = exists().where(DocumentText.doc_id == Document.id)
+    query = select(Document.id, Document.filename, text_exists.label("has_text"))
+    if after_id is not None:
+        query = query.where(Document.id > after_id)
+    if has_text is not None:
+        query = query.where(text_exists if has_text else ~text_exists)
+    if prefix:
+        query = query.where(Document.filename.startswith(prefix, autoescape=True))
+
+    # Лишняя строка показывает, есть ли следующая страница
+    return query.order_by(Document.id).limit(limit + 1)
+
+
+def task_states(doc_ids: Sequence[int]):
+    """Состояние анализа нескольких документов одним запросом (для списков)"""
+    return (
+        select(
+            Document.id,
+            DocumentTask.state,
+            DocumentTask.pages_done,
+            DocumentTask.pages_total,
+            exists().where(DocumentText.doc_id == Document.id).label("has_text"),
+        )
+        .outerjoin(DocumentTask, DocumentTask.doc_id == Document.id)
+        .where(Document.id.in_(doc_ids))
+    )
+
+
+def documents_page_response(rows: Sequence, limit: int) -> dict:
+    return {
+        "documents": [
+            {"id": row.id, "filename": row.filename, "has_text": row.has_text}
+            for row in rows[:limit]
+        ],
+        "next_cursor": rows[limit - 1].id if len(rows) > limit else None,
+    }
@@ -0,0 +1,56 @@
+"""Асинхронные (asyncpg) версии маршрутов чтения.
+
+Подключаются в app.main перед синхронными при DB_ASYNC=true и перекрывают их.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, queries, text_response
+from app.config import settings
+from app.database import AsyncSessionLocal
+
+router = APIRouter(route_class=metrics.TimedRoute)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+@router.get("/get_text", summary="Получить текст")
+async def get_text(doc_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Получение распознанного текста (If-None-Match, потоковая отдача больших текстов,
+    частичный текст с прогрессом, пока документ распознаётся)"""
+    try:
+        meta = (await db.execute(queries.document_text_meta(doc_id, settings.text_stream_threshold))).first()
+        if meta is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if text_response.is_partial(meta):
+            pages = (await db.execute(queries.partial_pages(doc_id))).all()
+            return text_response.build(request, meta, text_response.aiter_text_json, pages)
+        return text_response.build(request, meta, text_response.aiter_text_json)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при получении текста: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении текста: {str(e)}")
+
+
+@router.get("/documents", summary="Список документов")
+async def list_documents(
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    has_text: Optional[bool] = None,
+    prefix: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Постраничный список документов (keyset по id)"""
+    try:
+        rows = (await db.execute(queries.documents_page(after_id, limit, has_text, prefix))).all()
+        return queries.documents_page_response(rows, limit)
+    except Exception as e:
+        print(f"Ошибка при получении списка документов: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении списка: {str(e)}")
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app.models import Document, DocumentText
-from app.celery_worker import analyze_document_task
+from app.models import Document, DocumentText, OcrCache, AnalysisBatch, AnalysisBatchItem, DocumentTask, DocumentWords
+from app.celery_worker import analyze_document_task, preview_task, route
+from app.config import settings
+from app import admission, file_response, metrics, ocr, ocr_cache, preprocessing, previews, queries, scheduling, search, storage, task_state, text_codec, text_response, word_store
+from celery import group
+from pydantic import BaseModel
+from sqlalchemy import func, Float, insert
+from typing import List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
 import os
-import shutil
+import time
+import uuid
 
-router = APIRouter()
+router = APIRouter(route_class=metrics.TimedRoute)
 
-DOCUMENTS_DIR = "/app/documents"
-os.makedirs(DOCUMENTS_DIR, exist_ok=True)
+os.makedirs(settings.documents_dir, exist_ok=True)
 
 
 def get_db():
@@ -24,16 +36,10 @@ def get_db():
 def upload_doc(file: UploadFile = File(...), db: Session = Depends(get_db)):
     """Загрузка документа в FastAPI"""
     try:
-        # Сохранение файла
-        file_path = os.path.join(DOCUMENTS_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Сохранение в БД
-        doc = Document(filename=file.filename)
-        db.add(doc)
-        db.commit()
-        db.refresh(doc)
+        # Файл пишется во временный, затем переносится в хранилище под ключом по хэшу
+        tmp_path, file_hash = storage.save(file.file)
+        doc = storage.create_document(db, os.path.basename(file.filename), file_hash, tmp_path)
+        _schedule_preview(doc.id)
 
         print(f"Файл {file.filename} успешно загружен, ID: {doc.id}")
         return {"doc_id": doc.id, "message": "Файл успешно загружен"}
@@ -43,6 +49,112 @@ def upload_doc(file: UploadFile = File(...), db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файла: {str(e)}")
 
 
+def _schedule_preview(doc_id: int) -> None:
+    # Превью для списка документов - заранее; без брокера оно создастся при первом запросе
+    try:
+        preview_task.apply_async(args=[doc_id, previews.sizes()[:1]],
+                                 **route(scheduling.INTERACTIVE, scheduling.MAX_PRIORITY))
+    except Exception as e:
+        print(f"Не удалось поставить превью документа {doc_id} в очередь: {e}")
+
+
+def _create_document(filename: str, file_hash: str, tmp_path: str) -> int:
+    db = SessionLocal()
+    try:
+        return storage.create_document(db, filename, file_hash, tmp_path).id
+    finally:
+        db.close()
+
+
+@router.put("/upload_doc_stream", summary="Потоковая загрузка документа")
+async def upload_doc_stream(filename: str, request: Request):
+    """Загрузка документа телом запроса (без multipart).
+
+    Файл пишется на диск по мере поступления частей, хэш и размер считаются по ходу.
+    """
+    try:
+        filename = os.path.basename(filename)
+        buffer, tmp_path = await run_in_threadpool(storage.new_temp)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with buffer:
+                async for chunk in request.stream():
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    await run_in_threadpool(buffer.write, chunk)
+        except Exception:
+            # Оборванная загрузка - не оставляем обрезанный файл
+            storage.discard(tmp_path)
+            raise
+
+        file_hash = hasher.hexdigest()
+        doc_id = await run_in_threadpool(_create_document, filename, file_hash, tmp_path)
+        await run_in_threadpool(_schedule_preview, doc_id)
+
+        print(f"Файл {filename} успешно загружен потоком ({size} байт), ID: {doc_id}")
+        return {"doc_id": doc_id, "file_hash": file_hash, "size": size, "message": "Файл успешно загружен"}
+
+    except Exception as e:
+        print(f"Ошибка при загрузке файла: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файла: {str(e)}")
+
+
+@router.get("/download_doc", summary="Скачать документ")
+def download_doc(doc_id: int, request: Request, db: Session = Depends(get_db)):
+    """Оригинал документа.
+
+    Поддерживает Range (206/416), If-None-Match (304) и If-Range. Файлы в хранилище
+    неизменяемы и кэшируются клиентом; с download_accel_prefix файл отдаёт nginx.
+    """
+    doc = db.query(Document).filter(Document.id == doc_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    file_path = storage.path_of(doc)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    key = doc.storage_key or os.path.basename(doc.filename)
+    return file_response.build(request, doc, file_path, key)
+
+
+@router.get("/preview", summary="Превью документа")
+def preview(doc_id: int, request: Request, size: Optional[int] = None, db: Session = Depends(get_db)):
+    """Уменьшенная первая страница (WebP/JPEG) из дискового кэша; при промахе создаётся сразу.
+
+    size - длинная сторона из preview_sizes (по умолчанию наименьший).
+    """
+    allowed = previews.sizes()
+    size = size or allowed[0]
+    if size not in allowed:
+        raise HTTPException(status_code=400, detail=f"Недопустимый размер превью: {size} (допустимо: {settings.preview_sizes})")
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        if not doc:
+            raise HTTPException(status_code=404, detail="Document not found")
+        file_path = storage.path_of(doc)
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        if not doc.file_hash:
+            doc.file_hash = ocr_cache.file_sha256(file_path)
+            db.commit()
+
+        fmt = settings.preview_format
+        current_etag = f'"{doc.file_hash}-{size}.{fmt}"'
+        headers = {"ETag": current_etag, "Cache-Control": file_response.IMMUTABLE}
+        if text_response.is_not_modified(request, current_etag):
+            return Response(status_code=304, headers=headers)
+
+        data = previews.ensure(file_path, doc.file_hash, size, fmt)
+        return Response(content=data, media_type=previews.MEDIA_TYPES[fmt], headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при создании превью документа {doc_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при создании превью: {str(e)}")
+
+
 @router.delete("/doc_delete", summary="Удалить документ")
 def doc_delete(doc_id: int, db: Session = Depends(get_db)):
     """Удаление документа"""
@@ -51,15 +163,9 @@ def doc_delete(doc_id: int, db: Session = Depends(get_db)):
         if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
 
-        file_path = os.path.join(DOCUMENTS_DIR, doc.filename)
-
-        # Удаление из БД
-        db.delete(doc)
-        db.commit()
-
-        # Удаление файла
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Удаление из БД и файла, если на него не ссылаются другие документы
+        file_path = storage.delete_document(db, doc)
+        if file_path:
             print(f"Файл {file_path} удален")
 
         return {"detail": "Документ успешно удален!"}
@@ -71,20 +177,75 @@ def doc_delete(doc_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении: {str(e)}")
 
 
+def _check_lane(lane: str) -> str:
+    if lane not in scheduling.LANES:
+        raise HTTPException(status_code=400, detail=f"Неизвестная полоса: {lane} (допустимо: {', '.join(scheduling.LANES)})")
+    return lane
+
+
+def _task_priority(db: Session, doc, lane: str, owner: Optional[str], backlog: Optional[int] = None,
+                   read_file: bool = True) -> int:
+    """Приоритет по размеру документа и очереди владельца.
+
+    Размер берётся из строки документа; у старых документов без оценки файл читается
+    (и оценка сохраняется вместе с коммитом вызывающего) только при read_file.
+    """
+    cost = scheduling.stored_cost(doc)
+    if cost is None and read_file:
+        file_path = storage.path_of(doc)
+        if os.path.exists(file_path):
+            cost = scheduling.estimate_cost(file_path)
+            doc.file_size, doc.pixels = cost["bytes"], cost["pixels"]
+    if backlog is None:
+        backlog = task_state.owner_backlog(db, owner, lane)
+    return scheduling.priority(lane, cost, backlog, settings.ocr_owner_fair_share)
+
+
 @router.post("/doc_analyse", summary="Анализ документа")
-def doc_analyse(doc_id: int, db: Session = Depends(get_db)):
-    """Запуск анализа документа"""
+def doc_analyse(
+    doc_id: int,
+    steps: Optional[str] = None,
+    user: Optional[str] = None,
+    lane: str = scheduling.INTERACTIVE,
+    db: Session = Depends(get_db),
+):
+    """Запуск анализа документа
+
+    steps - шаги предобработки через запятую (grayscale,downscale,binarize,deskew,crop),
+    пустая строка отключает предобработку
+    user - кто запросил анализ (для справедливого распределения воркеров)
+    lane - полоса: interactive (по умолчанию) или bulk
+    """
     try:
+        try:
+            steps = preprocessing.parse_steps(steps)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        _check_lane(lane)
+
         # Проверяем, что документ существует
         doc = db.query(Document).filter(Document.id == doc_id).first()
         if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
 
-        # Запускаем задачу анализа
-        analyze_document_task.delay(doc_id)
-        print(f"Анализ документа {doc_id} запущен")
+        # Запускаем задачу анализа, если такой же ещё нет в работе
+        priority = _task_priority(db, doc, lane, user)
+        claimed = task_state.claim(
+            db, [doc_id], ocr.config_key(steps), lane, user, {doc_id: priority}, settings.ocr_running_stale_after
+        )
+        db.commit()
+        if doc_id not in claimed:
+            task = db.query(DocumentTask).filter(DocumentTask.doc_id == doc_id).first()
+            print(f"Анализ документа {doc_id} уже выполняется, запрос присоединён к нему")
+            return {"detail": "Анализ уже выполняется", "attached": True, "task": task_state.to_dict(task)}
 
-        return {"detail": "Задача анализа запущена"}
+        analyze_document_task.apply_async(
+            (doc_id, list(steps)), {"lane": lane, "priority": priority, "task_id": claimed[doc_id]},
+            **route(lane, priority),
+        )
+        print(f"Анализ документа {doc_id} запущен (полоса {lane}, приоритет {priority})")
+
+        return {"detail": "Задача анализа запущена", "attached": False, "lane": lane, "priority": priority}
 
     except HTTPException:
         raise
@@ -93,21 +254,272 @@ def doc_analyse(doc_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка при запуске анализа: {str(e)}")
 
 
+class BatchAnalyseRequest(BaseModel):
+    """Выбор документов для пакетного анализа (условия объединяются через И)"""
+    doc_ids: Optional[List[int]] = None
+    id_from: Optional[int] = None
+    id_to: Optional[int] = None
+    without_text: bool = False
+    steps: Optional[str] = None
+    user: Optional[str] = None
+    lane: str = scheduling.BULK
+
+
+@router.post("/doc_analyse_batch", summary="Пакетный анализ документов")
+def doc_analyse_batch(request: BatchAnalyseRequest, db: Session = Depends(get_db)):
+    """Запуск анализа списка/диапазона документов или всех документов без текста"""
+    try:
+        if request.doc_ids is None and request.id_from is None and request.id_to is None and not request.without_text:
+            raise HTTPException(status_code=400, detail="Не задано ни одного условия выбора документов")
+        try:
+            steps = list(preprocessing.parse_steps(request.steps))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        lane = _check_lane(request.lane)
+
+        # Существующие документы - одним запросом
+        query = db.query(Document.id, Document.filename, Document.storage_key)
+        if request.doc_ids is not None:
+            query = query.filter(Document.id.in_(request.doc_ids))
+        if request.id_from is not None:
+            query = query.filter(Document.id >= request.id_from)
+        if request.id_to is not None:
+            query = query.filter(Document.id <= request.id_to)
+        if request.without_text:
+            query = query.filter(~db.query(DocumentText.id).filter(DocumentText.doc_id == Document.id).exists())
+        documents = query.order_by(Document.id).all()
+        doc_ids = [doc.id for doc in documents]
+        if not doc_ids:
+            raise HTTPException(status_code=404, detail="Documents not found")
+
+        batch_id = uuid.uuid4().hex
+        db.add(AnalysisBatch(id=batch_id, total=len(doc_ids)))
+        db.flush()
+        db.execute(insert(AnalysisBatchItem), [{"batch_id": batch_id, "doc_id": doc_id} for doc_id in doc_ids])
+        db.commit()
+
+        # Отправляем задачи группами, а не по одной. Каждый документ пакета увеличивает
+        # очередь владельца - большой пакет постепенно уступает задачам других пользователей.
+        # Размеры - из строк документов, без чтения файлов (старые документы - средний приоритет)
+        # Документы, которые уже анализируются с тем же конфигом, присоединяются к идущим задачам
+        config_key = ocr.config_key(steps)
+        backlog = task_state.owner_backlog(db, request.user, lane)
+        chunk_size = settings.batch_chunk_size
+        attached = 0
+        for start in range(0, len(documents), chunk_size):
+            chunk = documents[start:start + chunk_size]
+            priorities = {
+                doc.id: _task_priority(db, doc, lane, request.user, backlog + start + i, read_file=False)
+                for i, doc in enumerate(chunk)
+            }
+            claimed = task_state.claim(
+                db, list(priorities), config_key, lane, request.user, priorities, settings.ocr_running_stale_after
+            )
+            db.commit()
+            attached += len(chunk) - len(claimed)
+            if claimed:
+                group(
+                    analyze_document_task.s(
+                        doc_id, steps, batch_id, lane, priorities[doc_id], task_id
+                    ).set(**route(lane, priorities[doc_id]))
+                    for doc_id, task_id in claimed.items()
+                ).apply_async()
+        print(f"Пакет {batch_id}: запущен анализ {len(doc_ids)} документов (полоса {lane}, "
+              f"присоединено к идущим: {attached})")
+
+        missing = sorted(set(request.doc_ids) - set(doc_ids)) if request.doc_ids is not None else []
+        return {"batch_id": batch_id, "total": len(doc_ids), "attached": attached, "missing": missing}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при запуске пакетного анализа: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при запуске анализа: {str(e)}")
+
+
+@router.get("/doc_analyse_batch/{batch_id}", summary="Прогресс пакетного анализа")
+def doc_analyse_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    """Сколько документов пакета уже обработано"""
+    try:
+        batch = db.query(AnalysisBatch).filter(AnalysisBatch.id == batch_id).first()
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+
+        counts = dict(
+            db.query(AnalysisBatchItem.status, func.count())
+            .filter(AnalysisBatchItem.batch_id == batch_id)
+            .group_by(AnalysisBatchItem.status)
+            .all()
+        )
+        done, failed = counts.get("done", 0), counts.get("failed", 0)
+        return {
+            "batch_id": batch_id,
+            "total": batch.total,
+            "queued": counts.get("queued", 0),
+            "done": done,
+            "failed": failed,
+            "progress": round((done + failed) / batch.total, 4) if batch.total else 1.0,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при получении прогресса пакета: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении прогресса: {str(e)}")
+
+
+def _load_task_state(doc_id: int) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        task = db.query(DocumentTask).filter(DocumentTask.doc_id == doc_id).first()
+        return task_state.to_dict(task) if task else None
+    finally:
+        db.close()
+
+
+@router.get("/task_status", summary="Состояние анализа документа")
+async def task_status(doc_id: int, wait: float = 0, since: Optional[str] = None, since_pages: Optional[int] = None):
+    """Состояние задачи анализа (long-poll).
+
+    С wait > 0 ответ задерживается, пока задача не завершится, её состояние
+    не станет отличным от since или число готовых страниц - от since_pages,
+    но не дольше wait секунд.
+    """
+    try:
+        deadline = time.monotonic() + min(wait, settings.task_wait_max)
+        while True:
+            state = await run_in_threadpool(_load_task_state, doc_id)
+            if state is None:
+                raise HTTPException(status_code=404, detail="Task not found")
+            if (state["state"] in task_state.FINISHED_STATES
+                    or (since is not None and state["state"] != since)
+                    or (since_pages is not None and (state["progress"] or {}).get("pages_done", 0) != since_pages)
+                    or time.monotonic() >= deadline):
+                return state
+            await asyncio.sleep(settings.task_poll_interval)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при получении состояния задачи: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении состояния: {str(e)}")
+
+
+@router.get("/task_status_batch", summary="Состояние анализа нескольких документов")
+def task_status_batch(doc_ids: List[int] = Query(...), db: Session = Depends(get_db)):
+    """Состояние, прогресс и наличие текста для страницы списка - один запрос вместо запроса на документ.
+
+    Документы, которые ещё не анализировались, имеют state = null; несуществующие пропускаются.
+    """
+    if len(doc_ids) > settings.task_status_batch_max:
+        raise HTTPException(status_code=400, detail=f"Не больше {settings.task_status_batch_max} документов за запрос")
+    try:
+        rows = db.execute(queries.task_states(doc_ids)).all()
+        return {
+            "tasks": {
+                row.id: {
+                    "state": row.state,
+                    "progress": task_state.progress(row.pages_done, row.pages_total),
+                    "has_text": row.has_text,
+                }
+                for row in rows
+            }
+        }
+
+    except Exception as e:
+        print(f"Ошибка при получении состояния задач: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении состояния: {str(e)}")
+
+
+@router.get("/queue_stats", summary="Ожидание в очередях по полосам")
+def queue_stats(minutes: int = Query(60, ge=1, le=7 * 24 * 60), db: Session = Depends(get_db)):
+    """Время ожидания задач в очереди (от постановки до начала выполнения) за последние minutes минут"""
+    try:
+        since = datetime.utcnow() - timedelta(minutes=minutes)
+        return {"minutes": minutes, "lanes": task_state.queue_wait_stats(db, since)}
+    except Exception as e:
+        print(f"Ошибка при получении статистики очередей: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении статистики: {str(e)}")
+
+
+@router.get("/metrics", summary="Метрики в формате Prometheus", include_in_schema=False)
+def prometheus_metrics():
+    """Этапы OCR, очередь, сбои и маршруты API - сумма по процессам API и воркеров"""
+    try:
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+    except Exception as e:
+        print(f"Ошибка при сборе метрик: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при сборе метрик: {str(e)}")
+
+
+@router.get("/worker_admission", summary="Допуск страниц по памяти в воркерах")
+def worker_admission():
+    """Бюджет памяти, текущие резервы и счётчики решений (допущено/ожидало/отложено/уменьшено/отклонено)"""
+    try:
+        return {"workers": admission.read_snapshots()}
+    except Exception as e:
+        print(f"Ошибка при получении метрик допуска: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении метрик: {str(e)}")
+
+
+@router.get("/task_events", summary="Поток состояний анализа (SSE)")
+async def task_events(doc_id: int):
+    """Server-Sent Events: событие state при каждой смене состояния и progress
+    после каждой распознанной страницы, до завершения задачи"""
+    if await run_in_threadpool(_load_task_state, doc_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events():
+        deadline = time.monotonic() + settings.task_events_timeout
+        last_state = None
+        last_progress = None
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            state = await run_in_threadpool(_load_task_state, doc_id)
+            if state is None:
+                break
+            if state["state"] != last_state:
+                last_state = state["state"]
+                last_progress = state["progress"]
+                last_sent = time.monotonic()
+                yield f"event: state\ndata: {json.dumps(state)}\n\n"
+                if last_state in task_state.FINISHED_STATES:
+                    break
+            elif state["progress"] != last_progress:
+                # Распознана очередная страница - её текст уже доступен в /get_text
+                last_progress = state["progress"]
+                last_sent = time.monotonic()
+                yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+            elif time.monotonic() - last_sent > 15:
+                # Комментарий-heartbeat, чтобы прокси не закрыли соединение
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(settings.task_poll_interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @router.get("/get_text", summary="Получить текст")
-def get_text(doc_id: int, db: Session = Depends(get_db)):
-    """Получение распознанного текста"""
+def get_text(doc_id: int, request: Request, db: Session = Depends(get_db)):
+    """Получение распознанного текста
+
+    Поддерживает If-None-Match (304), большие тексты отдаются потоком из БД.
+    Пока многостраничный документ распознаётся - текст готовых страниц
+    с partial=true и progress.
+    """
     try:
-        # Проверяем, что документ существует
-        doc = db.query(Document).filter(Document.id == doc_id).first()
-        if not doc:
+        # Документ, версия и размер текста одним запросом; небольшой текст - сразу
+        meta = db.execute(queries.document_text_meta(doc_id, settings.text_stream_threshold)).first()
+        if meta is None:
             raise HTTPException(status_code=404, detail="Document not found")
 
-        # Получаем текст
-        text_record = db.query(DocumentText).filter(DocumentText.doc_id == doc_id).first()
-        text = text_record.text if text_record else ""
+        # Документ ещё распознаётся - отдаём готовые страницы и прогресс
+        if text_response.is_partial(meta):
+            pages = db.execute(queries.partial_pages(doc_id)).all()
+            return text_response.build(request, meta, text_response.iter_text_json, pages)
 
-        print(f"Текст для документа {doc_id}: {len(text)} символов")
-        return {"text": text}
+        print(f"Текст для документа {doc_id}: {meta.size or 0} байт")
+        return text_response.build(request, meta, text_response.iter_text_json)
 
     except HTTPException:
         raise
@@ -116,21 +528,188 @@ def get_text(doc_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка при получении текста: {str(e)}")
 
 
-@router.get("/documents", summary="Список всех документов")
-def list_documents(db: Session = Depends(get_db)):
-    """Получение списка всех документов"""
+@router.get("/words", summary="Слова документа с координатами")
+def get_words(
+    doc_id: int,
+    page: Optional[int] = Query(None, ge=0),
+    x0: Optional[int] = None,
+    y0: Optional[int] = None,
+    x1: Optional[int] = None,
+    y1: Optional[int] = None,
+    intersects: bool = False,
+    min_conf: Optional[int] = Query(None, ge=0, le=100),
+    max_conf: Optional[int] = Query(None, ge=0, le=100),
+    as_text: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Слова в области и/или диапазоне уверенности.
+
+    Область x0, y0, x1, y1 задаётся в пикселях страницы, переданной в OCR
+    (её размер - width/height в ответе). По умолчанию слово должно целиком
+    лежать в области, intersects=true - достаточно пересечения.
+    max_conf - строго меньше (например, max_conf=60 - слова с уверенностью ниже 60).
+    as_text=true - вместо списка слов текст, собранный по строкам.
+    """
+    try:
+        bbox = (x0, y0, x1, y1)
+        if any(v is None for v in bbox):
+            if any(v is not None for v in bbox):
+                raise HTTPException(status_code=400, detail="Область задаётся всеми четырьмя x0, y0, x1, y1")
+            bbox = None
+
+        query = db.query(DocumentWords).filter(DocumentWords.doc_id == doc_id)
+        if page is not None:
+            query = query.filter(DocumentWords.page_no == page)
+        rows = query.order_by(DocumentWords.page_no).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Words not found")
+
+        pages = []
+        for row in rows:
+            page_words = word_store.PageWords.unpack(row)
+            indexes = page_words.select(bbox, inside=not intersects, min_conf=min_conf, max_conf=max_conf)
+            result = {"page": row.page_no, "width": row.width, "height": row.height, "matched": len(indexes)}
+            if as_text:
+                result["text"] = page_words.text(indexes)
+            else:
+                result["words"] = page_words.to_dicts(indexes)
+            pages.append(result)
+
+        return {"doc_id": doc_id, "pages": pages}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Ошибка при получении слов документа: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении слов: {str(e)}")
+
+
+@router.get("/documents", summary="Список документов")
+def list_documents(
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    has_text: Optional[bool] = None,
+    prefix: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Постраничный список документов.
+
+    Keyset-пагинация по id: next_cursor из ответа передаётся в after_id следующего запроса.
+    has_text считается в том же запросе через EXISTS.
+    """
     try:
-        documents = db.query(Document).all()
+        rows = db.execute(queries.documents_page(after_id, limit, has_text, prefix)).all()
+        return queries.documents_page_response(rows, limit)
+    except Exception as e:
+        print(f"Ошибка при получении списка документов: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении списка: {str(e)}")
+
+
+@router.get("/search", summary="Поиск документов по тексту")
+def search_documents(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """Полнотекстовый поиск по распознанному тексту (русский и английский).
+
+    Результаты отсортированы по релевантности; сниппеты с подсветкой <b>...</b>
+    строятся только для документов текущей страницы.
+    """
+    try:
+        limit = min(limit, settings.search_max_limit)
+        tsquery = search.to_query(q)
+
+        # Сначала ранжируем по GIN-индексу и берём страницу, потом строим сниппеты
+        rank = func.ts_rank_cd(DocumentText.search_vector, tsquery).label("rank")
+        page = (
+            db.query(DocumentText.id.label("text_id"), rank)
+            .filter(DocumentText.search_vector.op("@@")(tsquery))
+            .order_by(rank.desc(), DocumentText.id)
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+        rows = (
+            db.query(
+                DocumentText.doc_id,
+                Document.filename,
+                page.c.rank,
+                # Сниппет - по тому же началу текста, что индексируется и что берётся у сжатых
+                search.headline(func.left(DocumentText.text, settings.search_max_chars), tsquery).label("snippet"),
+                DocumentText.text_zstd,
+                DocumentText.text_dict_id,
+            )
+            .join(page, page.c.text_id == DocumentText.id)
+            .join(Document, Document.id == DocumentText.doc_id)
+            .order_by(page.c.rank.desc(), DocumentText.id)
+            .all()
+        )
+        # Сжатые тексты: сниппеты по распакованным текстам страницы - одним запросом
+        snippets = search.headlines(db, {
+            row.doc_id: text_codec.decode(row.text_zstd, row.text_dict_id)[:settings.search_max_chars]
+            for row in rows if row.text_zstd is not None
+        }, tsquery)
+        results = [
+            {"doc_id": row.doc_id, "filename": row.filename, "rank": row.rank,
+             "snippet": snippets.get(row.doc_id, row.snippet)}
+            for row in rows
+        ]
         return {
-            "documents": [
+            "results": results,
+            "next_offset": offset + limit if len(rows) == limit else None,
+        }
+    except Exception as e:
+        print(f"Ошибка при поиске: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при поиске: {str(e)}")
+
+
+@router.get("/ocr_cache/stats", summary="Статистика кэша OCR")
+def ocr_cache_stats(db: Session = Depends(get_db)):
+    """Размер кэша OCR и число попаданий"""
+    try:
+        entries, hits = db.query(func.count(OcrCache.id), func.coalesce(func.sum(OcrCache.hits), 0)).one()
+        return {"entries": entries, "hits": hits, "max_entries": settings.ocr_cache_max_entries}
+    except Exception as e:
+        print(f"Ошибка при получении статистики кэша: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении статистики: {str(e)}")
+
+
+@router.get("/ocr_stats", summary="Время предобработки и OCR")
+def ocr_stats(doc_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Статистика одного документа или средние значения по корпусу для каждого набора шагов"""
+    try:
+        if doc_id is not None:
+            text_record = db.query(DocumentText).filter(DocumentText.doc_id == doc_id).first()
+            if not text_record:
+                raise HTTPException(status_code=404, detail="Text not found")
+            return {"doc_id": doc_id, "stats": text_record.ocr_stats}
+
+        stats = DocumentText.ocr_stats
+        rows = db.query(
+            stats["steps"].astext,
+            func.count(DocumentText.id),
+            func.avg(stats["ocr_ms"].astext.cast(Float)),
+            func.avg(stats["pixels_in"].astext.cast(Float)),
+            func.avg(stats["pixels_out"].astext.cast(Float)),
+        ).filter(stats.isnot(None)).group_by(stats["steps"].astext).all()
+
+        return {
+            "by_steps": [
                 {
-                    "id": doc.id,
-                    "filename": doc.filename,
-                    "has_text": bool(db.query(DocumentText).filter(DocumentText.doc_id == doc.id).first())
+                    "steps": steps,
+                    "documents": count,
+                    "avg_ocr_ms": round(avg_ocr_ms or 0, 2),
+                    "avg_pixels_in": round(avg_in or 0),
+                    "avg_pixels_out": round(avg_out or 0),
                 }
-                for doc in documents
+                for steps, count, avg_ocr_ms, avg_in, avg_out in rows
             ]
         }
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Ошибка при получении списка документов: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка при получении списка: {str(e)}")
\ No newline at end of file
+        print(f"Ошибка при получении статистики OCR: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении статистики: {str(e)}")
@@ -0,0 +1,66 @@
+"""Очереди (полосы) и приоритеты задач OCR.
+
+interactive - одиночные запросы пользователей, bulk - пакетный анализ.
+Приоритет внутри полосы (RabbitMQ x-max-priority) тем выше, чем меньше
+документ: маленький документ не ждёт за многостраничным архивом.
+Сами очереди и маршруты задач настраиваются в app/celery_worker.py.
+"""
+import os
+from typing import Optional
+
+from PIL import Image
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+MAX_PRIORITY = 9
+# Диапазоны приоритетов полос не пересекаются: interactive всегда впереди bulk
+LANE_PRIORITIES = {INTERACTIVE: (5, 9), BULK: (0, 4)}
+
+# Порог "большого" документа по пикселям и размеру файла
+LARGE_PIXELS = 50_000_000
+LARGE_BYTES = 50 * 1024 * 1024
+
+
+def estimate_cost(file_path: str) -> dict:
+    """Размер файла и число пикселей всех кадров - без декодирования изображения.
+
+    Для PDF и нераспознанных форматов pixels = None (оценка только по размеру файла).
+    """
+    cost = {"bytes": os.path.getsize(file_path), "pixels": None}
+    try:
+        with Image.open(file_path) as image:
+            # Image.open читает только заголовок
+            cost["pixels"] = image.width * image.height * getattr(image, "n_frames", 1)
+    except Exception:
+        pass
+    return cost
+
+
+def stored_cost(doc) -> Optional[dict]:
+    """Оценка, сохранённая при загрузке документа, или None для старых документов"""
+    if doc.file_size is None:
+        return None
+    return {"bytes": doc.file_size, "pixels": doc.pixels}
+
+
+def priority(lane: str, cost: Optional[dict], backlog: int = 0, fair_share: int = 0) -> int:
+    """Приоритет задачи: верх диапазона полосы для маленьких документов, низ - для больших.
+
+    backlog - сколько задач этого пользователя уже ждёт в полосе: каждые fair_share
+    задач понижают приоритет на единицу, так что очередь одного пользователя
+    перемежается с задачами остальных.
+    """
+    low, high = LANE_PRIORITIES[lane]
+    if not cost:
+        value = (low + high) // 2
+    else:
+        if cost["pixels"] is not None:
+            share = cost["pixels"] / LARGE_PIXELS
+        else:
+            share = cost["bytes"] / LARGE_BYTES
+        value = high - round(min(share, 1.0) * (high - low))
+    if fair_share:
+        value -= backlog // fair_share
+    return max(low, value)
@@ -0,0 +1,42 @@
+"""Полнотекстовый поиск по результатам OCR (PostgreSQL tsvector, русский + английский)"""
+from typing import Dict
+
+from sqlalchemy import Integer, Text, bindparam, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app.config import settings
+
+SEARCH_CONFIGS = ("russian", "english")
+
+HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=20, MinWords=5, StartSel=<b>, StopSel=</b>"
+
+
+def to_vector(text: str):
+    """tsvector текста для колонки document_texts.search_vector (скалярный подзапрос)"""
+    # tsvector ограничен 1 МБ - индексируем начало очень длинных текстов.
+    # Текст передаётся одним параметром, обе конфигурации читают его из подзапроса
+    source = select(literal(text[:settings.search_max_chars], Text).label("text")).subquery()
+    vectors = [func.to_tsvector(config, source.c.text) for config in SEARCH_CONFIGS]
+    return select(vectors[0].op("||")(vectors[1])).scalar_subquery()
+
+
+def to_query(query: str):
+    """tsquery: совпадение по русской ИЛИ английской морфологии"""
+    queries = [func.websearch_to_tsquery(config, query) for config in SEARCH_CONFIGS]
+    return queries[0].op("||")(queries[1])
+
+
+def headline(text_column, tsquery):
+    return func.ts_headline(SEARCH_CONFIGS[0], text_column, tsquery, HEADLINE_OPTIONS)
+
+
+def headlines(db, texts: Dict[int, str], tsquery) -> Dict[int, str]:
+    """Сниппеты для нескольких текстов, переданных параметром (сжатые в БД), одним запросом"""
+    if not texts:
+        return {}
+    # Два unnest в одном SELECT разворачиваются параллельно: (id, текст)
+    source = select(
+        func.unnest(bindparam("headline_ids", list(texts), type_=ARRAY(Integer))).label("id"),
+        func.unnest(bindparam("headline_texts", list(texts.values()), type_=ARRAY(Text))).label("text"),
+    ).subquery()
+    return dict(db.execute(select(source.c.id, headline(source.c.text, tsquery))).all())
@@ -0,0 +1,195 @@
+"""Хранилище файлов документов с адресацией по содержимому.
+
+Файл лежит в documents_dir под ключом ab/cd/<sha256>: два уровня по 256
+подкаталогов, так что в каталоге остаются тысячи файлов даже при миллионах
+документов, а одинаковые имена разных файлов не конфликтуют. Одинаковые файлы
+хранятся один раз; файл удаляется вместе с последним документом, который на
+него ссылается. Размещение и удаление файла с одним ключом сериализуются
+advisory-блокировкой Postgres.
+
+Документы, загруженные до появления ключей (storage_key IS NULL), читаются из
+плоского каталога по имени файла; перенести их в шарды:
+    python -m app.storage migrate --batch 500
+"""
+import argparse
+import os
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app import ocr_cache, scheduling
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Document
+
+TMP_DIR = "tmp"
+
+
+def key_for(file_hash: str) -> str:
+    return f"{file_hash[:2]}/{file_hash[2:4]}/{file_hash}"
+
+
+def path_for_key(key: str) -> str:
+    return os.path.join(settings.documents_dir, key)
+
+
+def legacy_path(filename: str) -> str:
+    return os.path.join(settings.documents_dir, os.path.basename(filename))
+
+
+def path_of(doc) -> str:
+    """Путь к файлу документа (строка documents или строка с filename и storage_key)"""
+    if doc.storage_key:
+        return path_for_key(doc.storage_key)
+    return legacy_path(doc.filename)
+
+
+def new_temp() -> Tuple[BinaryIO, str]:
+    """Временный файл для загрузки - в том же разделе, чтобы place() был переименованием"""
+    directory = os.path.join(settings.documents_dir, TMP_DIR)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+def save(src: BinaryIO) -> Tuple[str, str]:
+    """Копирует поток во временный файл, возвращает (путь, sha256)"""
+    buffer, tmp_path = new_temp()
+    try:
+        with buffer:
+            file_hash = ocr_cache.copy_and_hash(src, buffer)
+    except Exception:
+        discard(tmp_path)
+        raise
+    return tmp_path, file_hash
+
+
+def discard(tmp_path: str) -> None:
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+def lock(db: Session, key: str) -> None:
+    """Блокировка ключа до конца транзакции: размещение и удаление одного файла не пересекаются"""
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"storage:{key}"})
+
+
+def place(tmp_path: str, key: str) -> None:
+    """Переносит загруженный файл под ключ (вызывать под lock).
+
+    Такой файл уже может лежать там от другого документа - содержимое то же,
+    атомарная замена не мешает тем, кто его сейчас читает.
+    """
+    path = path_for_key(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+def create_document(db: Session, filename: str, file_hash: str, tmp_path: str) -> Document:
+    """Размещает загруженный файл и создаёт документ"""
+    key = key_for(file_hash)
+    try:
+        # Оценка для приоритета задач: пакетный анализ не читает файлы
+        cost = scheduling.estimate_cost(tmp_path)
+        lock(db, key)
+        place(tmp_path, key)
+        doc = Document(filename=filename, file_hash=file_hash, storage_key=key,
+                       file_size=cost["bytes"], pixels=cost["pixels"])
+        db.add(doc)
+        db.commit()
+    except Exception:
+        db.rollback()
+        discard(tmp_path)
+        raise
+    return doc
+
+
+def delete_document(db: Session, doc: Document) -> Optional[str]:
+    """Удаляет документ и его файл, если на файл больше никто не ссылается.
+
+    Возвращает путь удалённого файла или None.
+    """
+    removed = None
+    if doc.storage_key:
+        lock(db, doc.storage_key)
+        shared = db.execute(
+            select(func.count()).select_from(Document)
+            .where(Document.storage_key == doc.storage_key, Document.id != doc.id)
+        ).scalar()
+        db.delete(doc)
+        db.flush()
+        # Удаляем под блокировкой: загрузка того же файла дождётся commit
+        if not shared and os.path.exists(path_for_key(doc.storage_key)):
+            removed = path_for_key(doc.storage_key)
+            os.remove(removed)
+        db.commit()
+        return removed
+
+    db.delete(doc)
+    db.commit()
+    path = legacy_path(doc.filename)
+    if os.path.exists(path):
+        os.remove(path)
+        removed = path
+    return removed
+
+
+def migrate(db: Session, batch: int) -> None:
+    """Переносит файлы документов без storage_key из плоского каталога в шарды"""
+    moved = missing = 0
+    last_id = 0
+    while True:
+        docs = (
+            db.query(Document)
+            .filter(Document.id > last_id, Document.storage_key.is_(None))
+            .order_by(Document.id)
+            .limit(batch)
+            .all()
+        )
+        if not docs:
+            break
+        for doc in docs:
+            last_id = doc.id
+            path = legacy_path(doc.filename)
+            if not os.path.exists(path):
+                missing += 1
+                continue
+            if not doc.file_hash:
+                doc.file_hash = ocr_cache.file_sha256(path)
+            if doc.file_size is None:
+                cost = scheduling.estimate_cost(path)
+                doc.file_size, doc.pixels = cost["bytes"], cost["pixels"]
+            key = key_for(doc.file_hash)
+            lock(db, key)
+            target = path_for_key(key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Старое имя могут читать другие документы с тем же filename - копия через link
+            if not os.path.exists(target):
+                os.link(path, target)
+            doc.storage_key = key
+            db.commit()
+            moved += 1
+        print(f"Перенесено {moved} файлов (до id {last_id}), не найдено {missing}")
+
+    print(f"Готово: перенесено {moved}, не найдено {missing}. "
+          f"Файлы в корне {settings.documents_dir} можно удалить после проверки")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="перенести файлы в шарды")
+    migrate_parser.add_argument("--batch", type=int, default=500)
+
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        migrate(db, args.batch)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Состояние задачи анализа для каждого документа: queued -> running -> done/failed"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, false, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import DocumentTask
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+
+def claim(db: Session, doc_ids: Iterable[int], config: str, lane: Optional[str] = None,
+          owner: Optional[str] = None, priorities: Optional[Dict[int, int]] = None,
+          stale_after: int = 0) -> Dict[int, str]:
+    """Ставит документы в очередь, если для них ещё нет задачи с тем же конфигом.
+
+    Строка document_tasks - блокировка на уровне БД: новая задача (новый task_id)
+    создаётся, только если прошлая завершилась, зависла дольше stale_after секунд
+    или запускалась с другим конфигом. Иначе повторный запрос присоединяется к ней.
+    Возвращает {doc_id: task_id} для документов, задачи которых нужно отправить.
+    Не делает commit.
+    """
+    now = datetime.utcnow()
+    priorities = priorities or {}
+    rows = [
+        {"doc_id": doc_id, "state": QUEUED, "config": config, "task_id": uuid.uuid4().hex, "queued_at": now,
+         "lane": lane, "owner": owner, "priority": priorities.get(doc_id)}
+        for doc_id in doc_ids
+    ]
+    if not rows:
+        return {}
+    stmt = insert(DocumentTask).values(rows)
+    current = DocumentTask.__table__.c
+    restart = or_(
+        current.state.in_(FINISHED_STATES),
+        current.config.is_distinct_from(stmt.excluded.config),
+        and_(current.state == RUNNING, current.started_at < now - timedelta(seconds=stale_after))
+        if stale_after else false(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DocumentTask.doc_id],
+        set_={
+            "state": QUEUED, "queued_at": now, "started_at": None, "finished_at": None, "error": None,
+            "pages_total": None, "pages_done": 0, "config": stmt.excluded.config, "task_id": stmt.excluded.task_id,
+            "lane": stmt.excluded.lane, "owner": stmt.excluded.owner, "priority": stmt.excluded.priority,
+        },
+        where=restart,
+    ).returning(DocumentTask.doc_id, DocumentTask.task_id)
+    return dict(db.execute(stmt).all())
+
+
+def is_current(db: Session, doc_id: int, task_id: Optional[str], lock: bool = False) -> bool:
+    """Задача task_id всё ещё актуальна (не заменена более новым запуском).
+
+    lock=True - строка блокируется до конца транзакции, запись результата
+    не пересечётся с новым claim. Задачи без task_id считаются актуальными.
+    """
+    if task_id is None:
+        return True
+    query = db.query(DocumentTask.task_id).filter(DocumentTask.doc_id == doc_id)
+    if lock:
+        query = query.with_for_update()
+    return query.scalar() == task_id
+
+
+def is_active(db: Session, doc_id: int, task_id: Optional[str], lock: bool = False) -> bool:
+    """Запуск task_id актуален и ещё не завершён - его подзадачам есть что делать.
+
+    После ошибки одной страницы (или склейки) остальные страницы запуска не нужны.
+    """
+    query = db.query(DocumentTask.task_id, DocumentTask.state).filter(DocumentTask.doc_id == doc_id)
+    if lock:
+        query = query.with_for_update()
+    row = query.first()
+    if row is None:
+        return task_id is None
+    return (task_id is None or row.task_id == task_id) and row.state not in FINISHED_STATES
+
+
+def owner_backlog(db: Session, owner: Optional[str], lane: str) -> int:
+    """Сколько задач пользователя ждёт в полосе"""
+    if not owner:
+        return 0
+    return db.query(func.count()).select_from(DocumentTask).filter(
+        DocumentTask.owner == owner, DocumentTask.lane == lane, DocumentTask.state == QUEUED
+    ).scalar()
+
+
+def mark_running(db: Session, doc_id: int, owner_limit: int = 0, stale_after: int = 0) -> Optional[float]:
+    """Переводит задачу в running, возвращает ожидание в очереди в секундах.
+
+    Если у владельца уже owner_limit задач в работе, возвращает None: задачу нужно отложить.
+    """
+    now = datetime.utcnow()
+    owner = db.query(DocumentTask.owner).filter(DocumentTask.doc_id == doc_id).scalar()
+    if owner and owner_limit:
+        # Подсчёт и захват слота для владельца - под одной advisory-блокировкой
+        db.execute(select(func.pg_advisory_xact_lock(func.hashtext(owner))))
+        running = db.query(func.count()).select_from(DocumentTask).filter(
+            DocumentTask.owner == owner,
+            DocumentTask.state == RUNNING,
+            DocumentTask.doc_id != doc_id,
+            DocumentTask.started_at > now - timedelta(seconds=stale_after),
+        ).scalar()
+        if running >= owner_limit:
+            db.rollback()
+            return None
+
+    queued_at = db.execute(
+        update(DocumentTask)
+        .where(DocumentTask.doc_id == doc_id)
+        .values(state=RUNNING, started_at=now)
+        .returning(DocumentTask.queued_at)
+    ).scalar()
+    db.commit()
+    return max(0.0, (now - queued_at).total_seconds()) if queued_at else 0.0
+
+
+def set_pages(db: Session, doc_id: int, pages_total: int, pages_done: int = 0) -> None:
+    """Число страниц запуска (не делает commit)"""
+    db.query(DocumentTask).filter(DocumentTask.doc_id == doc_id).update(
+        {"pages_total": pages_total, "pages_done": pages_done}, synchronize_session=False
+    )
+
+
+def page_done(db: Session, doc_id: int, task_id: Optional[str]) -> None:
+    """+1 распознанная страница - в транзакции, сохраняющей страницу (не делает commit)"""
+    query = db.query(DocumentTask).filter(DocumentTask.doc_id == doc_id)
+    if task_id is not None:
+        query = query.filter(DocumentTask.task_id == task_id)
+    query.update({"pages_done": DocumentTask.pages_done + 1}, synchronize_session=False)
+
+
+def progress(pages_done: Optional[int], pages_total: Optional[int]) -> Optional[dict]:
+    if not pages_total:
+        return None
+    done = min(pages_done or 0, pages_total)
+    return {"pages_done": done, "pages_total": pages_total, "fraction": round(done / pages_total, 4)}
+
+
+def mark_deferred(db: Session, doc_id: int, task_id: Optional[str] = None) -> bool:
+    """Задача отложена до освобождения памяти воркера - снова ждёт в очереди.
+
+    False - задачу уже заменил новый запуск, его состояние не тронуто.
+    """
+    query = db.query(DocumentTask).filter(DocumentTask.doc_id == doc_id)
+    if task_id is not None:
+        query = query.filter(DocumentTask.task_id == task_id)
+    updated = query.update({"state": QUEUED, "started_at": None}, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+
+def mark_finished(db: Session, doc_id: int, success: bool, error: Optional[str] = None,
+                  task_id: Optional[str] = None) -> bool:
+    """Фиксирует итог; False - задачу уже заменил новый запуск, итог не записан"""
+    query = db.query(DocumentTask).filter(DocumentTask.doc_id == doc_id)
+    if task_id is not None:
+        query = query.filter(DocumentTask.task_id == task_id)
+    updated = query.update(
+        {"state": DONE if success else FAILED, "finished_at": datetime.utcnow(), "error": error},
+        synchronize_session=False,
+    )
+    db.commit()
+    return bool(updated)
+
+
+def _ms(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds() * 1000, 1)
+
+
+def to_dict(task: DocumentTask) -> dict:
+    """Состояние задачи с длительностями ожидания в очереди и выполнения"""
+    return {
+        "doc_id": task.doc_id,
+        "state": task.state,
+        "config": task.config,
+        "lane": task.lane,
+        "priority": task.priority,
+        "queued_at": task.queued_at.isoformat() if task.queued_at else None,
+        "started_at": task.started_at.isoformat() if task.started_at else None,
+        "finished_at": task.finished_at.isoformat() if task.finished_at else None,
+        "progress": progress(task.pages_done, task.pages_total),
+        "queue_ms": _ms(task.queued_at, task.started_at),
+        "run_ms": _ms(task.started_at, task.finished_at),
+        "error": task.error,
+    }
+
+
+def queue_wait_stats(db: Session, since: datetime) -> list:
+    """Ожидание в очереди (queued_at -> started_at) по полосам для задач, начатых после since"""
+    wait_ms = func.extract("epoch", DocumentTask.started_at - DocumentTask.queued_at) * 1000
+    started = db.execute(
+        select(
+            DocumentTask.lane,
+            func.count(),
+            func.avg(wait_ms),
+            func.percentile_cont(0.5).within_group(wait_ms),
+            func.percentile_cont(0.95).within_group(wait_ms),
+            func.max(wait_ms),
+        )
+        .where(DocumentTask.started_at >= since, DocumentTask.queued_at.isnot(None))
+        .group_by(DocumentTask.lane)
+    ).all()
+    waiting = dict(db.execute(
+        select(DocumentTask.lane, func.count()).where(DocumentTask.state == QUEUED).group_by(DocumentTask.lane)
+    ).all())
+
+    lanes = []
+    for lane, count, avg_ms, p50_ms, p95_ms, max_ms in started:
+        lanes.append({
+            "lane": lane,
+            "started": count,
+            "waiting": waiting.pop(lane, 0),
+            "avg_wait_ms": round(avg_ms or 0, 1),
+            "p50_wait_ms": round(p50_ms or 0, 1),
+            "p95_wait_ms": round(p95_ms or 0, 1),
+            "max_wait_ms": round(max_ms or 0, 1),
+        })
+    lanes.extend({"lane": lane, "started": 0, "waiting": count} for lane, count in waiting.items())
+    return lanes
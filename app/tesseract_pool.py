@@ -0,0 +1,138 @@
+"""Пул долгоживущих движков tesseract в процессе воркера.
+
+Вместо запуска отдельного процесса tesseract на каждый документ (pytesseract)
+движки tesserocr создаются один раз с уже загруженными языковыми моделями и
+переиспользуются. Движок пересоздаётся после ошибки, после max_uses страниц
+или когда RSS процесса превышает max_rss_mb.
+"""
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from tesserocr import PyTessBaseAPI
+
+from app.config import settings
+
+
+def current_rss_mb() -> float:
+    """Текущий RSS процесса в МБ (Linux)"""
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class _Engine:
+    def __init__(self, api: PyTessBaseAPI):
+        self.api = api
+        self.uses = 0
+
+
+class TesseractPool:
+    def __init__(self, size: int, lang: str, psm: int, max_uses: int, max_rss_mb: int):
+        self.size = size
+        self.lang = lang
+        self.psm = psm
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.recycled = 0
+
+    def _create(self) -> _Engine:
+        return _Engine(PyTessBaseAPI(lang=self.lang, psm=self.psm))
+
+    def _acquire(self) -> _Engine:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        return self._idle.get()
+
+    def _release(self, engine: _Engine, healthy: bool) -> None:
+        engine.uses += 1
+        if healthy and engine.uses < self.max_uses and current_rss_mb() < self.max_rss_mb:
+            engine.api.Clear()
+            self._idle.put(engine)
+            return
+
+        # Пересоздаём движок сразу, чтобы пул оставался прогретым
+        engine.api.End()
+        self.recycled += 1
+        print(f"Движок tesseract пересоздан после {engine.uses} использований (healthy={healthy})")
+        try:
+            self._idle.put(self._create())
+        except Exception as e:
+            print(f"Не удалось пересоздать движок tesseract: {e}")
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def engine(self):
+        """Выдаёт прогретый PyTessBaseAPI на время распознавания"""
+        engine = self._acquire()
+        healthy = True
+        try:
+            yield engine.api
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self._release(engine, healthy)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().api.End()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool: Optional[TesseractPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> TesseractPool:
+    """Пул текущего процесса (создаётся при первом обращении)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = TesseractPool(
+                    size=settings.ocr_engine_pool_size,
+                    lang=settings.ocr_lang,
+                    psm=settings.ocr_psm,
+                    max_uses=settings.ocr_engine_max_uses,
+                    max_rss_mb=settings.ocr_engine_max_rss_mb,
+                )
+    return _pool
+
+
+def warm_up() -> None:
+    """Создаёт первый движок заранее, чтобы модели загрузились до первой задачи"""
+    with get_pool().engine():
+        pass
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
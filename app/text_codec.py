@@ -0,0 +1,291 @@
+"""Сжатие текстов document_texts в zstd, опционально с обученным словарём.
+
+Сжатый текст лежит в text_zstd (text при этом NULL), id словаря - в text_dict_id.
+encode() даёт значения колонок для новой записи, text_of()/Decoder - обычный текст
+для чтения, так что маршруты и поиск не зависят от способа хранения.
+
+CLI (из корня репозитория, БД из DATABASE_URL):
+    python -m app.text_codec train --samples 2000 --size 112640
+    python -m app.text_codec migrate --batch 500 --dict-id 1
+    python -m app.text_codec report --sample 200
+    python -m app.text_codec storage --external
+"""
+import argparse
+import codecs
+import statistics
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import zstandard
+from sqlalchemy import func, select, text, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import DocumentText, TextDictionary
+
+# Словари процесса по id: грузятся из БД при первом обращении и не меняются
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+# Компрессоры zstd не потокобезопасны - свои в каждом потоке
+_local = threading.local()
+
+SAMPLE_CHUNK_BYTES = 4096
+
+
+def get_dictionary(dict_id: Optional[int]) -> Optional[zstandard.ZstdCompressionDict]:
+    if dict_id is None:
+        return None
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        with _dictionaries_lock:
+            dictionary = _dictionaries.get(dict_id)
+            if dictionary is None:
+                db = SessionLocal()
+                try:
+                    data = db.query(TextDictionary.data).filter(TextDictionary.id == dict_id).scalar()
+                finally:
+                    db.close()
+                if data is None:
+                    raise LookupError(f"Словарь zstd {dict_id} не найден")
+                dictionary = _dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+    return dictionary
+
+
+def _compressor(dict_id: Optional[int], level: int) -> zstandard.ZstdCompressor:
+    compressors = _local.__dict__.setdefault("compressors", {})
+    compressor = compressors.get((dict_id, level))
+    if compressor is None:
+        dictionary = get_dictionary(dict_id)
+        compressor = compressors[(dict_id, level)] = (
+            zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+            if dictionary is not None else zstandard.ZstdCompressor(level=level)
+        )
+    return compressor
+
+
+def _decompressor(dict_id: Optional[int]) -> zstandard.ZstdDecompressor:
+    decompressors = _local.__dict__.setdefault("decompressors", {})
+    decompressor = decompressors.get(dict_id)
+    if decompressor is None:
+        dictionary = get_dictionary(dict_id)
+        decompressor = decompressors[dict_id] = (
+            zstandard.ZstdDecompressor(dict_data=dictionary)
+            if dictionary is not None else zstandard.ZstdDecompressor()
+        )
+    return decompressor
+
+
+def compress(text: str, dict_id: Optional[int], level: Optional[int] = None) -> bytes:
+    return _compressor(dict_id, level or settings.text_compression_level).compress(text.encode("utf-8"))
+
+
+def encode(text: str) -> dict:
+    """Значения колонок text/text_zstd/text_dict_id для новой записи по настройкам"""
+    if not settings.text_compression or len(text.encode("utf-8")) < settings.text_compress_min_bytes:
+        return {"text": text, "text_zstd": None, "text_dict_id": None}
+    dict_id = settings.text_zstd_dict_id
+    return {"text": None, "text_zstd": compress(text, dict_id), "text_dict_id": dict_id}
+
+
+def decode(data: bytes, dict_id: Optional[int]) -> str:
+    return _decompressor(dict_id).decompress(data).decode("utf-8")
+
+
+def decoded_size(data: bytes) -> int:
+    """Размер исходного текста в байтах из заголовка кадра (-1, если не записан)"""
+    return zstandard.frame_content_size(data)
+
+
+def text_of(row) -> str:
+    """Текст строки document_texts независимо от способа хранения"""
+    if row.text_zstd is not None:
+        return decode(row.text_zstd, row.text_dict_id)
+    return row.text or ""
+
+
+class Decoder:
+    """Потоковая распаковка: куски сжатых байт -> куски текста (UTF-8 не рвётся на границах)"""
+
+    def __init__(self, dict_id: Optional[int]):
+        self._zstd = _decompressor(dict_id).decompressobj()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, data: bytes) -> str:
+        return self._utf8.decode(self._zstd.decompress(data))
+
+    def flush(self) -> str:
+        return self._utf8.decode(b"", final=True)
+
+
+def _sample_chunks(texts: Iterable[str]) -> List[bytes]:
+    # zstd обучается на множестве небольших образцов - режем тексты на куски
+    chunks = []
+    for sample in texts:
+        data = sample.encode("utf-8")
+        chunks.extend(data[i:i + SAMPLE_CHUNK_BYTES] for i in range(0, len(data), SAMPLE_CHUNK_BYTES))
+    return chunks
+
+
+def train(db, samples: int, size: int) -> int:
+    """Обучает словарь на случайной выборке текстов и сохраняет его, возвращает id"""
+    rows = db.execute(
+        select(DocumentText.text, DocumentText.text_zstd, DocumentText.text_dict_id)
+        .where((DocumentText.text.isnot(None)) | (DocumentText.text_zstd.isnot(None)))
+        .order_by(func.random())
+        .limit(samples)
+    ).all()
+    chunks = _sample_chunks(text_of(row) for row in rows)
+    if not chunks:
+        raise ValueError("Нет текстов для обучения словаря")
+
+    dictionary = zstandard.train_dictionary(size, chunks, level=settings.text_compression_level)
+    record = TextDictionary(data=dictionary.as_bytes(), samples=len(rows))
+    db.add(record)
+    db.commit()
+
+    raw = sum(len(chunk) for chunk in chunks)
+    plain = zstandard.ZstdCompressor(level=settings.text_compression_level)
+    with_dict = zstandard.ZstdCompressor(level=settings.text_compression_level, dict_data=dictionary)
+    plain_size = sum(len(plain.compress(chunk)) for chunk in chunks)
+    dict_size = sum(len(with_dict.compress(chunk)) for chunk in chunks)
+    print(f"Словарь {record.id}: {len(dictionary.as_bytes())} байт, {len(rows)} текстов, {len(chunks)} образцов")
+    print(f"Куски по {SAMPLE_CHUNK_BYTES} байт: без словаря x{raw / plain_size:.2f}, со словарём x{raw / dict_size:.2f}")
+    return record.id
+
+
+def migrate(db, batch: int, dict_id: Optional[int], level: int) -> None:
+    """Сжимает существующие несжатые тексты пакетами (keyset по id, commit на пакет).
+
+    Строки пакета блокируются до commit (FOR UPDATE SKIP LOCKED): повторный анализ
+    документа ждёт, пока пакет запишется, и не теряет новый текст, а строки, которые
+    сейчас пишет анализ, пропускаются (их сожмёт следующий запуск). version
+    увеличивается - ETag текста меняется вместе с его представлением.
+    """
+    size = func.octet_length(DocumentText.text)
+    bytes_before = bytes_after = rows_done = 0
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        rows = db.execute(
+            select(DocumentText.id, DocumentText.text, DocumentText.version)
+            .where(
+                DocumentText.id > last_id,
+                DocumentText.text_zstd.is_(None),
+                size >= settings.text_compress_min_bytes,
+            )
+            .order_by(DocumentText.id)
+            .limit(batch)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            break
+
+        values = []
+        for row in rows:
+            data = compress(row.text, dict_id, level)
+            bytes_before += len(row.text.encode("utf-8"))
+            bytes_after += len(data)
+            values.append({"id": row.id, "text": None, "text_zstd": data, "text_dict_id": dict_id,
+                           "version": row.version + 1})
+        db.execute(update(DocumentText), values)
+        db.commit()
+
+        rows_done += len(rows)
+        last_id = rows[-1].id
+        print(f"Сжато {rows_done} текстов (до id {last_id}), {bytes_before} -> {bytes_after} байт")
+
+    elapsed = time.perf_counter() - started
+    if rows_done:
+        print(f"Готово: {rows_done} текстов за {elapsed:.1f} с, {bytes_before / 2 ** 20:.1f} МБ -> "
+              f"{bytes_after / 2 ** 20:.1f} МБ (x{bytes_before / max(bytes_after, 1):.2f})")
+        print("Место в таблице освобождается после VACUUM (полностью - VACUUM FULL)")
+    else:
+        print("Несжатых текстов не осталось")
+
+
+def set_storage(db, external: bool) -> None:
+    """Режим TOAST колонки text (см. text_storage_external); меняет только описание колонки"""
+    mode = "EXTERNAL" if external else "EXTENDED"
+    db.execute(text(f"ALTER TABLE document_texts ALTER COLUMN text SET STORAGE {mode}"))
+    db.commit()
+    print(f"document_texts.text: STORAGE {mode} (для новых строк; существующие - после перезаписи)")
+
+
+def _read_latencies(db, ids: List[int]) -> List[float]:
+    latencies = []
+    for text_id in ids:
+        started = time.perf_counter()
+        row = db.execute(
+            select(DocumentText.text, DocumentText.text_zstd, DocumentText.text_dict_id)
+            .where(DocumentText.id == text_id)
+        ).first()
+        text_of(row)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def report(db, sample: int) -> None:
+    """Место под тексты и задержка чтения (выборка + распаковка) для обоих способов хранения"""
+    totals = db.execute(
+        select(
+            func.count(DocumentText.text),
+            func.coalesce(func.sum(func.octet_length(DocumentText.text)), 0),
+            func.count(DocumentText.text_zstd),
+            func.coalesce(func.sum(func.octet_length(DocumentText.text_zstd)), 0),
+            func.pg_total_relation_size("document_texts"),
+        )
+    ).one()
+    plain_rows, plain_bytes, zstd_rows, zstd_bytes, relation_bytes = totals
+    print(f"Несжатых: {plain_rows} ({plain_bytes / 2 ** 20:.1f} МБ), "
+          f"сжатых: {zstd_rows} ({zstd_bytes / 2 ** 20:.1f} МБ), "
+          f"таблица с TOAST и индексами: {relation_bytes / 2 ** 20:.1f} МБ")
+
+    for title, column in (("несжатые", DocumentText.text), ("zstd", DocumentText.text_zstd)):
+        ids = db.execute(
+            select(DocumentText.id).where(column.isnot(None)).order_by(func.random()).limit(sample)
+        ).scalars().all()
+        if not ids:
+            continue
+        latencies = _read_latencies(db, ids)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Чтение ({title}, {len(ids)} текстов): p50 {statistics.median(latencies):.2f} мс, p95 {p95:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="обучить словарь на текстах из БД")
+    train_parser.add_argument("--samples", type=int, default=2000, help="сколько текстов взять")
+    train_parser.add_argument("--size", type=int, default=112640, help="размер словаря в байтах")
+
+    migrate_parser = commands.add_parser("migrate", help="сжать существующие тексты")
+    migrate_parser.add_argument("--batch", type=int, default=500)
+    migrate_parser.add_argument("--dict-id", type=int, default=settings.text_zstd_dict_id)
+    migrate_parser.add_argument("--level", type=int, default=settings.text_compression_level)
+
+    report_parser = commands.add_parser("report", help="место и задержка чтения")
+    report_parser.add_argument("--sample", type=int, default=200)
+
+    storage_parser = commands.add_parser("storage", help="режим TOAST колонки text по настройкам")
+    storage_parser.add_argument("--external", action=argparse.BooleanOptionalAction,
+                                default=settings.text_storage_external)
+
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        if args.command == "train":
+            train(db, args.samples, args.size)
+        elif args.command == "migrate":
+            migrate(db, args.batch, args.dict_id, args.level)
+        elif args.command == "storage":
+            set_storage(db, args.external)
+        else:
+            report(db, args.sample)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Ответ /get_text: ETag, 304 и потоковая отдача больших текстов из БД"""
+import json
+from typing import AsyncIterator, Iterator, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app import queries, task_state, text_codec
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+
+
+def etag(doc_id: int, version: Optional[int], partial_of: Optional[str] = None, pages_done: int = 0) -> str:
+    # Повторный анализ перезаписывает строку document_texts (upsert) и увеличивает version;
+    # у частичного текста версия - запуск и число готовых страниц
+    if partial_of is not None:
+        return f'W/"{doc_id}-0-{partial_of[:8]}-p{pages_done}"'
+    return f'W/"{doc_id}-{version or 0}"'
+
+
+def is_partial(meta) -> bool:
+    """Текста ещё нет, но часть страниц уже распознана"""
+    return meta.text_id is None and meta.state in (task_state.QUEUED, task_state.RUNNING) and bool(meta.pages_done)
+
+
+def is_not_modified(request: Request, current_etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or current_etag in [tag.strip() for tag in header.split(",")]
+
+
+def _json_prefix() -> str:
+    return '{"text": "'
+
+
+_JSON_SUFFIX = '", "partial": false}'
+
+
+def _json_piece(chunk: str) -> str:
+    # Экранирование как в json.dumps, без обрамляющих кавычек
+    return json.dumps(chunk, ensure_ascii=False)[1:-1]
+
+
+def iter_text_json(meta) -> Iterator[str]:
+    """{"text": "..."} по кускам text_stream_chunk символов (сжатый текст - распаковывая на ходу)"""
+    chunk_size = settings.text_stream_chunk
+    yield _json_prefix()
+    if meta.text_zstd is not None:
+        # Сжатые байты уже получены вместе с метаданными
+        decoder = text_codec.Decoder(meta.text_dict_id)
+        for start in range(0, len(meta.text_zstd), chunk_size):
+            yield _json_piece(decoder.feed(meta.text_zstd[start:start + chunk_size]))
+        yield _json_piece(decoder.flush())
+        yield _JSON_SUFFIX
+        return
+
+    db = SessionLocal()
+    try:
+        # Все куски - из одного снимка: параллельная перезапись текста не смешает версии
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        storage = db.execute(queries.text_storage(meta.text_id)).first()
+        decoder = text_codec.Decoder(storage.text_dict_id) if storage and storage.compressed else None
+        query = queries.text_zstd_chunk if decoder else queries.text_chunk
+        start = 1
+        while storage:
+            chunk = db.execute(query(meta.text_id, start, chunk_size)).scalar() or ""
+            if chunk:
+                yield _json_piece(decoder.feed(chunk) if decoder else chunk)
+            if len(chunk) < chunk_size:
+                break
+            start += chunk_size
+    finally:
+        db.close()
+    if decoder:
+        yield _json_piece(decoder.flush())
+    yield _JSON_SUFFIX
+
+
+async def aiter_text_json(meta) -> AsyncIterator[str]:
+    if meta.text_zstd is not None:
+        for piece in iter_text_json(meta):
+            yield piece
+        return
+
+    chunk_size = settings.text_stream_chunk
+    yield _json_prefix()
+    async with AsyncSessionLocal() as db:
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        storage = (await db.execute(queries.text_storage(meta.text_id))).first()
+        decoder = text_codec.Decoder(storage.text_dict_id) if storage and storage.compressed else None
+        query = queries.text_zstd_chunk if decoder else queries.text_chunk
+        start = 1
+        while storage:
+            chunk = (await db.execute(query(meta.text_id, start, chunk_size))).scalar() or ""
+            if chunk:
+                yield _json_piece(decoder.feed(chunk) if decoder else chunk)
+            if len(chunk) < chunk_size:
+                break
+            start += chunk_size
+    if decoder:
+        yield _json_piece(decoder.flush())
+    yield _JSON_SUFFIX
+
+
+def headers(current_etag: str) -> dict:
+    # no-cache: клиент хранит ответ, но каждый раз перепроверяет ETag
+    return {"ETag": current_etag, "Cache-Control": "no-cache"}
+
+
+def build(request: Request, meta, stream, pages: Optional[Sequence] = None) -> Response:
+    """304, потоковый или обычный JSON-ответ по строке queries.document_text_meta.
+
+    pages - строки queries.partial_pages, если is_partial(meta): пока документ
+    распознаётся, отдаётся текст готовых страниц и прогресс.
+    """
+    if pages is not None:
+        current_etag = etag(meta.id, None, meta.task_id or "", meta.pages_done)
+        if is_not_modified(request, current_etag):
+            return Response(status_code=304, headers=headers(current_etag))
+        return JSONResponse({
+            "text": "".join(page.text or "" for page in pages),
+            "partial": True,
+            "pages": [page.page_no for page in pages],
+            "progress": task_state.progress(meta.pages_done, meta.pages_total),
+        }, headers=headers(current_etag))
+
+    current_etag = etag(meta.id, meta.version)
+    if is_not_modified(request, current_etag):
+        return Response(status_code=304, headers=headers(current_etag))
+    if meta.text_zstd is not None and 0 <= text_codec.decoded_size(meta.text_zstd) <= settings.text_stream_threshold:
+        text = text_codec.decode(meta.text_zstd, meta.text_dict_id)
+        return JSONResponse({"text": text, "partial": False}, headers=headers(current_etag))
+    if meta.text_id is not None and meta.text is None and (meta.size is not None or meta.zstd_size is not None):
+        return StreamingResponse(stream(meta), media_type="application/json", headers=headers(current_etag))
+    return JSONResponse({"text": meta.text or "", "partial": False}, headers=headers(current_etag))
@@ -0,0 +1,318 @@
+"""Трассировка запроса через сервисы: Django -> FastAPI -> RabbitMQ -> воркер Celery.
+
+Контекст передаётся заголовком W3C traceparent (00-<trace_id>-<span_id>-<флаги>):
+Django создаёт трассу в middleware и передаёт её в запросах к FastAPI
+(django_app/tracing.py), маршруты FastAPI (metrics.TimedRoute) продолжают её,
+а при отправке задачи Celery контекст и время отправки уходят в заголовках
+сообщения. Воркер записывает ожидание в очереди и выполнение задачи.
+
+Спаны - строки JSON в файлах spans-*.jsonl в trace_dir, по файлу на процесс;
+каталог общий для Django, API и воркеров. Модуль не зависит от app/config.py
+при импорте: Django использует его же, передав свои настройки в configure(). Файл больше trace_file_max_mb
+переименовывается в .jsonl.1 (хранится один предыдущий). Без флага sampled
+(доля trace_sample_rate для трасс, начатых в API) контекст передаётся дальше,
+но спаны не пишутся.
+
+Водопад запроса (id трассы - в заголовке ответа X-Trace-Id):
+    python -m app.tracing list --limit 20 --min-ms 500
+    python -m app.tracing show <trace_id>
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Union
+
+MB = 1024 * 1024
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+
+# Каталог, доля записываемых трасс, размер файла до ротации и префикс имени файла
+_config: Optional[dict] = None
+_write_lock = threading.Lock()
+_file = None
+_file_pid = None
+
+
+def configure(directory: str, sample_rate: float, file_max_mb: int, prefix: str = "spans") -> None:
+    """Настройки записи спанов; без вызова - из app/config.py при первом спане"""
+    global _config, _file
+    with _write_lock:
+        _config = {"directory": directory, "sample_rate": sample_rate, "file_max_mb": file_max_mb, "prefix": prefix}
+        # Следующий спан откроет файл по новым настройкам
+        if _file is not None:
+            _file.close()
+            _file = None
+
+
+def _settings() -> dict:
+    if _config is None:
+        from app.config import settings
+
+        configure(settings.trace_dir, settings.trace_sample_rate, settings.trace_file_max_mb)
+    return _config
+
+
+class Span:
+    """Отрезок работы одного сервиса; пишется в файл при end()"""
+
+    __slots__ = ("name", "service", "trace_id", "span_id", "parent_id", "sampled", "start", "_started", "attrs")
+
+    def __init__(self, name: str, service: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 start: Optional[float] = None, attrs: Optional[dict] = None):
+        self.name = name
+        self.service = service
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        # Начало - время эпохи (сравнимо между процессами), длительность - по монотонным часам
+        self.start = time.time() if start is None else start
+        self._started = time.perf_counter()
+        self.attrs = attrs or {}
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def end(self, end: Optional[float] = None) -> None:
+        if not self.sampled:
+            return
+        duration = end - self.start if end is not None else time.perf_counter() - self._started
+        _write({
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "service": self.service, "start": self.start,
+            "duration_ms": round(duration * 1000, 3), "attrs": self.attrs,
+        })
+
+
+def parse(header: Optional[str]):
+    """(trace_id, span_id, sampled) из traceparent или None"""
+    match = _TRACEPARENT_RE.match(header.strip().lower()) if header else None
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def start(name: str, parent: Union[Span, str, None] = None, service: Optional[str] = None,
+          start_time: Optional[float] = None, **attrs) -> Span:
+    """Новый спан: дочерний к parent (спан или заголовок traceparent), без него - к текущему.
+
+    Без родителя начинается новая трасса (с вероятностью trace_sample_rate - записываемая).
+    """
+    if parent is None:
+        parent = current()
+    if isinstance(parent, Span):
+        return Span(name, service or parent.service, parent.trace_id, parent.span_id, parent.sampled,
+                    start_time, attrs)
+    context = parse(parent)
+    if context is not None:
+        trace_id, parent_id, sampled = context
+        return Span(name, service or "api", trace_id, parent_id, sampled, start_time, attrs)
+    return Span(name, service or "api", f"{random.getrandbits(128):032x}", None,
+                random.random() < _settings()["sample_rate"], start_time, attrs)
+
+
+def activate(span: Span):
+    """Делает спан текущим; возвращает токен для deactivate"""
+    return _current.set(span)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Дочерний спан текущего на время блока"""
+    child = start(name, **attrs)
+    token = activate(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set(error=type(e).__name__)
+        raise
+    finally:
+        deactivate(token)
+        child.end()
+
+
+def inject(headers: dict) -> None:
+    """Контекст текущего спана и время отправки - в заголовки сообщения Celery"""
+    parent = current()
+    if parent is not None:
+        headers["traceparent"] = parent.traceparent
+        headers["trace_sent_at"] = time.time()
+
+
+def _path(config: dict) -> str:
+    return os.path.join(config["directory"], f"{config['prefix']}-{socket.gethostname()}-{os.getpid()}.jsonl")
+
+
+def _write(record: dict) -> None:
+    global _file, _file_pid
+    config = _settings()
+    if not config["directory"]:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _write_lock:
+        try:
+            # После fork (процессы воркера) у процесса свой файл
+            if _file is None or _file_pid != os.getpid():
+                os.makedirs(config["directory"], exist_ok=True)
+                _file = open(_path(config), "a", encoding="utf-8")
+                _file_pid = os.getpid()
+            _file.write(line)
+            _file.flush()
+            if _file.tell() > config["file_max_mb"] * MB:
+                _file.close()
+                _file = None
+                os.replace(_path(config), _path(config) + ".1")
+        except OSError as e:
+            print(f"Не удалось записать спан: {e}")
+
+
+def read_spans(directory: str, trace_id: Optional[str] = None, since: Optional[float] = None) -> Iterable[dict]:
+    """Спаны из файлов каталога; trace_id - начало id нужной трассы"""
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("spans-") or not (name.endswith(".jsonl") or name.endswith(".jsonl.1")):
+            continue
+        path = os.path.join(directory, name)
+        if since is not None and os.path.getmtime(path) < since:
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                # Дешёвая проверка до разбора JSON
+                if trace_id and trace_id not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Строка, дописываемая прямо сейчас
+                    continue
+                if trace_id and not record["trace_id"].startswith(trace_id):
+                    continue
+                if since is not None and record["start"] < since:
+                    continue
+                yield record
+
+
+def _group(spans: Iterable[dict]) -> Dict[str, List[dict]]:
+    traces: Dict[str, List[dict]] = {}
+    for record in spans:
+        traces.setdefault(record["trace_id"], []).append(record)
+    return traces
+
+
+def _bounds(spans: List[dict]):
+    begin = min(record["start"] for record in spans)
+    end = max(record["start"] + record["duration_ms"] / 1000 for record in spans)
+    return begin, end
+
+
+def _root(spans: List[dict]) -> dict:
+    ids = {record["span_id"] for record in spans}
+    roots = [record for record in spans if record["parent_id"] not in ids]
+    return min(roots or spans, key=lambda record: record["start"])
+
+
+def list_traces(directory: str, limit: int, min_ms: float, since_minutes: float) -> None:
+    since = time.time() - since_minutes * 60 if since_minutes else None
+    rows = []
+    for trace_id, spans in _group(read_spans(directory, since=since)).items():
+        begin, end = _bounds(spans)
+        duration_ms = (end - begin) * 1000
+        if duration_ms >= min_ms:
+            rows.append((begin, trace_id, duration_ms, spans))
+    rows.sort(reverse=True)
+    for begin, trace_id, duration_ms, spans in rows[:limit]:
+        root = _root(spans)
+        started = time.strftime("%H:%M:%S", time.localtime(begin))
+        services = ",".join(sorted({record["service"] for record in spans}))
+        print(f"{started}  {trace_id}  {duration_ms:>10.1f} мс  {len(spans):>4} спанов  {services:<24} {root['name']}")
+    if not rows:
+        print("Трасс не найдено")
+
+
+def _format_attrs(attrs: dict) -> str:
+    return " ".join(f"{key}={value}" for key, value in attrs.items() if value is not None)
+
+
+def show(directory: str, trace_id: str, width: int) -> bool:
+    traces = _group(read_spans(directory, trace_id=trace_id))
+    if not traces:
+        print(f"Трасса {trace_id} не найдена")
+        return False
+    if len(traces) > 1:
+        print(f"Под {trace_id} подходит несколько трасс: {', '.join(sorted(traces))}")
+        return False
+    (full_id, spans), = traces.items()
+    begin, end = _bounds(spans)
+    total = max(end - begin, 1e-9)
+    print(f"Трасса {full_id}: {total * 1000:.1f} мс, {len(spans)} спанов")
+
+    # Дерево по parent_id; спаны с незаписанным родителем - на верхний уровень
+    ids = {record["span_id"] for record in spans}
+    children: Dict[Optional[str], List[dict]] = {}
+    for record in spans:
+        children.setdefault(record["parent_id"] if record["parent_id"] in ids else None, []).append(record)
+
+    def walk(parent_id, depth):
+        for record in sorted(children.get(parent_id, []), key=lambda item: item["start"]):
+            offset = record["start"] - begin
+            duration = record["duration_ms"] / 1000
+            left = min(width - 1, int(offset / total * width))
+            length = max(1, min(width - left, round(duration / total * width)))
+            bar = " " * left + "█" * length + " " * (width - left - length)
+            label = "  " * depth + record["name"]
+            print(f"{offset * 1000:>9.1f} {record['duration_ms']:>9.1f} мс  {record['service']:<8} |{bar}| {label}"
+                  f"  {_format_attrs(record['attrs'])}".rstrip())
+            walk(record["span_id"], depth + 1)
+
+    print(f"{'начало':>9} {'длит.':>12}  {'сервис':<8} |{' ' * width}|")
+    walk(None, 0)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=_settings()["directory"], help="каталог спанов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="последние трассы")
+    list_parser.add_argument("--limit", type=int, default=20)
+    list_parser.add_argument("--min-ms", type=float, default=0, help="только трассы не короче, мс")
+    list_parser.add_argument("--since-minutes", type=float, default=60, help="за последние минуты (0 - все)")
+
+    show_parser = commands.add_parser("show", help="водопад трассы")
+    show_parser.add_argument("trace_id", help="id трассы или его начало")
+    show_parser.add_argument("--width", type=int, default=40, help="ширина шкалы в символах")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        list_traces(args.dir, args.limit, args.min_ms, args.since_minutes)
+    elif not show(args.dir, args.trace_id, args.width):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Пословный результат OCR в компактном колоночном виде.
+
+Для каждой страницы хранятся упакованные массивы, а не строка на слово:
+рамки слов int16 (x0, y0, x1, y1), уверенность uint8, номера строки и блока uint16.
+Сами слова - одна строка, разделённая "\n". Координаты - в пикселях страницы,
+переданной в tesseract (после предобработки); её размер хранится рядом.
+"""
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models import Document, DocumentWords
+
+INT16_MAX = np.iinfo(np.int16).max
+
+
+class PageWords:
+    def __init__(self, words: List[str], boxes: np.ndarray, conf: np.ndarray,
+                 lines: np.ndarray, blocks: np.ndarray, width: int, height: int):
+        self.words = words
+        self.boxes = boxes
+        self.conf = conf
+        self.lines = lines
+        self.blocks = blocks
+        self.width = width
+        self.height = height
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def from_lists(cls, words, boxes, conf, lines, blocks, width: int, height: int) -> "PageWords":
+        """Упаковка списков, собранных при обходе результата OCR"""
+        return cls(
+            words=words,
+            boxes=np.clip(np.array(boxes, dtype=np.int64).reshape(-1, 4), 0, INT16_MAX).astype(np.int16),
+            conf=np.clip(np.rint(np.array(conf, dtype=np.float64)), 0, 100).astype(np.uint8),
+            lines=np.array(lines, dtype=np.uint16),
+            blocks=np.array(blocks, dtype=np.uint16),
+            width=width,
+            height=height,
+        )
+
+    def pack(self) -> dict:
+        """Значения колонок document_words"""
+        return {
+            "word_count": len(self.words),
+            "width": self.width,
+            "height": self.height,
+            "words": "\n".join(self.words),
+            "boxes": self.boxes.tobytes(),
+            "conf": self.conf.tobytes(),
+            "lines": self.lines.tobytes(),
+            "blocks": self.blocks.tobytes(),
+        }
+
+    @classmethod
+    def unpack(cls, row) -> "PageWords":
+        """Из строки document_words; массивы ссылаются на байты строки без копирования"""
+        return cls(
+            words=row.words.split("\n") if row.word_count else [],
+            boxes=np.frombuffer(row.boxes, dtype=np.int16).reshape(-1, 4),
+            conf=np.frombuffer(row.conf, dtype=np.uint8),
+            lines=np.frombuffer(row.lines, dtype=np.uint16),
+            blocks=np.frombuffer(row.blocks, dtype=np.uint16),
+            width=row.width,
+            height=row.height,
+        )
+
+    def select(self, bbox: Optional[tuple] = None, inside: bool = True,
+               min_conf: Optional[int] = None, max_conf: Optional[int] = None) -> np.ndarray:
+        """Индексы слов в области bbox = (x0, y0, x1, y1) и/или в диапазоне уверенности"""
+        mask = np.ones(len(self.words), dtype=bool)
+        if bbox is not None:
+            x0, y0, x1, y1 = bbox
+            boxes = self.boxes
+            if inside:
+                mask &= (boxes[:, 0] >= x0) & (boxes[:, 1] >= y0) & (boxes[:, 2] <= x1) & (boxes[:, 3] <= y1)
+            else:
+                mask &= (boxes[:, 0] < x1) & (boxes[:, 2] > x0) & (boxes[:, 1] < y1) & (boxes[:, 3] > y0)
+        if min_conf is not None:
+            mask &= self.conf >= min_conf
+        if max_conf is not None:
+            mask &= self.conf < max_conf
+        return np.flatnonzero(mask)
+
+    def to_dicts(self, indexes: np.ndarray) -> List[dict]:
+        return [
+            {
+                "word": self.words[i],
+                "bbox": self.boxes[i].tolist(),
+                "conf": int(self.conf[i]),
+                "line": int(self.lines[i]),
+                "block": int(self.blocks[i]),
+            }
+            for i in indexes
+        ]
+
+    def text(self, indexes: np.ndarray) -> str:
+        """Выбранные слова, собранные по строкам"""
+        lines = []
+        current_line = None
+        for i in indexes:
+            if self.lines[i] != current_line:
+                lines.append([])
+                current_line = self.lines[i]
+            lines[-1].append(self.words[i])
+        return "\n".join(" ".join(line) for line in lines)
+
+
+def save_page(db, doc_id: int, page_no: int, config: str, page_words: PageWords) -> None:
+    """Вставляет или заменяет слова страницы"""
+    values = {"doc_id": doc_id, "page_no": page_no, "config": config, **page_words.pack()}
+    stmt = pg_insert(DocumentWords).values(**values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DocumentWords.doc_id, DocumentWords.page_no],
+        set_={column: stmt.excluded[column] for column in values if column not in ("doc_id", "page_no")},
+    ))
+
+
+def trim(db, doc_id: int, page_count: int) -> None:
+    """Удаляет слова страниц, которых больше нет (прошлый запуск с другим числом страниц)"""
+    db.query(DocumentWords).filter(
+        DocumentWords.doc_id == doc_id, DocumentWords.page_no >= page_count
+    ).delete(synchronize_session=False)
+
+
+def copy_from_duplicate(db, doc_id: int, file_hash: str, config: str) -> int:
+    """При попадании в кэш OCR копирует слова у документа с тем же файлом и конфигом.
+
+    Возвращает число скопированных страниц (0 - слов для этого файла ещё нет).
+    """
+    source_doc_id = (
+        select(DocumentWords.doc_id)
+        .join(Document, Document.id == DocumentWords.doc_id)
+        .where(Document.file_hash == file_hash, DocumentWords.config == config, Document.id != doc_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    columns = [column.name for column in DocumentWords.__table__.columns if column.name != "doc_id"]
+    source = select(
+        literal(doc_id), *[DocumentWords.__table__.c[name] for name in columns]
+    ).where(DocumentWords.doc_id == source_doc_id)
+    result = db.execute(insert(DocumentWords).from_select(["doc_id", *columns], source))
+    return result.rowcount
@@ -0,0 +1,109 @@
+"""Сравнение синхронного и асинхронного режимов БД в API.
+
+Для каждого режима (DB_ASYNC=false/true) поднимает uvicorn с app.main:app
+и нагружает /get_text и /documents с keep-alive соединениями из нескольких
+потоков. Печатает запросы/сек и задержки p50/p95/p99.
+
+Пример (из корня репозитория, БД из DATABASE_URL должна содержать документы):
+    python -m benchmarks.bench_db_modes --doc-id 1 --concurrency 64 --duration 15
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/openapi.json")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn не запустился")
+
+
+def load(port, path, concurrency, duration):
+    """Нагружает один эндпоинт, возвращает (запросов/сек, задержки в мс, ошибки)"""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    stop_at = time.monotonic() + duration
+
+    def worker(index):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[index] += 1
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            latencies[index].append((time.perf_counter() - started) * 1000)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    all_latencies = sorted(ms for chunk in latencies for ms in chunk)
+    return len(all_latencies) / elapsed, all_latencies, sum(errors)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doc-id", type=int, required=True, help="документ с распознанным текстом")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="процессов uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    paths = [f"/get_text?doc_id={args.doc_id}", "/documents?limit=100"]
+    print(f"{'режим':<6} {'эндпоинт':<28} {'req/s':>9} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'ошибки':>7}")
+
+    for mode in ("false", "true"):
+        env = dict(os.environ, DB_ASYNC=mode)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            wait_for_server(args.port)
+            for path in paths:
+                # Прогрев пула соединений
+                load(args.port, path, args.concurrency, 1)
+                rps, latencies, errors = load(args.port, path, args.concurrency, args.duration)
+                print(f"{'async' if mode == 'true' else 'sync':<6} {path:<28} {rps:>9.1f} "
+                      f"{statistics.median(latencies) if latencies else float('nan'):>8.1f} "
+                      f"{percentile(latencies, 0.95):>8.1f} {percentile(latencies, 0.99):>8.1f} {errors:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
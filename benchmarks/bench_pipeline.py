@@ -0,0 +1,260 @@
+"""Сквозной нагрузочный тест: загрузка -> анализ -> получение текста.
+
+Корпус - синтетический (benchmarks/corpus.py), API - app.main:app через
+TestClient в этом же процессе, задачи Celery выполняются здесь же (eager),
+брокер - в памяти (memory://). Нужна Postgres из DATABASE_URL (маршруты и
+задачи используют upsert, advisory-блокировки и полнотекстовый поиск Postgres,
+SQLite не подходит) и tesseract с моделями rus и eng. Файлы, превью, метрики и
+спаны пишутся во временный каталог; созданные документы и записи кэша OCR корпуса
+удаляются после прогона.
+
+Печатает загрузку в МБ/с, документы/с (по времени и на ядро - по CPU-времени
+процесса), задержки p50/p95/p99 и пиковый RSS. С --baseline сравнивает с
+сохранённым прогоном и завершается с кодом 1, если метрика хуже больше чем
+на --tolerance.
+
+Пример (из корня репозитория):
+    python -m benchmarks.bench_pipeline --count 20 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --count 20 --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import corpus
+from benchmarks.bench_db_modes import percentile
+
+# Направление метрик: True - чем больше, тем лучше
+METRICS = {
+    "upload_mb_s": True,
+    "upload_p95_ms": False,
+    "docs_per_sec": True,
+    "docs_per_cpu_sec": True,
+    "analyze_p50_ms": False,
+    "analyze_p95_ms": False,
+    "analyze_p99_ms": False,
+    "get_text_p95_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def configure(workdir):
+    """Окружение до импорта app: каталоги во временной папке, брокер в памяти"""
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ["CELERY_BROKER_URL"] = "memory://"
+    os.environ["DOCUMENTS_DIR"] = os.path.join(workdir, "documents")
+    os.environ["PREVIEW_CACHE_DIR"] = os.path.join(workdir, "previews")
+    os.environ["WORKER_METRICS_DIR"] = os.path.join(workdir, "metrics")
+    os.environ["TRACE_DIR"] = os.path.join(workdir, "traces")
+
+
+def peak_rss_mb():
+    # ru_maxrss: КБ в Linux, байты в macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def latency_stats(prefix, latencies):
+    latencies = sorted(latencies)
+    return {
+        f"{prefix}_p50_ms": statistics.median(latencies) if latencies else float("nan"),
+        f"{prefix}_p95_ms": percentile(latencies, 0.95),
+        f"{prefix}_p99_ms": percentile(latencies, 0.99),
+    }
+
+
+def upload(client, documents):
+    """Загружает корпус, возвращает (id документов, задержки мс, МБ/с)"""
+    doc_ids, latencies = [], []
+    total_bytes = 0
+    started = time.perf_counter()
+    for _, filename, data in documents:
+        request_started = time.perf_counter()
+        response = client.post("/upload_doc", files={"file": (filename, data)})
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        response.raise_for_status()
+        doc_ids.append(response.json()["doc_id"])
+        total_bytes += len(data)
+    elapsed = time.perf_counter() - started
+    return doc_ids, latencies, total_bytes / 2 ** 20 / elapsed
+
+
+def analyze(app, doc_ids, concurrency):
+    """Анализ и получение текста каждого документа из concurrency потоков"""
+    from fastapi.testclient import TestClient
+
+    analyze_latencies, text_latencies, errors = [], [], []
+    lock = threading.Lock()
+    pending = list(doc_ids)
+
+    def worker():
+        client = TestClient(app)
+        while True:
+            with lock:
+                if not pending:
+                    return
+                doc_id = pending.pop(0)
+            started = time.perf_counter()
+            response = client.post("/doc_analyse", params={"doc_id": doc_id, "user": "bench"})
+            analyzed = time.perf_counter()
+            text = client.get("/get_text", params={"doc_id": doc_id})
+            finished = time.perf_counter()
+            with lock:
+                if response.status_code != 200 or text.status_code != 200 or not text.json().get("text"):
+                    errors.append((doc_id, response.status_code, text.status_code))
+                    continue
+                analyze_latencies.append((analyzed - started) * 1000)
+                text_latencies.append((finished - analyzed) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return analyze_latencies, text_latencies, errors, time.perf_counter() - wall_started, time.process_time() - cpu_started
+
+
+def forget_cached_ocr(file_hashes):
+    """Записи кэша OCR для корпуса - иначе повторный прогон не распознаёт ничего"""
+    from app.database import SessionLocal
+    from app.models import OcrCache
+
+    db = SessionLocal()
+    try:
+        db.query(OcrCache).filter(OcrCache.file_hash.in_(file_hashes)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(args, workdir):
+    configure(workdir)
+    import hashlib
+
+    from fastapi.testclient import TestClient
+
+    from app import tesseract_pool
+    from app.celery_worker import celery
+    from app.main import app
+
+    print(f"Генерация корпуса: {args.count} документов, seed {args.seed}")
+    documents = list(corpus.generate(args.count, args.seed, args.font))
+    file_hashes = [hashlib.sha256(data).hexdigest() for _, _, data in documents]
+    corpus_mb = sum(len(data) for _, _, data in documents) / 2 ** 20
+    pages = sum(variant.pages for variant, _, _ in documents)
+    forget_cached_ocr(file_hashes)
+
+    # Модели загружаются до замеров, как в worker_process_init
+    tesseract_pool.warm_up()
+    client = TestClient(app)
+
+    # Загрузка: задачи превью остаются в брокере в памяти и не выполняются
+    celery.conf.task_always_eager = False
+    doc_ids, upload_latencies, upload_mb_s = upload(client, documents)
+    try:
+        celery.conf.task_always_eager = True
+        celery.conf.task_eager_propagates = True
+        analyze_latencies, text_latencies, errors, wall, cpu = analyze(app, doc_ids, args.concurrency)
+    finally:
+        for doc_id in doc_ids:
+            client.delete("/doc_delete", params={"doc_id": doc_id})
+        forget_cached_ocr(file_hashes)
+
+    done = len(analyze_latencies)
+    metrics = {
+        "upload_mb_s": upload_mb_s,
+        "upload_p95_ms": percentile(sorted(upload_latencies), 0.95),
+        "docs_per_sec": done / wall if wall else float("nan"),
+        "docs_per_cpu_sec": done / cpu if cpu else float("nan"),
+        **latency_stats("analyze", analyze_latencies),
+        "get_text_p95_ms": percentile(sorted(text_latencies), 0.95),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return {
+        "metrics": metrics,
+        "run": {
+            "count": args.count, "seed": args.seed, "concurrency": args.concurrency,
+            "corpus_mb": round(corpus_mb, 2), "pages": pages, "documents_done": done, "errors": len(errors),
+            "cpu_count": os.cpu_count(), "python": platform.python_version(), "machine": platform.machine(),
+        },
+        "errors": errors,
+    }
+
+
+def _value(value):
+    return f"{value:.2f}" if value is not None else "n/a"
+
+
+def compare(metrics, baseline, tolerance):
+    """Строки сравнения и список ухудшившихся метрик"""
+    regressions = []
+    print(f"{'метрика':<18} {'сейчас':>12} {'база':>12} {'изменение':>10}")
+    for name, higher_is_better in METRICS.items():
+        current, base = metrics.get(name), baseline.get(name)
+        if current is None or base is None or base != base or not base:
+            # Метрики нет в одном из прогонов (например, не распознано ни одного документа)
+            print(f"{name:<18} {_value(current):>12} {_value(base):>12}")
+            continue
+        change = (current - base) / base
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        if worse:
+            regressions.append(name)
+        print(f"{name:<18} {current:>12.2f} {base:>12.2f} {change:>+9.1%}{'  РЕГРЕССИЯ' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20, help="документов в корпусе")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--font", help="TTF с кириллицей для корпуса")
+    parser.add_argument("--concurrency", type=int, default=1, help="потоков анализа")
+    parser.add_argument("--output", help="записать результат (JSON)")
+    parser.add_argument("--save-baseline", help="сохранить результат как базовый (JSON)")
+    parser.add_argument("--baseline", help="сравнить с базовым прогоном (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as workdir:
+        result = run(args, workdir)
+
+    info = result["run"]
+    print(f"Корпус: {info['count']} документов, {info['pages']} страниц, {info['corpus_mb']} МБ; "
+          f"распознано {info['documents_done']}, ошибок {info['errors']}")
+    for doc_id, analyze_status, text_status in result["errors"]:
+        print(f"  документ {doc_id}: /doc_analyse {analyze_status}, /get_text {text_status}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("run", {}).get("count") != info["count"] or baseline.get("run", {}).get("seed") != info["seed"]:
+            print("Внимание: базовый прогон сделан на другом корпусе (count/seed)")
+        regressions = compare(result["metrics"], baseline["metrics"], args.tolerance)
+        if regressions:
+            print(f"Ухудшение больше {args.tolerance:.0%}: {', '.join(regressions)}")
+            exit_code = 1
+    else:
+        for name, value in result["metrics"].items():
+            print(f"{name:<18} {value:>12.2f}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            print(f"Результат записан в {path}")
+    if info["errors"]:
+        exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Воспроизводимый синтетический корпус документов для нагрузочных тестов.
+
+Страницы с русским и английским текстом рисуются PIL и портятся так, как
+портятся сканы: шум, наклон, размытие, JPEG-сжатие. Один и тот же seed даёт
+побайтно одинаковый корпус (при тех же версиях Pillow и шрифта), так что
+результаты прогонов сравнимы между собой.
+
+Пример (из корня репозитория):
+    python -m benchmarks.corpus --count 20 --out /tmp/corpus
+"""
+import argparse
+import io
+import os
+import random
+from typing import Iterator, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+WORDS = {
+    "ru": (
+        "документ договор поставка товар счёт оплата сумма рублей дата подпись сторона "
+        "покупатель продавец условия срок доставка адрес город улица дом телефон банк "
+        "реквизиты количество цена итого налог основание настоящий акт приёмка работа "
+        "услуга период отчёт исполнитель заказчик месяц года номер страница приложение"
+    ).split(),
+    "en": (
+        "document agreement supply goods invoice payment amount total date signature party "
+        "buyer seller terms delivery address city street phone bank account quantity price "
+        "tax basis report service period contractor customer month year number page annex"
+    ).split(),
+}
+
+# Размеры страниц в дюймах: A4 и A6
+PAGE_INCHES = {"a4": (8.27, 11.69), "a6": (4.13, 5.83)}
+
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+)
+
+
+class Variant:
+    """Параметры одного документа корпуса"""
+
+    def __init__(self, name: str, lang: str, page: str, dpi: int, noise: float, skew: float,
+                 blur: float, fmt: str, pages: int):
+        self.name = name
+        self.lang = lang
+        self.page = page
+        self.dpi = dpi
+        self.noise = noise
+        self.skew = skew
+        self.blur = blur
+        self.fmt = fmt
+        self.pages = pages
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def find_font(path: Optional[str] = None) -> str:
+    """TrueType-шрифт с кириллицей (встроенный шрифт PIL её не содержит)"""
+    for candidate in ([path] if path else []) + list(FONT_CANDIDATES):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    raise RuntimeError("Не найден шрифт с кириллицей (DejaVuSans); укажите --font")
+
+
+def variants(count: int, seed: int) -> List[Variant]:
+    """Смесь языков, размеров, DPI и уровней шума; каждый пятый документ - двухстраничный TIFF"""
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        multi_page = i % 5 == 4
+        result.append(Variant(
+            name=f"bench-{seed}-{i:05d}",
+            lang=("ru", "en")[i % 2],
+            page=rng.choice(("a4", "a4", "a6")),
+            dpi=rng.choice((150, 200, 300)),
+            noise=rng.choice((0.0, 8.0, 20.0)),
+            skew=rng.uniform(-3.0, 3.0),
+            blur=rng.choice((0.0, 0.0, 0.8)),
+            fmt="tiff" if multi_page else rng.choice(("png", "jpeg")),
+            pages=2 if multi_page else 1,
+        ))
+    return result
+
+
+def _text_lines(rng: random.Random, lang: str, lines: int) -> List[str]:
+    words = WORDS[lang]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(4, 9))) for _ in range(lines)]
+
+
+def render_page(variant: Variant, page_no: int, font_path: str, seed: int) -> Image.Image:
+    rng = random.Random(f"{seed}:{variant.name}:{page_no}")
+    width_in, height_in = PAGE_INCHES[variant.page]
+    width, height = round(width_in * variant.dpi), round(height_in * variant.dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+
+    # Кегль 11 pt при любом DPI
+    font = ImageFont.truetype(font_path, max(8, round(11 * variant.dpi / 72)))
+    margin = round(0.8 * variant.dpi)
+    line_height = round(font.size * 1.5)
+    lines = max(1, (height - 2 * margin) // line_height)
+    for i, line in enumerate(_text_lines(rng, variant.lang, lines)):
+        draw.text((margin, margin + i * line_height), line, fill=0, font=font)
+
+    if variant.skew:
+        image = image.rotate(variant.skew, resample=Image.BICUBIC, expand=False, fillcolor=255)
+    if variant.blur:
+        image = image.filter(ImageFilter.GaussianBlur(variant.blur))
+    if variant.noise:
+        noise_rng = np.random.default_rng(rng.getrandbits(32))
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels += noise_rng.normal(0.0, variant.noise, pixels.shape)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    image.info["dpi"] = (variant.dpi, variant.dpi)
+    return image
+
+
+def encode(variant: Variant, font_path: str, seed: int) -> bytes:
+    """Файл документа в формате варианта"""
+    pages = [render_page(variant, page_no, font_path, seed) for page_no in range(variant.pages)]
+    buffer = io.BytesIO()
+    dpi = (variant.dpi, variant.dpi)
+    if variant.fmt == "tiff":
+        pages[0].save(buffer, "TIFF", save_all=True, append_images=pages[1:], compression="tiff_deflate", dpi=dpi)
+    elif variant.fmt == "jpeg":
+        pages[0].save(buffer, "JPEG", quality=85, dpi=dpi)
+    else:
+        pages[0].save(buffer, "PNG", dpi=dpi)
+    return buffer.getvalue()
+
+
+def extension(variant: Variant) -> str:
+    return {"tiff": ".tif", "jpeg": ".jpg", "png": ".png"}[variant.fmt]
+
+
+def generate(count: int, seed: int, font_path: Optional[str] = None) -> Iterator[tuple]:
+    """(вариант, имя файла, байты) для каждого документа корпуса"""
+    font = find_font(font_path)
+    for variant in variants(count, seed):
+        yield variant, variant.name + extension(variant), encode(variant, font, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--font", help="TTF с кириллицей")
+    parser.add_argument("--out", required=True, help="каталог для файлов")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    total = 0
+    for variant, filename, data in generate(args.count, args.seed, args.font):
+        with open(os.path.join(args.out, filename), "wb") as f:
+            f.write(data)
+        total += len(data)
+    print(f"{args.count} документов, {total / 2 ** 20:.1f} МБ в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
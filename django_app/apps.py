@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class DjangoAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
-    name = "django_app"
\ No newline at end of file
+    name = "django_app"
+
+    def ready(self):
+        from . import signals  # noqa: F401 - регистрация обработчиков
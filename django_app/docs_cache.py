@@ -0,0 +1,39 @@
+"""Кэш страниц списка документов.
+
+Страница списка (строки Docs) и её отрисованный фрагмент кэшируются с номером
+версии в ключе; загрузка и удаление документа увеличивают версию
+(django_app/signals.py), и старые записи просто перестают читаться. Кэш
+Django без общего бэкенда - свой в каждом процессе, поэтому срок жизни
+записей ограничен DOCS_LIST_CACHE_TTL.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'docs_list:version'
+
+
+def _initial():
+    # Ключ версии может быть вытеснен - новая версия не должна совпасть с прежними
+    return int(time.time() * 1000)
+
+
+def version():
+    value = cache.get(VERSION_KEY)
+    if value is None:
+        cache.add(VERSION_KEY, _initial(), None)
+        value = cache.get(VERSION_KEY)
+    return value
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, _initial(), None)
+
+
+def get_page(before, loader):
+    """Страница списка по курсору: из кэша или loader()"""
+    return cache.get_or_set(f'docs_list:{version()}:page:{before}', loader, settings.DOCS_LIST_CACHE_TTL)
@@ -0,0 +1,218 @@
+"""Общий HTTP-клиент для запросов Django -> FastAPI.
+
+Один requests.Session на процесс: ограниченный пул keep-alive соединений,
+таймауты по эндпоинтам, повторы с экспоненциальной задержкой и джиттером,
+circuit breaker и простые метрики (число запросов, ошибки, задержки, пул).
+Каждый вызов - спан трассы запроса Django (django_app/tracing.py).
+"""
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+from .tracing import client_span
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class CircuitOpenError(RequestException):
+    """FastAPI недоступен или перегружен: запрос отклонён без обращения к сети"""
+
+
+class CircuitBreaker:
+    """closed -> open после threshold ошибок подряд -> half-open через reset_timeout"""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # Начало пробного запроса half-open (None - пробы нет)
+        self.probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        # В half-open пропускаем один пробный запрос: успех закроет цепь, ошибка снова откроет.
+        # Остальные отклоняются, пока он не закончится (или не пропадёт дольше reset_timeout)
+        with self._lock:
+            now = time.monotonic()
+            if self.opened_at is None:
+                return True
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class ClientMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, endpoint, seconds, error):
+        with self._lock:
+            data = self.endpoints.get(endpoint)
+            if data is None:
+                data = self.endpoints[endpoint] = {
+                    'requests': 0, 'errors': 0, 'rejected': 0, 'latency_sum': 0.0, 'latency_max': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            if seconds is None:
+                data['rejected'] += 1
+                return
+            data['requests'] += 1
+            data['errors'] += int(error)
+            data['latency_sum'] += seconds
+            data['latency_max'] = max(data['latency_max'], seconds)
+            data['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for endpoint, data in self.endpoints.items():
+                result[endpoint] = dict(data, buckets=dict(
+                    zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], data['buckets'])
+                ))
+                if data['requests']:
+                    result[endpoint]['latency_avg'] = data['latency_sum'] / data['requests']
+            return result
+
+
+class FastAPIClient:
+    def __init__(self, base_url, pool_size, timeouts, retries, backoff, breaker):
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = timeouts
+        self.pool_size = pool_size
+        self.breaker = breaker
+        self.metrics = ClientMetrics()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            backoff_jitter=backoff,
+            status_forcelist=(502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # pool_block: при исчерпании пула ждём свободное соединение, а не открываем новое
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        # Потоковое тело нельзя отправить повторно - для него отдельная сессия без повторов
+        stream_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.stream_session = requests.Session()
+        self.stream_session.mount('http://', stream_adapter)
+        self.stream_session.mount('https://', stream_adapter)
+
+    def request(self, method, endpoint, retry=True, **kwargs):
+        if not self.breaker.allow():
+            self.metrics.observe(endpoint, None, True)
+            raise CircuitOpenError(f'FastAPI временно недоступен ({endpoint}), повторите позже')
+
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint, self.timeouts['default']))
+        # Спан вызова (вместе с повторами); FastAPI продолжает трассу по traceparent
+        with client_span(f'{method} {endpoint}') as span:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), 'traceparent': span.traceparent}
+            started = time.perf_counter()
+            try:
+                session = self.session if retry else self.stream_session
+                response = session.request(method, f'{self.base_url}{endpoint}', **kwargs)
+            except RequestException:
+                self.metrics.observe(endpoint, time.perf_counter() - started, True)
+                self.breaker.record_failure()
+                raise
+            span.set(status=response.status_code)
+
+        failed = response.status_code >= 500 or response.status_code == 429
+        self.metrics.observe(endpoint, time.perf_counter() - started, failed)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, endpoint, **kwargs):
+        return self.request('GET', endpoint, **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        return self.request('POST', endpoint, **kwargs)
+
+    def delete(self, endpoint, **kwargs):
+        return self.request('DELETE', endpoint, **kwargs)
+
+    def put(self, endpoint, **kwargs):
+        return self.request('PUT', endpoint, **kwargs)
+
+    def pool_stats(self):
+        pools = []
+        for key in self.adapter.poolmanager.pools.keys():
+            pool = self.adapter.poolmanager.pools[key]
+            pools.append({
+                'host': f'{pool.host}:{pool.port}',
+                'max_size': self.pool_size,
+                'in_use': self.pool_size - pool.pool.qsize(),
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+            })
+        return pools
+
+    def stats(self):
+        return {
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'pools': self.pool_stats(),
+            'endpoints': self.metrics.snapshot(),
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Клиент процесса (создаётся при первом обращении)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FastAPIClient(
+                    base_url=settings.FASTAPI_URL,
+                    pool_size=settings.FASTAPI_POOL_SIZE,
+                    timeouts=settings.FASTAPI_TIMEOUTS,
+                    retries=settings.FASTAPI_RETRIES,
+                    backoff=settings.FASTAPI_RETRY_BACKOFF,
+                    breaker=CircuitBreaker(settings.FASTAPI_BREAKER_THRESHOLD, settings.FASTAPI_BREAKER_RESET),
+                )
+    return _client
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='docs',
+            name='file_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='SHA-256'),
+        ),
+    ]
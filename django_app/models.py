@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -5,10 +6,16 @@ class Docs(models.Model):
     file_path = models.CharField(max_length=255, verbose_name="Путь к файлу")
     size = models.FloatField(verbose_name="Размер (КБ)")
     fastapi_id = models.PositiveIntegerField(verbose_name="FastAPI ID")
+    file_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="SHA-256")
 
     def __str__(self):
         return f"Док #{self.id} (FastAPI {self.fastapi_id})"
 
+    @property
+    def preview_url(self):
+        """Превью из FastAPI (килобайты вместо оригинала)"""
+        return f"{settings.FASTAPI_PUBLIC_URL}/preview?doc_id={self.fastapi_id}"
+
 class UsersToDocs(models.Model):
     username = models.CharField(max_length=100, verbose_name="Имя пользователя")
     docs = models.ForeignKey(Docs, on_delete=models.CASCADE, verbose_name="Документ")
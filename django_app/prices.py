@@ -0,0 +1,43 @@
+"""Таблица цен в памяти процесса.
+
+Цены читаются из БД одним запросом при первом обращении и сбрасываются
+сигналами post_save/post_delete модели Price (django_app/signals.py). Другие
+процессы узнают об изменении по истечении PRICE_CACHE_TTL секунд; так же
+подхватываются правки в обход сигналов (QuerySet.update, другая база).
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Price
+
+_lock = threading.Lock()
+_prices = None
+_loaded_at = 0.0
+
+
+def _load():
+    prices = {}
+    # При дублях типа действует первая запись, как у filter(...).first()
+    for file_type, price in Price.objects.order_by('id').values_list('file_type', 'price'):
+        prices.setdefault(file_type.lower(), price)
+    return prices
+
+
+def price_per_kb(file_type):
+    """Цена за 1 КБ для типа файла или None"""
+    global _prices, _loaded_at
+    prices = _prices
+    if prices is None or time.monotonic() - _loaded_at > settings.PRICE_CACHE_TTL:
+        with _lock:
+            if _prices is None or time.monotonic() - _loaded_at > settings.PRICE_CACHE_TTL:
+                _prices = _load()
+                _loaded_at = time.monotonic()
+            prices = _prices
+    return prices.get(file_type.lower())
+
+
+def invalidate():
+    global _prices
+    _prices = None
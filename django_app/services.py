@@ -1,18 +1,18 @@
-import requests
 from django.conf import settings
+from django.core.cache import cache
 from requests.exceptions import RequestException
+from .http_client import get_client
 import time
 
 
 class FastAPIService:
     @staticmethod
-    def analyze_document(doc_id):
-        """Отправка документа на анализ в FastAPI"""
+    def analyze_document(doc_id, user=None):
+        """Отправка документа на анализ в FastAPI (интерактивная полоса, user - для справедливой очереди)"""
         try:
-            response = requests.post(
-                f"{settings.FASTAPI_URL}/doc_analyse",
-                params={'doc_id': doc_id},  # Используем params вместо json
-                timeout=30
+            response = get_client().post(
+                "/doc_analyse",
+                params={'doc_id': doc_id, 'user': user, 'lane': 'interactive'}  # Используем params вместо json
             )
             if response.status_code == 200:
                 return response.json()
@@ -22,19 +22,72 @@ class FastAPIService:
             return {'detail': f'Ошибка соединения: {str(e)}'}
 
     @staticmethod
-    def get_text(doc_id):
-        """Получение распознанного текста из FastAPI"""
+    def wait_for_task(doc_id, timeout):
+        """Ожидание завершения анализа (long-poll), не дольше timeout секунд.
+
+        Возвращает последнее известное состояние задачи: state = queued/running/done/failed.
+        """
+        deadline = time.monotonic() + timeout
+        state = {'state': 'queued'}
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return state
+            try:
+                response = get_client().get(
+                    "/task_status",
+                    params={'doc_id': doc_id, 'wait': min(remaining, 25)}
+                )
+                if response.status_code != 200:
+                    return {'state': 'failed', 'error': f'Ошибка получения состояния: {response.text}'}
+                state = response.json()
+            except RequestException as e:
+                return {'state': 'failed', 'error': f'Ошибка соединения: {str(e)}'}
+            if state['state'] in ('done', 'failed'):
+                return state
 
-        time.sleep(2)
+    @staticmethod
+    def task_statuses(doc_ids):
+        """Состояние анализа документов страницы списка одним запросом: {doc_id: {...}}.
 
+        При ошибке - пустой словарь: список показывается без статусов.
+        """
+        if not doc_ids:
+            return {}
         try:
-            response = requests.get(
-                f"{settings.FASTAPI_URL}/get_text",
+            response = get_client().get("/task_status_batch", params={'doc_ids': list(doc_ids)})
+            if response.status_code != 200:
+                print(f"Ошибка получения состояния задач: {response.text}")
+                return {}
+            return {int(doc_id): task for doc_id, task in response.json()['tasks'].items()}
+        except RequestException as e:
+            print(f"Ошибка соединения при получении состояния задач: {e}")
+            return {}
+
+    @staticmethod
+    def get_text(doc_id):
+        """Получение распознанного текста из FastAPI
+
+        Последний ответ хранится в кэше вместе с ETag; если текст не менялся,
+        FastAPI отвечает 304 без тела.
+        """
+        cache_key = f'fastapi_text:{doc_id}'
+        cached = cache.get(cache_key)
+        headers = {'If-None-Match': cached['etag']} if cached else {}
+        try:
+            response = get_client().get(
+                "/get_text",
                 params={'doc_id': doc_id},
-                timeout=30
+                headers=headers
             )
+            if response.status_code == 304 and cached:
+                return cached['result']
             if response.status_code == 200:
-                return response.json()
+                result = response.json()
+                if response.headers.get('ETag'):
+                    cache.set(cache_key, {'etag': response.headers['ETag'], 'result': result},
+                              settings.FASTAPI_TEXT_CACHE_TTL)
+                return result
             else:
                 return {'text': '', 'error': f'Ошибка получения текста: {response.text}'}
         except RequestException as e:
@@ -44,10 +97,9 @@ class FastAPIService:
     def delete_document(doc_id):
         """Удаление документа через FastAPI"""
         try:
-            response = requests.delete(
-                f"{settings.FASTAPI_URL}/doc_delete",
-                params={'doc_id': doc_id},
-                timeout=30
+            response = get_client().delete(
+                "/doc_delete",
+                params={'doc_id': doc_id}
             )
             return response.status_code == 200
         except RequestException as e:
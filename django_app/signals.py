@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import docs_cache, prices
+from .models import Docs, Price
+
+
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def invalidate_prices(sender, **kwargs):
+    """Изменённая цена действует сразу в этом процессе"""
+    prices.invalidate()
+
+
+@receiver(post_save, sender=Docs)
+@receiver(post_delete, sender=Docs)
+def invalidate_docs_list(sender, **kwargs):
+    """Загруженный или удалённый документ сразу виден в списке этого процесса"""
+    docs_cache.invalidate()
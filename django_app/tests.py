@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.middleware.csrf import _get_new_csrf_string, _mask_cipher_secret
+from django.test import RequestFactory, SimpleTestCase
+
+from app import tracing
+
+from . import views
+from .http_client import CircuitBreaker
+from .models import Docs
+from .tracing import TracingMiddleware, client_span
+from .upload_handlers import FastAPIStreamingUploadHandler
+
+
+class TracingTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='traces-')
+        tracing.configure(self.directory, 1.0, 64, prefix='spans-django')
+        self.addCleanup(tracing.configure, self.directory, 0.0, 64)
+
+    def spans(self):
+        records = []
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name)) as f:
+                records.extend(json.loads(line) for line in f)
+        return {record['name']: record for record in records}
+
+    def test_request_span_and_fastapi_call_share_trace(self):
+        def view(request):
+            with client_span('GET /get_text') as span:
+                self.assertTrue(span.traceparent.startswith('00-'))
+            return HttpResponse('ok')
+
+        response = TracingMiddleware(view)(RequestFactory().get('/docs/'))
+
+        spans = self.spans()
+        request_span, call_span = spans['GET /docs/'], spans['GET /get_text']
+        self.assertEqual(response['X-Trace-Id'], request_span['trace_id'])
+        self.assertEqual(call_span['trace_id'], request_span['trace_id'])
+        self.assertEqual(call_span['parent_id'], request_span['span_id'])
+        self.assertEqual(call_span['service'], 'django')
+        self.assertEqual(request_span['attrs']['status'], 200)
+
+    def test_incoming_traceparent_is_continued(self):
+        header = '00-' + 'a' * 32 + '-' + 'b' * 16 + '-01'
+        TracingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/', HTTP_TRACEPARENT=header))
+        span = self.spans()['GET /']
+        self.assertEqual((span['trace_id'], span['parent_id']), ('a' * 32, 'b' * 16))
+
+    def test_streamed_upload_inherits_request_span(self):
+        seen = {}
+
+        class Client:
+            def put(self, endpoint, data, **kwargs):
+                seen['parent'] = tracing.current()
+                b''.join(data)
+                return HttpResponse()
+
+        handler = FastAPIStreamingUploadHandler()
+        root = tracing.start('POST /upload/', service='django')
+        token = tracing.activate(root)
+        try:
+            with mock.patch('django_app.upload_handlers.get_client', return_value=Client()):
+                with self.assertRaises(Exception):
+                    # StopFutureHandlers - обработчик забрал файл себе
+                    handler.new_file('file', 'scan.png', 'image/png', 4)
+                handler.receive_data_chunk(b'data', 0)
+                handler.file_complete(4)
+        finally:
+            tracing.deactivate(token)
+        self.assertIs(seen['parent'], root)
+
+
+class DocsListFragmentKeyTests(SimpleTestCase):
+    def fragment_key(self, tasks):
+        page = {'docs': [Docs(id=1, fastapi_id=10)], 'next_cursor': None}
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with mock.patch.object(views.docs_cache, 'get_page', return_value=page), \
+                mock.patch.object(views.docs_cache, 'version', return_value=1), \
+                mock.patch.object(views.FastAPIService, 'task_statuses', return_value=tasks), \
+                mock.patch.object(views, 'render') as render:
+            views.docs_list(request)
+        return render.call_args[0][2]['fragment_key']
+
+    def test_key_changes_when_fastapi_recovers(self):
+        # Документ без задачи: при недоступном FastAPI статуса нет, после восстановления - "не анализировался"
+        self.assertNotEqual(self.fragment_key({}), self.fragment_key({20: {'state': 'done'}}))
+
+    def test_key_follows_ocr_state(self):
+        self.assertNotEqual(self.fragment_key({10: {'state': 'queued'}}), self.fragment_key({10: {'state': 'done'}}))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def half_open(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker.opened_at -= 30
+        self.assertEqual(breaker.state, 'half-open')
+        return breaker
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self.half_open()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = self.half_open()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+    def test_lost_probe_is_replaced_after_timeout(self):
+        breaker = self.half_open()
+        self.assertTrue(breaker.allow())
+        breaker.probe_started -= 30
+        self.assertTrue(breaker.allow())
+
+
+class UploadCsrfTests(SimpleTestCase):
+    secret = _get_new_csrf_string()
+
+    def post(self, query=''):
+        request = RequestFactory().post(f'/upload/{query}', {'file': SimpleNamespace(name='scan.png', read=lambda: b'')})
+        request.COOKIES['csrftoken'] = self.secret
+        request.user = SimpleNamespace(is_authenticated=True)
+        with mock.patch('django_app.upload_handlers.get_client') as get_client, \
+                mock.patch.object(views, '_upload_file', return_value=HttpResponse()) as upload:
+            response = views.upload_file(request)
+        return response, request, get_client, upload
+
+    def test_forged_upload_rejected_before_body_is_read(self):
+        response, request, get_client, upload = self.post()
+        self.assertEqual(response.status_code, 403)
+        # Тело не разобрано и в FastAPI ничего не ушло
+        self.assertFalse(hasattr(request, '_files'))
+        get_client.assert_not_called()
+        upload.assert_not_called()
+
+    def test_token_in_query_string_allows_streaming(self):
+        response, request, get_client, upload = self.post(f'?csrfmiddlewaretoken={_mask_cipher_secret(self.secret)}')
+        self.assertEqual(response.status_code, 200)
+        upload.assert_called_once()
+        self.assertIsInstance(request.upload_handlers[0], FastAPIStreamingUploadHandler)
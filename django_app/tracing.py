@@ -0,0 +1,50 @@
+"""Начало трассы запроса и передача её в FastAPI.
+
+TracingMiddleware открывает спан на каждый запрос Django, FastAPIClient
+открывает дочерний спан на каждый вызов FastAPI и передаёт его в заголовке
+traceparent. Спаны и их запись - общий модуль app/tracing.py (там же CLI
+водопада: python -m app.tracing show <trace_id>) с настройками Django:
+файлы пишутся в TRACE_DIR, общий с FastAPI и воркерами.
+"""
+from django.conf import settings
+
+from app import tracing
+
+tracing.configure(settings.TRACE_DIR, settings.TRACE_SAMPLE_RATE, settings.TRACE_FILE_MAX_MB, prefix='spans-django')
+
+SERVICE = 'django'
+
+
+class TracingMiddleware:
+    """Спан на запрос; id трассы - в заголовке ответа X-Trace-Id"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Продолжение трассы из traceparent (прокси, балансировщик) или новая
+        span = tracing.start(f'{request.method} {request.path}', request.META.get('HTTP_TRACEPARENT'),
+                             service=SERVICE)
+        token = tracing.activate(span)
+        try:
+            response = self.get_response(request)
+            span.set(status=response.status_code)
+            if span.sampled:
+                response['X-Trace-Id'] = span.trace_id
+            return response
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            tracing.deactivate(token)
+            # Шаблон маршрута вместо пути: трассы одного view группируются в списке
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.route:
+                span.name = f'{request.method} /{match.route}'
+                span.set(path=request.path)
+            span.end()
+
+
+def client_span(name, **attrs):
+    """Спан вызова FastAPI (дочерний к спану запроса); его traceparent передаётся в заголовке"""
+    return tracing.span(name, service=SERVICE, **attrs)
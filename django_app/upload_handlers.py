@@ -0,0 +1,145 @@
+"""Потоковая передача загружаемых файлов из Django в FastAPI.
+
+Части файла из multipart-потока сразу уходят в FastAPI (PUT /upload_doc_stream)
+через ограниченную очередь; Django не пишет файл ни в память целиком, ни на диск.
+По ходу считаются sha256 и размер. Поэтому CSRF проверяется до разбора тела
+(UploadCsrfCheck): токен - в строке запроса или заголовке X-CSRFToken.
+"""
+import contextvars
+import hashlib
+import io
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.middleware.csrf import (
+    REASON_CSRF_TOKEN_MISSING, REASON_NO_CSRF_COOKIE, CsrfViewMiddleware, InvalidTokenFormat, RejectRequest,
+    _check_token_format, _does_token_match,
+)
+
+from .http_client import get_client
+
+# Маркер оборванной загрузки: поток к FastAPI прерывается с ошибкой
+_ABORT = object()
+
+
+class UploadCsrfCheck(CsrfViewMiddleware):
+    """Проверка CSRF без чтения тела: иначе файл ушёл бы в FastAPI до отказа.
+
+    Те же проверки Origin/Referer и cookie, что у CsrfViewMiddleware, но токен берётся
+    из строки запроса (csrfmiddlewaretoken) или X-CSRFToken, а не из request.POST.
+    """
+
+    def __init__(self):
+        super().__init__(lambda request: None)
+
+    def check(self, request):
+        """None - запрос можно принимать, иначе ответ 403"""
+        return self.process_view(request, None, (), {})
+
+    def _check_token(self, request):
+        try:
+            csrf_secret = self._get_secret(request)
+        except InvalidTokenFormat as exc:
+            raise RejectRequest(f'CSRF cookie {exc.reason}.')
+        if csrf_secret is None:
+            raise RejectRequest(REASON_NO_CSRF_COOKIE)
+
+        token = request.GET.get('csrfmiddlewaretoken') or request.META.get(settings.CSRF_HEADER_NAME)
+        if not token:
+            raise RejectRequest(REASON_CSRF_TOKEN_MISSING)
+        try:
+            _check_token_format(token)
+        except InvalidTokenFormat as exc:
+            raise RejectRequest(f'CSRF token {exc.reason}.')
+        if not _does_token_match(token, csrf_secret):
+            raise RejectRequest('CSRF token incorrect.')
+
+
+class StreamedUploadedFile(UploadedFile):
+    """Файл, уже переданный в FastAPI: хранит только результат передачи"""
+
+    def __init__(self, name, content_type, size, charset, file_hash, response, error):
+        super().__init__(io.BytesIO(), name, content_type, size, charset)
+        self.file_hash = file_hash
+        self.fastapi_response = response
+        self.fastapi_error = error
+
+
+class FastAPIStreamingUploadHandler(FileUploadHandler):
+    chunk_size = 256 * 1024
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        # Ограниченная очередь: если FastAPI читает медленнее, чтение запроса притормаживает
+        self.chunks = queue.Queue(maxsize=settings.UPLOAD_STREAM_QUEUE_CHUNKS)
+        self.response = None
+        self.error = None
+        # Контекст запроса (текущий спан трассы) - в поток передачи: вызов FastAPI войдёт в трассу
+        self.sender = threading.Thread(target=contextvars.copy_context().run, args=(self._send,), daemon=True)
+        self.sender.start()
+        raise StopFutureHandlers()
+
+    def _body(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            if chunk is _ABORT:
+                raise IOError('Загрузка прервана клиентом')
+            yield chunk
+
+    def _send(self):
+        try:
+            self.response = get_client().put(
+                "/upload_doc_stream",
+                params={'filename': self.file_name},
+                data=self._body(),
+                headers={'Content-Type': self.content_type or 'application/octet-stream'},
+                retry=False,
+            )
+        except Exception as e:
+            self.error = e
+            # Разблокируем чтение запроса: дальнейшие части просто отбрасываются
+            while True:
+                try:
+                    self.chunks.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _put(self, chunk):
+        while self.sender.is_alive():
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.size += len(raw_data)
+        self._put(raw_data)
+        # Остальным обработчикам часть не передаём
+        return None
+
+    def file_complete(self, file_size):
+        self._put(None)
+        self.sender.join()
+        return StreamedUploadedFile(
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            file_hash=self.hasher.hexdigest(),
+            response=self.response,
+            error=self.error,
+        )
+
+    def upload_interrupted(self):
+        # Клиент оборвал загрузку - обрываем и поток к FastAPI, чтобы не сохранить обрезанный файл
+        self._put(_ABORT)
+        self.sender.join()
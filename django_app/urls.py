@@ -15,4 +15,5 @@ urlpatterns = [
     path('cart/', views.cart, name='cart'),
     path('cart/add/<int:doc_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/pay/', views.pay_cart, name='pay_cart'),
+    path('fastapi_stats/', views.fastapi_client_stats, name='fastapi_stats'),
 ]
\ No newline at end of file
@@ -1,18 +1,23 @@
+import hashlib
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
-from django.contrib.auth.decorators import login_required   # ← правильный импорт
+from django.contrib.auth.decorators import login_required, user_passes_test   # ← правильный импорт
 from django.contrib.auth.forms import UserCreationForm
-from django.core.files.storage import FileSystemStorage
 from django.conf import settings
-from .models import Docs, Price, Cart
+from django.db.models import Sum
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from .models import Docs, Cart
+from . import docs_cache, prices
 from .services import FastAPIService
-import requests
+from .http_client import get_client
+from .upload_handlers import FastAPIStreamingUploadHandler, UploadCsrfCheck
 
 def calculate_price(file_type, size_kb):
-    """Цена = размер_в_КБ * цена_за_КБ"""
-    price_obj = Price.objects.filter(file_type=file_type.lower()).first()
-    return price_obj.price * size_kb if price_obj else 0.0
+    """Цена = размер_в_КБ * цена_за_КБ (цены - из кэша процесса, без запроса к БД)"""
+    price = prices.price_per_kb(file_type)
+    return price * size_kb if price is not None else 0.0
 
 @login_required
 def add_to_cart(request, doc_id):
@@ -33,14 +38,53 @@ def pay_cart(request):
 
 @login_required
 def cart(request):
-    items = Cart.objects.filter(user=request.user, payment=False)
-    total = sum(item.order_price for item in items)
+    # Два запроса при любом размере корзины: позиции с документами (JOIN) и сумма в БД
+    items = Cart.objects.filter(user=request.user, payment=False).select_related('docs')
+    total = items.aggregate(total=Sum('order_price'))['total'] or 0
     return render(request, 'cart.html', {'items': items, 'total': total})
 
 
+def _docs_page(before):
+    # Keyset по id (новые первыми): лишняя строка показывает, есть ли следующая страница
+    query = Docs.objects.order_by('-id')
+    if before is not None:
+        query = query.filter(id__lt=before)
+    docs = list(query[:settings.DOCS_PAGE_SIZE + 1])
+    next_cursor = docs[settings.DOCS_PAGE_SIZE - 1].id if len(docs) > settings.DOCS_PAGE_SIZE else None
+    return {'docs': docs[:settings.DOCS_PAGE_SIZE], 'next_cursor': next_cursor}
+
+
 def docs_list(request):
-    docs = Docs.objects.all().order_by('-id')
-    return render(request, 'docs_list.html', {'docs': docs})
+    """Список документов постранично (курсор before - id последнего документа предыдущей страницы).
+
+    На страницу: не больше одного запроса к БД (строки кэшируются до загрузки
+    или удаления документа) и один запрос состояния OCR в FastAPI.
+    """
+    try:
+        before = int(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        before = None
+    page = docs_cache.get_page(before, lambda: _docs_page(before))
+    tasks = FastAPIService.task_statuses([doc.fastapi_id for doc in page['docs']])
+    for doc in page['docs']:
+        task = tasks.get(doc.fastapi_id) or {}
+        doc.ocr_state = task.get('state')
+        doc.ocr_status = ANALYSIS_STATUS.get(task.get('state'), 'Не анализировался' if tasks else '')
+        progress = task.get('progress')
+        doc.ocr_percent = round(progress['fraction'] * 100) if progress and task.get('state') == 'running' else None
+    # Фрагмент перерисовывается, только если изменились документы или показанные состояния:
+    # в ключе текст статуса, пустой при недоступном FastAPI, - такая страница не переживёт восстановления
+    fragment_key = hashlib.sha1(
+        repr([(doc.id, doc.ocr_status, doc.ocr_percent) for doc in page['docs']]).encode()
+    ).hexdigest()
+    return render(request, 'docs_list.html', {
+        'docs': page['docs'],
+        'next_cursor': page['next_cursor'],
+        'before': before,
+        'fragment_key': fragment_key,
+        'cache_version': docs_cache.version(),
+        'cache_ttl': settings.DOCS_LIST_CACHE_TTL,
+    })
 
 
 def register(request):
@@ -56,45 +100,76 @@ def register(request):
 
 
 @login_required
+@csrf_exempt
 def upload_file(request):
+    # Обработчик загрузки нужно заменить до разбора тела, поэтому CSRF проверяется здесь,
+    # по токену из строки запроса или заголовка, - до того как файл начнёт уходить в FastAPI
+    if request.method == 'POST':
+        rejected = UploadCsrfCheck().check(request)
+        if rejected is not None:
+            return rejected
+        request.upload_handlers = [FastAPIStreamingUploadHandler(request)]
+    return _upload_file(request)
+
+
+def _upload_file(request):
     if request.method == 'POST' and request.FILES.get('file'):
         uploaded_file = request.FILES['file']
-        fs = FileSystemStorage()
-        filename = fs.save(uploaded_file.name, uploaded_file)
-
-        file_full_path = fs.path(filename)
+        fastapi_doc_id = None
         try:
-            with open(file_full_path, 'rb') as f:
-                files = {'file': (uploaded_file.name, f, uploaded_file.content_type)}
-                response = requests.post(
-                    f"{settings.FASTAPI_URL}/upload_doc",
-                    files=files,
-                    timeout=30
-                )
-            if response.status_code == 200:
-                fastapi_doc_id = response.json()['doc_id']
-                Docs.objects.create(
-                    file_path=fs.url(filename),
-                    size=uploaded_file.size / 1024,
-                    fastapi_id=fastapi_doc_id
-                )
-            else:
+            if uploaded_file.fastapi_error is not None:
+                raise uploaded_file.fastapi_error
+            response = uploaded_file.fastapi_response
+            if response.status_code != 200:
                 raise ValueError(response.text)
+
+            result = response.json()
+            fastapi_doc_id = result['doc_id']
+            if result['file_hash'] != uploaded_file.file_hash or result['size'] != uploaded_file.size:
+                raise ValueError('Файл повреждён при передаче в FastAPI')
+
+            # Django хранит только ссылку на файл в FastAPI
+            Docs.objects.create(
+                file_path=f"{settings.FASTAPI_PUBLIC_URL}/download_doc?doc_id={fastapi_doc_id}",
+                size=uploaded_file.size / 1024,
+                fastapi_id=fastapi_doc_id,
+                file_hash=uploaded_file.file_hash
+            )
         except Exception as e:
-            fs.delete(filename)
+            if fastapi_doc_id is not None:
+                FastAPIService.delete_document(fastapi_doc_id)
             return render(request, 'error.html', {'error': str(e)})
 
     return redirect('docs_list')
 
 
+ANALYSIS_STATUS = {
+    'queued': 'В очереди',
+    'running': 'Выполняется',
+    'done': 'Анализ завершён',
+    'failed': 'Ошибка анализа',
+}
+
+
 @login_required
 def analyze_document(request, doc_id):
     doc = get_object_or_404(Docs, id=doc_id)
-    FastAPIService.analyze_document(doc.fastapi_id)
-    text_result = FastAPIService.get_text(doc.fastapi_id)
+    FastAPIService.analyze_document(doc.fastapi_id, request.user.username)
+    # Ждём ровно до завершения задачи, а не фиксированное время
+    task = FastAPIService.wait_for_task(doc.fastapi_id, settings.FASTAPI_ANALYZE_WAIT)
+    if task['state'] in ('done', 'queued', 'running'):
+        # Пока многостраничный документ распознаётся, FastAPI отдаёт текст готовых страниц
+        text_result = FastAPIService.get_text(doc.fastapi_id)
+    else:
+        text_result = {'text': '', 'error': task.get('error')}
+    progress = task.get('progress') if task['state'] != 'done' else None
     return render(request, 'analysis_result.html', {
         'doc': doc,
+        'status': ANALYSIS_STATUS.get(task['state'], task['state']),
         'text': text_result.get('text', ''),
+        'partial': text_result.get('partial', False),
+        'progress_percent': round(progress['fraction'] * 100) if progress else None,
+        'progress': progress,
         'error': text_result.get('error')
     })
 
@@ -112,3 +187,8 @@ def profile(request):
     """Страница профиля"""
     return render(request, 'profile.html')
 
+
+@user_passes_test(lambda user: user.is_staff)
+def fastapi_client_stats(request):
+    """Метрики HTTP-клиента FastAPI: пул соединений, задержки, состояние circuit breaker"""
+    return JsonResponse(get_client().stats())
@@ -0,0 +1,18 @@
+"""Окружение тестов FastAPI: настройки читаются при импорте app, поэтому
+каталоги задаются здесь, до первого импорта. Postgres и брокер не нужны -
+тесты проверяют чистые функции, SQL запросов и маршруты с подменённой сессией БД
+(простые UPDATE - на SQLite в памяти).
+
+Запуск из корня репозитория:
+    pip install -r requirements-fastapi.txt -r requirements-test.txt
+    python -m pytest tests
+"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="goods-tests-")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+for name, sub in (("DOCUMENTS_DIR", "documents"), ("PREVIEW_CACHE_DIR", "previews"),
+                  ("WORKER_METRICS_DIR", "metrics"), ("TRACE_DIR", "traces")):
+    os.environ[name] = os.path.join(_workdir, sub)
@@ -0,0 +1,25 @@
+from app.admission import decoded_pixels, estimate_mb
+
+
+def test_full_scale_decodes_whole_page():
+    assert decoded_pixels(4000, 3000, 1.0, "PNG") == 12_000_000
+
+
+def test_non_draftable_formats_decode_at_full_size():
+    assert decoded_pixels(4000, 3000, 0.25, "PNG") == 12_000_000
+    assert decoded_pixels(4000, 3000, 0.25, "TIFF") == 12_000_000
+
+
+def test_pdf_renders_at_target_size():
+    assert decoded_pixels(4000, 3000, 0.5, "PDF") == 2000 * 1500
+
+
+def test_jpeg_draft_reduces_by_power_of_two_not_below_target():
+    # 0.3 -> 1200x900: draft берёт 1/2 (2000x1500), 1/4 уже меньше цели
+    assert decoded_pixels(4000, 3000, 0.3, "JPEG") == 2000 * 1500
+    assert decoded_pixels(4000, 3000, 0.125, "JPEG") == 500 * 375
+
+
+def test_estimate_counts_full_decode():
+    scaled = estimate_mb(1000, 750, 1, 0, ["grayscale"])
+    assert estimate_mb(1000, 750, 1, 0, ["grayscale"], decoded=4000 * 3000) > scaled
@@ -0,0 +1,17 @@
+from benchmarks.bench_pipeline import METRICS, compare
+
+
+def test_missing_metric_is_not_compared(capsys):
+    # Прогон без распознанных документов: задержек анализа нет
+    metrics = dict.fromkeys(METRICS, 1.0)
+    metrics["analyze_p95_ms"] = None
+    assert compare(metrics, dict.fromkeys(METRICS, 1.0), 0.1) == []
+    assert "n/a" in capsys.readouterr().out
+
+
+def test_regression_respects_direction():
+    higher_better = next(name for name, better in METRICS.items() if better)
+    lower_better = next(name for name, better in METRICS.items() if not better)
+    baseline = dict.fromkeys(METRICS, 100.0)
+    current = dict(baseline, **{higher_better: 80.0, lower_better: 80.0})
+    assert compare(current, baseline, 0.1) == [higher_better]
@@ -0,0 +1,92 @@
+"""/download_doc через всё приложение (вместе с middleware сжатия)"""
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import storage
+from app.main import app
+from app.routers import document_routes
+
+DATA = bytes(range(256)) * 64  # 16 КБ - больше порога сжатия
+
+
+class _Query:
+    def __init__(self, result):
+        self.result = result
+
+    def filter(self, *args):
+        return self
+
+    def first(self):
+        return self.result
+
+
+class _Session:
+    def __init__(self, doc):
+        self.doc = doc
+
+    def query(self, model):
+        return _Query(self.doc)
+
+
+@pytest.fixture
+def client():
+    file_hash = hashlib.sha256(DATA).hexdigest()
+    key = storage.key_for(file_hash)
+    path = storage.path_for_key(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(DATA)
+    doc = SimpleNamespace(id=1, filename="scan.txt", storage_key=key, file_hash=file_hash)
+    app.dependency_overrides[document_routes.get_db] = lambda: _Session(doc)
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_range_is_not_compressed(client):
+    response = client.get("/download_doc", params={"doc_id": 1},
+                          headers={"Range": "bytes=100-4195", "Accept-Encoding": "br, gzip"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-range"] == f"bytes 100-4195/{len(DATA)}"
+    assert response.content == DATA[100:4196]
+
+
+def test_full_download_is_not_compressed(client):
+    response = client.get("/download_doc", params={"doc_id": 1}, headers={"Accept-Encoding": "br, gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content == DATA
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/download_doc", params={"doc_id": 1}, headers={"Range": f"bytes={len(DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_if_range_with_current_etag(client):
+    etag = client.get("/download_doc", params={"doc_id": 1}).headers["etag"]
+    response = client.get("/download_doc", params={"doc_id": 1},
+                          headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+
+
+def test_if_range_with_stale_etag_returns_whole_file(client):
+    response = client.get("/download_doc", params={"doc_id": 1},
+                          headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_none_match(client):
+    etag = client.get("/download_doc", params={"doc_id": 1}).headers["etag"]
+    response = client.get("/download_doc", params={"doc_id": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
@@ -0,0 +1,32 @@
+import pytest
+
+from app.file_response import content_disposition, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    (" bytes=1-1 ", (1, 1)),
+    # Несколько диапазонов и чужие единицы - отдаётся весь файл
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1001", "bytes=5-4", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_content_disposition():
+    assert content_disposition("scan.png") == 'attachment; filename="scan.png"'
+    assert content_disposition("скан.png") == "attachment; filename*=utf-8''%D1%81%D0%BA%D0%B0%D0%BD.png"
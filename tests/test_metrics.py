@@ -0,0 +1,51 @@
+from app import metrics
+
+
+def _snapshot(counter, histogram_counts, histogram_sum):
+    return {"metrics": {
+        "jobs_total": {"type": "counter", "help": "Задачи", "labels": ["lane"],
+                       "series": [[["bulk"], counter], [["interactive"], 0.0]]},
+        "job_seconds": {"type": "histogram", "help": "Время", "labels": ["stage"], "buckets": [0.1, 1.0],
+                        "series": [[["ocr"], [histogram_counts, histogram_sum]]]},
+    }}
+
+
+def test_merge_sums_processes():
+    merged = metrics._merge([_snapshot(2.0, [1, 0, 1], 5.05), _snapshot(3.0, [0, 2, 0], 1.0)])
+    assert merged["jobs_total"]["series"][("bulk",)] == 5.0
+    assert merged["job_seconds"]["series"][("ocr",)] == ([1, 2, 1], 6.05)
+
+
+def test_render_cumulative_buckets_and_skips_empty_series():
+    merged = metrics._merge([_snapshot(2.0, [1, 2, 1], 6.0)])
+    lines = []
+    for name, metric in merged.items():
+        metrics._render_metric(lines, name, metric)
+    assert lines == [
+        "# HELP jobs_total Задачи",
+        "# TYPE jobs_total counter",
+        'jobs_total{lane="bulk"} 2.0',
+        "# HELP job_seconds Время",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{stage="ocr",le="0.1"} 1',
+        'job_seconds_bucket{stage="ocr",le="1.0"} 3',
+        'job_seconds_bucket{stage="ocr",le="+Inf"} 4',
+        'job_seconds_sum{stage="ocr"} 6.0',
+        'job_seconds_count{stage="ocr"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    assert metrics._labels(["route"], ['/a"b\\c\n']) == '{route="/a\\"b\\\\c\\n"}'
+
+
+def test_series_observe_and_snapshot():
+    histogram = metrics.Histogram("test_seconds", "Тест", ["stage"], buckets=(1, 2))
+    try:
+        series = histogram.labels("x")
+        assert histogram.labels("x") is series
+        for value in (0.5, 1.5, 5):
+            series.observe(value)
+        assert histogram.snapshot()["series"] == [[["x"], [[1, 1, 1], 7.0]]]
+    finally:
+        metrics.REGISTRY.remove(histogram)
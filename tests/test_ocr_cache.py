@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app import ocr_cache, text_codec
+from app.config import settings
+
+TEXT = "Распознанный текст страницы. " * 200
+
+
+class _Recorder:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+
+
+def test_store_compresses_like_document_texts(monkeypatch):
+    monkeypatch.setattr(settings, "text_compression", True)
+    monkeypatch.setattr(settings, "text_zstd_dict_id", None)
+    monkeypatch.setattr(ocr_cache, "evict", lambda db: 0)
+    db = _Recorder()
+    ocr_cache.store(db, "0" * 64, "eng+rus", "cfg", TEXT)
+
+    compiled = db.statements[0].compile(dialect=postgresql.dialect())
+    assert compiled.params["text"] is None
+    assert text_codec.decode(compiled.params["text_zstd"], None) == TEXT
+    # При повторной записи заменяется и сжатый текст
+    assert "text_zstd =" in str(compiled).split("DO UPDATE")[1]
+
+
+def test_lookup_decodes_compressed_entry():
+    entry = SimpleNamespace(text=None, text_zstd=text_codec.compress(TEXT, None), text_dict_id=None)
+
+    class _Query:
+        def filter(self, *args):
+            return self
+
+        def first(self):
+            return entry
+
+    db = SimpleNamespace(query=lambda model: _Query())
+    assert ocr_cache.lookup(db, "0" * 64, "eng+rus", "cfg") == TEXT
@@ -0,0 +1,101 @@
+"""Подзадачи страниц при повторной доставке (acks_late)"""
+from types import SimpleNamespace
+
+import pytest
+
+from app import celery_worker, task_state, word_store
+
+DOC = SimpleNamespace(id=1, page_count=2, file_hash="0" * 64, storage_key=None, filename="scan.pdf")
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class _Query:
+    def __init__(self, result):
+        self.result = result
+
+    def filter(self, *args):
+        return self
+
+    def first(self):
+        return self.result
+
+
+class _Session:
+    """Строки document_pages живут между сессиями, как в БД"""
+
+    pages = {}
+
+    def query(self, model):
+        if model is celery_worker.Document:
+            return _Query(DOC)
+        # _page_saved - есть ли уже записанная страница
+        return _Query((1,) if self.pages else None)
+
+    def execute(self, stmt):
+        params = stmt.compile().params
+        key = (params["doc_id"], params["page_no"])
+        if key in self.pages:
+            return _Result(None)
+        self.pages[key] = params["text"]
+        return _Result(len(self.pages))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    _Session.pages = {}
+    calls = {"ocr": 0, "page_done": 0, "finished": []}
+
+    def recognize(file_path, page_no, steps):
+        calls["ocr"] += 1
+        return "текст", {}, None
+
+    def page_done(db, doc_id, task_id):
+        calls["page_done"] += 1
+
+    monkeypatch.setattr(celery_worker, "SessionLocal", _Session)
+    monkeypatch.setattr(celery_worker, "_recognize_page", recognize)
+    monkeypatch.setattr(celery_worker, "_merge_pages", lambda *args: False)
+    monkeypatch.setattr(celery_worker, "_finish", lambda db, doc_id, success, *args, **kwargs:
+                        calls["finished"].append(success))
+    monkeypatch.setattr(task_state, "is_active", lambda *args, **kwargs: True)
+    monkeypatch.setattr(task_state, "page_done", page_done)
+    monkeypatch.setattr(word_store, "save_page", lambda *args: None)
+    return calls
+
+
+def test_redelivered_page_is_not_recognized_again(worker):
+    first = celery_worker.ocr_page_task.run(1, 0, "", "task")
+    second = celery_worker.ocr_page_task.run(1, 0, "", "task")
+    assert (first["status"], second["status"]) == ("success", "duplicate")
+    assert worker == {"ocr": 1, "page_done": 1, "finished": []}
+
+
+def test_concurrent_delivery_counts_page_once(worker, monkeypatch):
+    # Обе доставки прошли проверку до записи: вторая вставка упирается в уникальный ключ
+    monkeypatch.setattr(celery_worker, "_page_saved", lambda *args: False)
+    for _ in range(2):
+        assert celery_worker.ocr_page_task.run(1, 0, "", "task")["status"] == "success"
+    assert worker == {"ocr": 2, "page_done": 1, "finished": []}
+
+
+def test_pages_of_failed_run_are_skipped(worker, monkeypatch):
+    # Другая страница упала и пометила запуск failed
+    monkeypatch.setattr(task_state, "is_active", lambda *args, **kwargs: False)
+    assert celery_worker.ocr_page_task.run(1, 1, "", "task")["status"] == "superseded"
+    assert worker["ocr"] == 0
@@ -0,0 +1,24 @@
+import pytest
+
+from app.config import settings
+from app.preprocessing import STEPS, parse_steps
+
+
+def test_default_steps_from_settings():
+    assert parse_steps(None) == parse_steps(settings.ocr_preprocess_steps)
+
+
+def test_steps_in_canonical_order():
+    assert parse_steps("crop, grayscale,deskew") == ("grayscale", "deskew", "crop")
+    assert parse_steps(["binarize", "downscale"]) == ("downscale", "binarize")
+    assert parse_steps(",".join(reversed(STEPS))) == STEPS
+
+
+def test_empty_string_disables_preprocessing():
+    assert parse_steps("") == ()
+    assert parse_steps(" , ") == ()
+
+
+def test_unknown_step():
+    with pytest.raises(ValueError, match="sharpen"):
+        parse_steps("grayscale,sharpen")
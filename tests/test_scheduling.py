@@ -0,0 +1,48 @@
+from app import scheduling
+from app.models import Document
+from app.scheduling import BULK, INTERACTIVE, LARGE_BYTES, LARGE_PIXELS, LANE_PRIORITIES, priority
+
+SMALL = {"bytes": 10_000, "pixels": 1_000_000}
+LARGE = {"bytes": LARGE_BYTES * 2, "pixels": LARGE_PIXELS * 2}
+
+
+def test_lanes_do_not_overlap():
+    # Самый большой интерактивный документ впереди самого маленького пакетного
+    assert priority(INTERACTIVE, LARGE, backlog=1000, fair_share=1) > priority(BULK, SMALL)
+    for lane, (low, high) in LANE_PRIORITIES.items():
+        for cost in (None, SMALL, LARGE):
+            assert low <= priority(lane, cost, backlog=50, fair_share=3) <= high
+
+
+def test_smaller_documents_first():
+    assert priority(INTERACTIVE, SMALL) == LANE_PRIORITIES[INTERACTIVE][1]
+    assert priority(INTERACTIVE, LARGE) == LANE_PRIORITIES[INTERACTIVE][0]
+    assert priority(BULK, SMALL) > priority(BULK, {"bytes": 0, "pixels": LARGE_PIXELS // 2})
+
+
+def test_without_pixels_uses_file_size():
+    assert priority(BULK, {"bytes": LARGE_BYTES, "pixels": None}) == LANE_PRIORITIES[BULK][0]
+    assert priority(BULK, {"bytes": 0, "pixels": None}) == LANE_PRIORITIES[BULK][1]
+
+
+def test_unknown_cost_is_middle_of_lane():
+    low, high = LANE_PRIORITIES[INTERACTIVE]
+    assert priority(INTERACTIVE, None) == (low + high) // 2
+
+
+def test_fair_share_lowers_priority_down_to_lane_floor():
+    base = priority(INTERACTIVE, SMALL)
+    assert priority(INTERACTIVE, SMALL, backlog=9, fair_share=10) == base
+    assert priority(INTERACTIVE, SMALL, backlog=10, fair_share=10) == base - 1
+    assert priority(INTERACTIVE, SMALL, backlog=10_000, fair_share=10) == LANE_PRIORITIES[INTERACTIVE][0]
+
+
+def test_max_priority_covers_lanes():
+    assert max(high for _, high in LANE_PRIORITIES.values()) <= scheduling.MAX_PRIORITY
+
+
+def test_stored_cost_from_document_row():
+    assert scheduling.stored_cost(Document(file_size=1024, pixels=None)) == {"bytes": 1024, "pixels": None}
+    assert scheduling.stored_cost(Document(file_size=1024, pixels=4096)) == {"bytes": 1024, "pixels": 4096}
+    # Документ, загруженный до сохранения оценки
+    assert scheduling.stored_cost(Document()) is None
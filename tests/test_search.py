@@ -0,0 +1,20 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+
+from app import search
+from app.models import DocumentText
+
+
+def test_vector_binds_text_once():
+    text = "Распознанный текст документа"
+    stmt = insert(DocumentText).values(doc_id=1, search_vector=search.to_vector(text))
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    name, = [name for name, value in compiled.params.items() if value == text]
+    # psycopg2 подставляет параметры на клиенте: каждое вхождение - копия текста в запросе
+    assert str(compiled).count(f"%({name})s") == 1
+
+
+def test_vector_indexes_only_the_start_of_long_texts(monkeypatch):
+    monkeypatch.setattr(search.settings, "search_max_chars", 5)
+    compiled = search.to_vector("abcdefgh").compile(dialect=postgresql.dialect())
+    assert "abcde" in compiled.params.values()
@@ -0,0 +1,15 @@
+"""/task_events через всё приложение: события не копятся в буфере сжатия"""
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import document_routes
+
+
+def test_events_are_not_compressed(monkeypatch):
+    # Событие больше порога сжатия
+    state = {"doc_id": 1, "state": "done", "progress": None, "error": "x" * 2048}
+    monkeypatch.setattr(document_routes, "_load_task_state", lambda doc_id: state)
+    response = TestClient(app).get("/task_events", params={"doc_id": 1}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.text.startswith("event: state\n")
@@ -0,0 +1,113 @@
+"""Объединение запусков (claim) и запись итога только актуальным запуском"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app import task_state
+from app.models import DocumentTask
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class _Recorder:
+    """Сессия, которая запоминает запросы и возвращает заданные строки"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        return _Result(self.rows)
+
+
+def _sql(stmt):
+    return str(stmt.compile(dialect=postgresql.dialect()))
+
+
+def test_claim_restarts_only_finished_or_reconfigured_tasks():
+    db = _Recorder(rows=[(1, "a" * 32)])
+    claimed = task_state.claim(db, [1, 2], "cfg", "bulk", "alice", {1: 3, 2: 4})
+
+    # Документ 2 уже в работе с тем же конфигом - ON CONFLICT ... WHERE не вернул его строку
+    assert claimed == {1: "a" * 32}
+    sql = _sql(db.statements[0])
+    assert "ON CONFLICT (doc_id) DO UPDATE" in sql
+    assert "WHERE document_tasks.state IN (__[POSTCOMPILE_state_1])" in sql
+    assert "document_tasks.config IS DISTINCT FROM excluded.config" in sql
+    assert "document_tasks.started_at <" not in sql
+    assert "RETURNING document_tasks.doc_id, document_tasks.task_id" in sql
+
+
+def test_claim_rows_get_own_task_ids_and_priorities():
+    db = _Recorder()
+    task_state.claim(db, [1, 2], "cfg", "bulk", "alice", {1: 3, 2: 4})
+    params = db.statements[0].compile(dialect=postgresql.dialect()).params
+    assert params["task_id_m0"] != params["task_id_m1"]
+    assert (params["priority_m0"], params["priority_m1"]) == (3, 4)
+    assert params["state_m0"] == task_state.QUEUED
+
+
+def test_claim_takes_over_stale_running_task():
+    db = _Recorder()
+    task_state.claim(db, [1], "cfg", stale_after=3600)
+    sql = _sql(db.statements[0])
+    assert "document_tasks.state = %(state_2)s AND document_tasks.started_at < %(started_at_1)s" in sql
+
+
+def test_claim_without_documents_does_not_query():
+    db = _Recorder()
+    assert task_state.claim(db, [], "cfg") == {}
+    assert db.statements == []
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    DocumentTask.__table__.create(engine)
+    with Session(engine) as session:
+        session.add(DocumentTask(doc_id=1, state=task_state.RUNNING, task_id="new", started_at=datetime.utcnow()))
+        session.commit()
+        yield session
+
+
+def _task(db):
+    db.expire_all()
+    return db.get(DocumentTask, 1)
+
+
+def test_mark_finished_by_current_run(db):
+    assert task_state.mark_finished(db, 1, False, "ошибка", task_id="new")
+    task = _task(db)
+    assert (task.state, task.error) == (task_state.FAILED, "ошибка")
+    assert task.finished_at is not None
+
+
+def test_superseded_run_does_not_overwrite_result(db):
+    assert not task_state.mark_finished(db, 1, True, task_id="old")
+    assert not task_state.mark_deferred(db, 1, task_id="old")
+    assert _task(db).state == task_state.RUNNING
+
+
+def test_is_current(db):
+    assert task_state.is_current(db, 1, "new")
+    assert not task_state.is_current(db, 1, "old")
+    # Задачи, отправленные без task_id, не сверяются
+    assert task_state.is_current(db, 1, None)
+
+
+def test_is_active_stops_after_run_finished(db):
+    assert task_state.is_active(db, 1, "new", lock=True)
+    assert not task_state.is_active(db, 1, "old")
+    task_state.mark_finished(db, 1, False, "ошибка страницы", task_id="new")
+    assert not task_state.is_active(db, 1, "new")
+    assert not task_state.is_active(db, 2, "new")
@@ -0,0 +1,41 @@
+import pytest
+
+from app import text_codec
+from app.config import settings
+
+TEXT = "Договор поставки № 17. Invoice total: 1 250,00 руб.\n" * 200
+
+
+def test_compress_round_trip():
+    data = text_codec.compress(TEXT, None, 3)
+    assert len(data) < len(TEXT.encode("utf-8"))
+    assert text_codec.decode(data, None) == TEXT
+    assert text_codec.decoded_size(data) == len(TEXT.encode("utf-8"))
+
+
+def test_encode_short_text_stays_plain(monkeypatch):
+    monkeypatch.setattr(settings, "text_compression", True)
+    assert text_codec.encode("коротко") == {"text": "коротко", "text_zstd": None, "text_dict_id": None}
+
+
+def test_encode_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "text_compression", False)
+    assert text_codec.encode(TEXT)["text"] == TEXT
+
+
+def test_encode_and_text_of(monkeypatch):
+    monkeypatch.setattr(settings, "text_compression", True)
+    monkeypatch.setattr(settings, "text_zstd_dict_id", None)
+    values = text_codec.encode(TEXT)
+    assert values["text"] is None and values["text_zstd"]
+    row = type("Row", (), values)
+    assert text_codec.text_of(row) == TEXT
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 4096])
+def test_streaming_decoder_keeps_utf8_intact(chunk):
+    data = text_codec.compress(TEXT, None, 3)
+    decoder = text_codec.Decoder(None)
+    parts = [decoder.feed(data[i:i + chunk]) for i in range(0, len(data), chunk)]
+    parts.append(decoder.flush())
+    assert "".join(parts) == TEXT
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.word_store import INT16_MAX, PageWords
+
+
+def _page():
+    return PageWords.from_lists(
+        words=["Счёт", "№", "42", "итого", "100"],
+        boxes=[(10, 10, 60, 30), (70, 10, 80, 30), (90, 10, 120, 30), (10, 50, 70, 70), (200, 50, 260, 70)],
+        conf=[95.6, 40.2, 88, 12, 99.9],
+        lines=[0, 0, 0, 1, 1],
+        blocks=[0, 0, 0, 0, 1],
+        width=300,
+        height=100,
+    )
+
+
+def test_from_lists_packs_and_clips():
+    page = PageWords.from_lists(["a"], [(-5, 0, 70000, 10)], [120.4], [0], [0], 10, 10)
+    assert page.boxes.dtype == np.int16
+    assert page.boxes.tolist() == [[0, 0, INT16_MAX, 10]]
+    assert page.conf.tolist() == [100]
+
+
+def test_pack_unpack_round_trip():
+    page = _page()
+    restored = PageWords.unpack(SimpleNamespace(**page.pack()))
+    assert restored.words == page.words
+    assert restored.boxes.tolist() == page.boxes.tolist()
+    assert restored.conf.tolist() == [96, 40, 88, 12, 100]
+    assert restored.lines.tolist() == page.lines.tolist()
+    assert restored.blocks.tolist() == page.blocks.tolist()
+    assert (restored.width, restored.height) == (300, 100)
+
+
+def test_unpack_empty_page():
+    page = PageWords.unpack(SimpleNamespace(**PageWords.from_lists([], [], [], [], [], 5, 5).pack()))
+    assert len(page) == 0
+    assert page.select().tolist() == []
+
+
+def test_select_inside_and_overlapping_bbox():
+    page = _page()
+    assert page.select(bbox=(0, 0, 85, 35)).tolist() == [0, 1]
+    # Пересечение: слово "42" (90..120) задето областью до x=100
+    assert page.select(bbox=(0, 0, 100, 35), inside=False).tolist() == [0, 1, 2]
+    assert page.select(bbox=(0, 40, 300, 100)).tolist() == [3, 4]
+
+
+def test_select_by_confidence():
+    page = _page()
+    assert page.select(min_conf=50).tolist() == [0, 2, 4]
+    assert page.select(max_conf=50).tolist() == [1, 3]
+    assert page.select(bbox=(0, 0, 300, 35), min_conf=90).tolist() == [0]
+
+
+def test_text_groups_words_by_line():
+    page = _page()
+    assert page.text(page.select()) == "Счёт № 42\nитого 100"
+    assert page.to_dicts(np.array([2])) == [{"word": "42", "bbox": [90, 10, 120, 30], "conf": 88, "line": 0, "block": 0}]